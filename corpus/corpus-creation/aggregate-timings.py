@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# Description:
+#   Summarize where the time went in a corpus run of extract-regexes.py.
+#   Reads the per-project stage timings it writes (--timings-file),
+#   and reports per-stage p50/p95/p99 wall and CPU time across the projects.
+
+# Import libLF
+import os
+import sys
+sys.path.append('{}/lib'.format(os.environ['REGEX_GENERALIZABILITY_PROJECT_ROOT']))
+import libLF
+
+import argparse
+import collections
+import json
+
+################
+# Globals
+
+PERCENTILES = [50, 95, 99]
+
+################
+
+def loadStages(timingsFiles):
+  """Returns { stage: { 'wallSec': [...], 'cpuSec': [...], 'nFailed': int } } across the projects
+
+  A stage that ran several times in one project counts once, with its total time.
+  """
+  stage2times = collections.defaultdict(lambda: { 'wallSec': [], 'cpuSec': [], 'nFailed': 0 })
+  nProjects = 0
+  for timingsFile in timingsFiles:
+    with open(timingsFile, 'r') as inStream:
+      for line in inStream:
+        line = line.strip()
+        if len(line) == 0:
+          continue
+        try:
+          obj = libLF.fromNDJSON(line)
+          stages = obj['stages']
+        except (ValueError, KeyError) as err:
+          libLF.log('Skipping malformed line in {}: {}'.format(timingsFile, err))
+          continue
+        nProjects += 1
+
+        projectStage2totals = collections.OrderedDict()
+        for s in stages:
+          totals = projectStage2totals.setdefault(s['stage'], { 'wallSec': 0, 'cpuSec': 0, 'ok': True })
+          totals['wallSec'] += s['wallSec']
+          totals['cpuSec'] += s['cpuSec']
+          totals['ok'] = totals['ok'] and s['ok']
+        for stage, totals in projectStage2totals.items():
+          stage2times[stage]['wallSec'].append(totals['wallSec'])
+          stage2times[stage]['cpuSec'].append(totals['cpuSec'])
+          if not totals['ok']:
+            stage2times[stage]['nFailed'] += 1
+  libLF.log('Loaded stage timings for {} projects'.format(nProjects))
+  return stage2times
+
+def summarize(stage2times):
+  """Returns [ { 'stage', 'nProjects', 'nFailed', 'totalWallSec', 'totalCPUSec', 'wallSec': {p: sec}, 'cpuSec': {p: sec} } ], most total wall time first"""
+  summaries = []
+  for stage, times in stage2times.items():
+    summary = { 'stage': stage,
+                'nProjects': len(times['wallSec']),
+                'nFailed': times['nFailed'],
+                'totalWallSec': round(sum(times['wallSec']), 3),
+                'totalCPUSec': round(sum(times['cpuSec']), 3),
+    }
+    for kind in ['wallSec', 'cpuSec']:
+      sortedValues = sorted(times[kind])
+      summary[kind] = { 'p{}'.format(p): round(libLF.percentile(sortedValues, p), 3) for p in PERCENTILES }
+    summaries.append(summary)
+  summaries.sort(key=lambda s: s['totalWallSec'], reverse=True)
+  return summaries
+
+def printTable(summaries):
+  pCols = ['p{}'.format(p) for p in PERCENTILES]
+  header = ['stage', 'n', 'failed', 'totalWall'] + ['wall-' + c for c in pCols] + ['totalCPU'] + ['cpu-' + c for c in pCols]
+  rows = [header]
+  for s in summaries:
+    rows.append([s['stage'], str(s['nProjects']), str(s['nFailed']), '{:.1f}'.format(s['totalWallSec'])] +
+                ['{:.2f}'.format(s['wallSec'][c]) for c in pCols] +
+                ['{:.1f}'.format(s['totalCPUSec'])] +
+                ['{:.2f}'.format(s['cpuSec'][c]) for c in pCols])
+  widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+  for row in rows:
+    print('  '.join(cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths))))
+
+#################################################
+
+def main(timingsFiles, outFile):
+  libLF.log('timingsFiles {} outFile {}'.format(timingsFiles, outFile))
+  summaries = summarize(loadStages(timingsFiles))
+  printTable(summaries)
+
+  if outFile is not None:
+    libLF.log('Writing {} stage summaries to {}'.format(len(summaries), outFile))
+    with open(outFile, 'w') as outStream:
+      for s in summaries:
+        outStream.write(json.dumps(s) + '\n')
+
+###############################################
+
+if __name__ == '__main__':
+  # Parse args
+  parser = argparse.ArgumentParser(description='Summarize per-stage timings of extract-regexes.py runs: p50/p95/p99 wall and CPU time of each stage across projects. Times in seconds. A project that ran a stage several times counts its total.')
+  parser.add_argument('--timings-file', help='NDJSON of per-project stage timings from extract-regexes.py --timings-file. Repeat to combine runs', action='append', required=True, dest='timingsFiles')
+  parser.add_argument('--out-file', '-o', help='Also write the summaries as NDJSON here', required=False, default=None, dest='outFile')
+  args = parser.parse_args()
+
+  # Here we go!
+  main(args.timingsFiles, args.outFile)
@@ -15,9 +15,10 @@ sys.path.append('{}/lib'.format(os.environ['REGEX_GENERALIZABILITY_PROJECT_ROOT'
 import libLF
 
 import argparse
+import collections
 import json
+import tarfile
 import tempfile
-import subprocess
 
 ################
 # Globals
@@ -28,14 +29,20 @@ class ExtractionMode:
   Fields:
     extractionType: str: static or dynamic
     timeout: int: 0 means no timeout, otherwise abort extraction after this many seconds
+    extractorArgs: str[]: more arguments for the extractor, e.g. where to cache dependencies.
+                   These must not affect which regexes are extracted (cf. incremental mode)
+    limitArgs: str[]: more arguments for the extractor that limit its resources, e.g. per-test-suite limits.
+               These may affect which regexes are extracted, so incremental mode records them
   """
   STATIC = "STATIC"
   DYNAMIC = "DYNAMIC"
   EXTRACTION_TYPES = [STATIC, DYNAMIC]
-  def __init__(self, extractionType, timeout):
+  def __init__(self, extractionType, timeout, extractorArgs=None, limitArgs=None):
     assert(extractionType in ExtractionMode.EXTRACTION_TYPES)
     self.extractionType = extractionType
     self.timeout = timeout
+    self.extractorArgs = extractorArgs if extractorArgs is not None else []
+    self.limitArgs = limitArgs if limitArgs is not None else []
 
 # Dependencies
 staticRegexExtractorCLI = os.path.join(os.environ['REGEX_GENERALIZABILITY_PROJECT_ROOT'], 'bin', 'static-regex-extractor.py')
@@ -44,12 +51,199 @@ dynamicRegexExtractorCLI = os.path.join(os.environ['REGEX_GENERALIZABILITY_PROJE
 # Logging
 DELETE_TMP_FILES = False # NB: tmp files are preserved on failures
 
+# Incremental mode: each regex file gets a manifest of what produced it
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_FORMAT_VERSION = 1
+
+# Each regex file gets a record of the rc and libLF.ResourceUsage of the extractor run that produced it
+USAGE_SUFFIX = '.usage.json'
+
+# By default, per-project stage timings go next to the out file
+TIMINGS_SUFFIX = '.timings.json'
+
+################
+# Cost model
+#
+# Projects vary in extraction cost by orders of magnitude, and a few huge ones
+# started last can keep the run going for hours after everything else is done.
+# So we estimate each project's cost up front and start the most expensive first.
+
+# Seconds per cost unit before we have history to fit.
+# Only the order of the predictions matters until then.
+DEFAULT_SEC_PER_COST_UNIT = { "STATIC": 0.05, "DYNAMIC": 0.5 }
+# Fit a registry's rate once we have this many runtimes for it; until then use all registries'
+MIN_RUNTIMES_TO_FIT = 5
+
+class ProjectFeatures:
+  """What we know about a project's size before extracting from it
+
+  Fields:
+    tarballBytes: int
+    ext2count: { '.java': 1234, ... } files in the tarball by (lower-case) extension
+  """
+  def __init__(self, tarballBytes, ext2count):
+    self.tarballBytes = tarballBytes
+    self.ext2count = ext2count
+
+  def costUnits(self, registry):
+    """Roughly proportional to extraction cost: source files in the registry's languages, plus tarball MB"""
+    nSourceFiles = sum(self.ext2count.get(ext, 0) for ext in libLF.registryToExtensionLists.get(registry, []))
+    return 1 + nSourceFiles + self.tarballBytes / (1024 * 1024)
+
+def tarballSignature(tarballPath):
+  """Cheap stand-in for the identity of a tarball's contents"""
+  st = os.stat(tarballPath)
+  return '{}-{}'.format(st.st_size, st.st_mtime_ns)
+
+class TarballFeaturesTask(libLF.parallel.ParallelTask):
+  """Compute the ProjectFeatures of a tarball. Listing it is much cheaper than extracting from it."""
+  def __init__(self, tarballPath):
+    self.tarballPath = tarballPath
+
+  def run(self):
+    """Returns (tarballPath, signature, ProjectFeatures)"""
+    signature = tarballSignature(self.tarballPath)
+    ext2count = collections.Counter()
+    with tarfile.open(self.tarballPath, 'r:*') as tar:
+      for member in tar:
+        if member.isfile():
+          ext2count[os.path.splitext(member.name)[1].lower()] += 1
+    return self.tarballPath, signature, ProjectFeatures(os.path.getsize(self.tarballPath), dict(ext2count))
+
+class CostModel:
+  """Predicts how long each extraction will take, and learns from how long they did take.
+
+  History lives in a stats store: an NDJSON file, appended to as we learn.
+    { "type": "features", "tarballPath", "signature", "tarballBytes", "ext2count" }
+    { "type": "runtime", "project", "registry", "signature", "extractionType", "costUnits", "predictedSec", "actualSec" }
+
+  Predictions:
+    - If we extracted from this tarball before: how long it took last time.
+    - Otherwise: costUnits * seconds-per-cost-unit, fit to the history for the registry (or all registries),
+      or DEFAULT_SEC_PER_COST_UNIT if we don't have enough.
+  """
+  def __init__(self, statsFile):
+    """statsFile: the stats store, or None to keep no history"""
+    self.statsFile = statsFile
+    self._path2features = {} # tarballPath -> (signature, ProjectFeatures)
+    self._key2lastRuntime = {} # (project, signature, extractionType) -> actualSec
+    self._fitKey2totals = collections.defaultdict(lambda: [0, 0, 0]) # (registry or None, extractionType) -> [sec, costUnits, nRuntimes]
+    if statsFile is not None and os.path.isfile(statsFile):
+      self._load()
+
+  def _load(self):
+    nRecords = 0
+    with open(self.statsFile, 'r') as inStream:
+      for line in inStream:
+        try:
+          obj = json.loads(line)
+          if obj['type'] == 'features':
+            self._path2features[obj['tarballPath']] = (obj['signature'], ProjectFeatures(obj['tarballBytes'], obj['ext2count']))
+          elif obj['type'] == 'runtime':
+            self._learn(obj)
+          nRecords += 1
+        except (ValueError, KeyError) as err:
+          libLF.log('CostModel: skipping malformed record in {}: {}'.format(self.statsFile, err))
+    libLF.log('CostModel: loaded {} records from {}'.format(nRecords, self.statsFile))
+
+  def _learn(self, runtime):
+    self._key2lastRuntime[(runtime['project'], runtime['signature'], runtime['extractionType'])] = runtime['actualSec']
+    for registry in [runtime['registry'], None]:
+      totals = self._fitKey2totals[(registry, runtime['extractionType'])]
+      totals[0] += runtime['actualSec']
+      totals[1] += runtime['costUnits']
+      totals[2] += 1
+
+  def _append(self, obj):
+    if self.statsFile is not None:
+      with open(self.statsFile, 'a') as outStream:
+        outStream.write(json.dumps(obj) + '\n')
+
+  def computeFeatures(self, ghps, nWorkers):
+    """Compute the features of these projects' tarballs, where we don't know them already"""
+    todo = set()
+    for ghp in ghps:
+      try:
+        signature = tarballSignature(ghp.tarballPath)
+      except OSError:
+        continue
+      known = self._path2features.get(ghp.tarballPath)
+      if known is None or known[0] != signature:
+        todo.add(ghp.tarballPath)
+
+    libLF.log('CostModel: listing {} tarballs ({} known)'.format(len(todo), len(ghps) - len(todo)))
+    tasks = [TarballFeaturesTask(tarballPath) for tarballPath in sorted(todo)]
+    for result in libLF.parallel.imap_unordered_genr(tasks, nWorkers, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, jitter=False):
+      if isinstance(result, BaseException):
+        libLF.log('CostModel: could not list a tarball: {}'.format(result))
+        continue
+      tarballPath, signature, features = result
+      self._path2features[tarballPath] = (signature, features)
+      self._append({ "type": "features", "tarballPath": tarballPath, "signature": signature,
+                     "tarballBytes": features.tarballBytes, "ext2count": features.ext2count })
+
+  def _project(self, ghp):
+    return '{}/{}'.format(ghp.owner, ghp.name)
+
+  def _signatureAndCostUnits(self, ghp):
+    signature, features = self._path2features.get(ghp.tarballPath, (None, ProjectFeatures(0, {})))
+    return signature, features.costUnits(ghp.registry)
+
+  def predict(self, ghp, extractionType):
+    """Predicted seconds to extract regexes from ghp"""
+    signature, costUnits = self._signatureAndCostUnits(ghp)
+    lastRuntime = self._key2lastRuntime.get((self._project(ghp), signature, extractionType))
+    if lastRuntime is not None:
+      return lastRuntime
+
+    secPerCostUnit = DEFAULT_SEC_PER_COST_UNIT[extractionType]
+    for registry, minRuntimes in [(ghp.registry, MIN_RUNTIMES_TO_FIT), (None, 1)]:
+      totalSec, totalCostUnits, nRuntimes = self._fitKey2totals.get((registry, extractionType), (0, 0, 0))
+      if minRuntimes <= nRuntimes and 0 < totalCostUnits:
+        secPerCostUnit = totalSec / totalCostUnits
+        break
+    return secPerCostUnit * costUnits
+
+  def record(self, ghp, extractionType, predictedSec, actualSec):
+    """Learn how long an extraction took"""
+    signature, costUnits = self._signatureAndCostUnits(ghp)
+    runtime = { "type": "runtime", "project": self._project(ghp), "registry": ghp.registry, "signature": signature,
+                "extractionType": extractionType, "costUnits": round(costUnits, 3),
+                "predictedSec": round(predictedSec, 3), "actualSec": round(actualSec, 3) }
+    self._learn(runtime)
+    self._append(runtime)
+
 ################
 
+def hashExtractor(cli):
+  """Version of an extractor: a hash of everything in the directory of its (real) CLI,
+  and of libLF, on which every extractor relies (source discovery, vendoring rules, regex parsing).
+
+  Skips installed dependencies and VCS metadata, which are large and not ours."""
+  rootDirs = [os.path.dirname(os.path.realpath(cli)), os.path.dirname(os.path.realpath(libLF.__file__))]
+  skipDirs = set(['node_modules', '.git', '__pycache__'])
+  fileHashes = []
+  for rootDir in rootDirs:
+    for dirPath, dirNames, fileNames in os.walk(rootDir):
+      dirNames[:] = sorted(d for d in dirNames if d not in skipDirs)
+      for f in sorted(fileNames):
+        path = os.path.join(dirPath, f)
+        if os.path.isfile(path):
+          fileHashes.append('{} {} {}'.format(os.path.basename(rootDir), os.path.relpath(path, rootDir), libLF.hashFile(path)))
+  return libLF.hashString('\n'.join(fileHashes))
+
 class MyTask(libLF.parallel.ParallelTask):
-  def __init__(self, githubProject, extractionModes):
+  def __init__(self, githubProject, extractionModes, cpuBudgetDir, extractorVersions=None, predictedSec=None):
+    """extractorVersions: if set, { ExtractionMode.X: version } and we run incrementally:
+         skip an extraction if its manifest says the inputs have not changed
+       predictedSec: { ExtractionMode.X: seconds } the CostModel's predictions, to report with the actual times"""
     self.ghp = githubProject
     self.extractionModes = extractionModes
+    self.cpuBudgetDir = cpuBudgetDir
+    self.extractorVersions = extractorVersions
+    self.predictedSec = predictedSec if predictedSec is not None else {}
+    self.timings = libLF.StageTimings()
+    self._tarballHash = None
   
   def _staticRegexFileName(self):
     filename, _ = os.path.splitext(self.ghp.tarballPath)
@@ -58,8 +252,59 @@ class MyTask(libLF.parallel.ParallelTask):
   def _dynamicRegexFileName(self):
     filename, _ = os.path.splitext(self.ghp.tarballPath)
     return filename + '-DR-dynamic-regexes.json'
+
+  def _manifest(self, extractionMode):
+    """What goes into an extraction: if none of this changes, neither does the output"""
+    if self._tarballHash is None:
+      self._tarballHash = libLF.hashFile(self.ghp.tarballPath)
+    manifest = { "manifestFormatVersion": MANIFEST_FORMAT_VERSION,
+                 "tarballHash": self._tarballHash,
+                 "extractionType": extractionMode.extractionType,
+                 "timeout": extractionMode.timeout,
+                 "extractorVersion": self.extractorVersions[extractionMode.extractionType],
+    }
+    # Only if set, so that manifests from before we had limits stay valid
+    if extractionMode.limitArgs:
+      manifest["limitArgs"] = extractionMode.limitArgs
+    return manifest
+
+  def _isUpToDate(self, regexFile, extractionMode):
+    """Incremental mode: does regexFile's manifest match what we would extract now?"""
+    if self.extractorVersions is None:
+      return False
+    try:
+      with open(regexFile + MANIFEST_SUFFIX, 'r') as inStream:
+        manifest = json.load(inStream)
+    except (OSError, ValueError):
+      return False
+    return os.path.isfile(regexFile) and manifest == self._manifest(extractionMode)
+
+  def _recordManifest(self, regexFile, extractionMode):
+    """Incremental mode: note what produced regexFile"""
+    if self.extractorVersions is not None:
+      libLF.writeFileAtomically(regexFile + MANIFEST_SUFFIX, json.dumps(self._manifest(extractionMode)) + '\n')
+
+  def _forgetManifest(self, regexFile):
+    try:
+      os.unlink(regexFile + MANIFEST_SUFFIX)
+    except OSError:
+      pass
   
   def run(self):
+    """Returns (libLF.GitHubProject, predictedSec, timings) or an exception.
+
+    timings: libLF.StageTimings with a stage for each extraction we ran (not those that were up to date),
+             named by its ExtractionMode.X, and the extractors' own stages as "STATIC/stage" and "DYNAMIC/stage"
+    """
+    # Hold a CPU slot while we work. The static extractor may borrow more as other workers finish.
+    budget = libLF.parallel.CPUBudget(self.cpuBudgetDir)
+    slot = budget.acquireSlot()
+    try:
+      return self._run()
+    finally:
+      budget.releaseSlot(slot)
+
+  def _run(self):
     try:
       libLF.log('Working on: {}/{}'.format(self.ghp.owner, self.ghp.name))
 
@@ -70,12 +315,21 @@ class MyTask(libLF.parallel.ParallelTask):
       for extractionMode in self.extractionModes:
         if extractionMode.extractionType == ExtractionMode.STATIC:
           regexFile = self._staticRegexFileName()
-          libLF.log("Statically extracting regexes. Writing to {}".format(regexFile))
-          try:
-            self._extractStatic(regexFile, extractionMode.timeout)
-          except BaseException as e:
-            libLF.log("Exception doing static extraction")
-            libLF.log(e)
+          if self._isUpToDate(regexFile, extractionMode):
+            libLF.log("Static regexes in {} are up to date, skipping".format(regexFile))
+          else:
+            libLF.log("Statically extracting regexes. Writing to {}".format(regexFile))
+            self._forgetManifest(regexFile)
+            staticTimings = libLF.StageTimings()
+            # Catch outside the stage, so that the stage records the failure
+            try:
+              with self.timings.stage(ExtractionMode.STATIC):
+                self._extractStatic(regexFile, extractionMode.timeout, staticTimings)
+                self._recordManifest(regexFile, extractionMode)
+            except BaseException as e:
+              libLF.log("Exception doing static extraction")
+              libLF.log(e)
+            self.timings.extend(staticTimings, prefix=ExtractionMode.STATIC + '/')
           self.ghp.regexPath = regexFile
           regexFiles.append(regexFile)
           nRegexes[ExtractionMode.STATIC] = libLF.numLinesInFile(regexFile)
@@ -83,12 +337,20 @@ class MyTask(libLF.parallel.ParallelTask):
 
         elif extractionMode.extractionType == ExtractionMode.DYNAMIC:
           regexFile = self._dynamicRegexFileName()
-          libLF.log("Dynamically extracting regexes. Writing to {}".format(regexFile))
-          try:
-            self._extractDynamic(regexFile, extractionMode.timeout)
-          except BaseException as e:
-            libLF.log("Exception doing dynamic extraction")
-            libLF.log(e)
+          if self._isUpToDate(regexFile, extractionMode):
+            libLF.log("Dynamic regexes in {} are up to date, skipping".format(regexFile))
+          else:
+            libLF.log("Dynamically extracting regexes. Writing to {}".format(regexFile))
+            self._forgetManifest(regexFile)
+            dynTimings = libLF.StageTimings()
+            try:
+              with self.timings.stage(ExtractionMode.DYNAMIC):
+                self._extractDynamic(regexFile, extractionMode.timeout, extractionMode.extractorArgs + extractionMode.limitArgs, dynTimings)
+                self._recordManifest(regexFile, extractionMode)
+            except BaseException as e:
+              libLF.log("Exception doing dynamic extraction")
+              libLF.log(e)
+            self.timings.extend(dynTimings, prefix=ExtractionMode.DYNAMIC + '/')
           self.ghp.dynRegexPath = regexFile
           regexFiles.append(regexFile)
           nRegexes[ExtractionMode.DYNAMIC] = libLF.numLinesInFile(regexFile)
@@ -99,32 +361,38 @@ class MyTask(libLF.parallel.ParallelTask):
 
       # Return
       libLF.log('Completed project: {}'.format(self.ghp.toNDJSON()))
-      return self.ghp
+      return self.ghp, self.predictedSec, self.timings
     except KeyboardInterrupt:
       raise
     except BaseException as err:
       libLF.log(err)
       return err
 
-  def _extractStatic(self, outputFile, timeout):
-    """Static regex extraction"""
+  def _extractStatic(self, outputFile, timeout, timings):
+    """Static regex extraction
+
+    timings: libLF.StageTimings, to which we add the extractor's stages
+    """
+    fd, timingsFileName = tempfile.mkstemp(suffix=".json", prefix="extract-regexes-static-timings-")
+    os.close(fd)
     cmd = [staticRegexExtractorCLI,
       "--out-file", outputFile,
       "--registry", self.ghp.registry,
-      "--src-path", self.ghp.tarballPath
+      "--src-path", self.ghp.tarballPath,
+      "--cpu-budget-dir", self.cpuBudgetDir,
+      "--timings-file", timingsFileName
       ]
     fd, logFileName = tempfile.mkstemp(prefix="extract-regexes-static-log", suffix=".log")
     os.close(fd)
-    with open(logFileName, 'w') as logFile:
-      libLF.log("CMD: {} > {} 2>&1".format(" ".join(cmd), logFileName))
-      rc = 1
-      try:
-        tmo = None if timeout <= 0 else timeout
-        res = subprocess.run(cmd, stdout=logFile, stderr=logFile, timeout=tmo)
-        rc = res.returncode
-      except subprocess.TimeoutExpired:
-        libLF.log("Static extraction timed out")
-        rc = -1
+    rc = self._runExtractor(cmd, timeout, logFileName, outputFile)
+
+    # The extractor records its stages even if it fails, unless it was killed
+    try:
+      with open(timingsFileName, 'r') as inStream:
+        timings.extend(libLF.StageTimings.fromDict(json.load(inStream)))
+    except (OSError, ValueError, KeyError):
+      libLF.log("No stage timings from the static extractor")
+    os.unlink(timingsFileName)
 
     if rc != 0:
       raise IOError('Error, static extractor yielded rc {}. Examine {}'.format(rc, logFileName))
@@ -132,31 +400,38 @@ class MyTask(libLF.parallel.ParallelTask):
     if DELETE_TMP_FILES:
       os.unlink(logFileName)
 
-  def _extractDynamic(self, outputFile, timeout):
-    """Dynamic regex extraction"""
+  def _extractDynamic(self, outputFile, timeout, extractorArgs, timings):
+    """Dynamic regex extraction
+
+    timings: libLF.StageTimings, to which we add the extractor's stages
+    """
     # Prep GHP file
     fd, queryFileName = tempfile.mkstemp(suffix=".json", prefix="extract-regexes-GHP-")
     os.close(fd)
     with open(queryFileName, 'w') as queryFile:
       queryFile.write(self.ghp.toNDJSON())
+    fd, timingsFileName = tempfile.mkstemp(suffix=".json", prefix="extract-regexes-dynamic-timings-")
+    os.close(fd)
 
     # Run dynamic extractor
     fd, logFileName = tempfile.mkstemp(prefix="extract-regexes-dynamic-log", suffix=".log")
     os.close(fd)
     cmd = [dynamicRegexExtractorCLI,
       "--ghp-file", queryFileName,
-      "--out-file", outputFile
+      "--out-file", outputFile,
+      "--cpu-budget-dir", self.cpuBudgetDir,
+      "--timings-file", timingsFileName,
+      *extractorArgs
       ]
-    with open(logFileName, 'w') as logFile:
-      libLF.log("CMD: {} > {} 2>&1".format(" ".join(cmd), logFileName))
-      rc = 1
-      try:
-        tmo = None if timeout <= 0 else timeout
-        res = subprocess.run(cmd, stdout=logFile, stderr=logFile, timeout=tmo)
-        rc = res.returncode
-      except subprocess.TimeoutExpired:
-        libLF.log("Dynamic extraction timed out")
-        rc = -1
+    rc = self._runExtractor(cmd, timeout, logFileName, outputFile)
+
+    # The extractor records its stages even if it fails, unless it was killed
+    try:
+      with open(timingsFileName, 'r') as inStream:
+        timings.extend(libLF.StageTimings.fromDict(json.load(inStream)))
+    except (OSError, ValueError, KeyError):
+      libLF.log("No stage timings from the dynamic extractor")
+    os.unlink(timingsFileName)
 
     if rc != 0:
       raise IOError('Error, dynamic extractor yielded rc {}. Examine {}'.format(rc, logFileName))
@@ -165,10 +440,36 @@ class MyTask(libLF.parallel.ParallelTask):
       os.unlink(queryFileName)
       os.unlink(logFileName)
 
-def getTasks(projectFile, extractionModes):
+  def _runExtractor(self, cmd, timeout, logFileName, outputFile):
+    """Run an extractor, killing it and everything it spawned after timeout seconds (0: no timeout).
+
+    Records its rc and resource usage next to outputFile.
+    Returns its rc, or -1 if it timed out.
+    """
+    limits = libLF.ResourceLimits(wallClockSec=None if timeout <= 0 else timeout)
+    with open(logFileName, 'w') as logFile:
+      libLF.log("CMD: {} > {} 2>&1".format(" ".join(cmd), logFileName))
+      res = libLF.runLimited(cmd, limits, stdout=logFile, stderr=logFile)
+    libLF.writeFileAtomically(outputFile + USAGE_SUFFIX, json.dumps(res.toDict()) + '\n')
+
+    if res.limitExceeded is not None:
+      libLF.log("Extraction timed out ({})".format(res.toDict()))
+      return -1
+    return res.rc
+
+def getTasks(projectFile, extractionModes, cpuBudgetDir, extractorVersions, costModel, nWorkers):
+  """Returns MyTask[], most expensive first"""
   ghps = getGHPs(projectFile)
-  tasks = [MyTask(ghp, extractionModes) for ghp in ghps]
-  libLF.log('Prepared {} tasks'.format(len(tasks)))
+  costModel.computeFeatures(ghps, nWorkers)
+  tasks = []
+  for ghp in ghps:
+    predictedSec = { em.extractionType: costModel.predict(ghp, em.extractionType) for em in extractionModes }
+    tasks.append(MyTask(ghp, extractionModes, cpuBudgetDir, extractorVersions, predictedSec))
+
+  # Longest first, so the stragglers at the end of the run are the small projects
+  tasks.sort(key=lambda t: sum(t.predictedSec.values()), reverse=True)
+  libLF.log('Prepared {} tasks. Predicted {:.0f} sec in total, {:.0f} sec for the biggest' \
+    .format(len(tasks), sum(sum(t.predictedSec.values()) for t in tasks), sum(tasks[0].predictedSec.values()) if tasks else 0))
   return tasks
 
 def getGHPs(projectFile):
@@ -193,11 +494,25 @@ def getGHPs(projectFile):
 
 #################################################
 
-def main(projectFile, extractionModes, outFile, nWorkers):
-  libLF.log("projectFile {} extractionModes {} outFile {} nWorkers {}" \
-    .format(projectFile, [em.extractionType for em in extractionModes], outFile, nWorkers))
+def main(projectFile, extractionModes, outFile, nWorkers, cpuBudgetDir, incremental, costStatsFile, timingsFile):
+  # Projects and the files within them share nWorkers cores.
+  # Unless told otherwise, through a budget of our own for this run.
+  if cpuBudgetDir is None:
+    with tempfile.TemporaryDirectory(prefix="extract-regexes-cpu-budget-") as tmpBudgetDir:
+      return main(projectFile, extractionModes, outFile, nWorkers, tmpBudgetDir, incremental, costStatsFile, timingsFile)
 
-  tasks = getTasks(projectFile, extractionModes)
+  libLF.log("projectFile {} extractionModes {} outFile {} nWorkers {} cpuBudgetDir {} costStatsFile {} timingsFile {}" \
+    .format(projectFile, [em.extractionType for em in extractionModes], outFile, nWorkers, cpuBudgetDir, costStatsFile, timingsFile))
+  libLF.parallel.CPUBudget.create(cpuBudgetDir, nWorkers)
+
+  extractorVersions = None
+  if incremental:
+    modeToCLI = { ExtractionMode.STATIC: staticRegexExtractorCLI, ExtractionMode.DYNAMIC: dynamicRegexExtractorCLI }
+    extractorVersions = { em.extractionType: hashExtractor(modeToCLI[em.extractionType]) for em in extractionModes }
+    libLF.log("Incremental mode. Extractor versions: {}".format(extractorVersions))
+
+  costModel = CostModel(costStatsFile)
+  tasks = getTasks(projectFile, extractionModes, cpuBudgetDir, extractorVersions, costModel, nWorkers)
   libLF.log("Collected {} tasks".format(len(tasks)))
 
   # CPU-bound, no limits
@@ -205,19 +520,36 @@ def main(projectFile, extractionModes, outFile, nWorkers):
   libLF.log('Emitting results to {} as they come in'.format(outFile))
   nSuccesses = 0
   nExceptions = 0
+  totalPredictedSec, totalActualSec = 0, 0
   LINE_BUFFERING = 1
-  with open(outFile, 'w', buffering=LINE_BUFFERING) as outStream:
-    for maybeGHP in libLF.parallel.imap_unordered_genr(tasks, nWorkers, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, jitter=False):
+  with open(outFile, 'w', buffering=LINE_BUFFERING) as outStream, \
+       open(timingsFile, 'w', buffering=LINE_BUFFERING) as timingsStream:
+    for result in libLF.parallel.imap_unordered_genr(tasks, nWorkers, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, jitter=False):
       libLF.log("Got a result")
       # Emit
-      if type(maybeGHP) is libLF.GitHubProject:
-        libLF.log("Succeeded on {}/{}".format(maybeGHP.owner, maybeGHP.name))
+      if type(result) is tuple:
+        ghp, predictedSec, timings = result
+        libLF.log("Succeeded on {}/{}".format(ghp.owner, ghp.name))
         nSuccesses += 1
-        outStream.write(maybeGHP.toNDJSON() + '\n')
+        outStream.write(ghp.toNDJSON() + '\n')
+        timingsStream.write(libLF.toNDJSON({ "type": "ProjectTimings", "owner": ghp.owner, "name": ghp.name,
+                                             "registry": ghp.registry, "tarballPath": ghp.tarballPath,
+                                             "stages": timings.stages }) + '\n')
+
+        # How did we do?
+        actualSec = { extractionType: timings.wallSec(extractionType) for extractionType in predictedSec
+                      if any(s['stage'] == extractionType for s in timings.stages) }
+        for extractionType, sec in actualSec.items():
+          libLF.log("Cost: {}/{} {}: predicted {:.1f} sec, actual {:.1f} sec" \
+            .format(ghp.owner, ghp.name, extractionType, predictedSec[extractionType], sec))
+          costModel.record(ghp, extractionType, predictedSec[extractionType], sec)
+          totalPredictedSec += predictedSec[extractionType]
+          totalActualSec += sec
       else:
         libLF.log("Failed")
         nExceptions += 1
     libLF.log('Extracted regexes from {} libLF.GitHubProject\'s, {} exceptions'.format(nSuccesses, nExceptions))
+    libLF.log('Cost: predicted {:.0f} sec, actual {:.0f} sec for the extractions we ran'.format(totalPredictedSec, totalActualSec))
 
 ###############################################
 
@@ -229,8 +561,18 @@ if __name__ == '__main__':
   parser.add_argument('--static-timeout', help='Timeout (sec) for statically extracting regexes', type=int, required=False, default=0, dest='staticTimeout')
   parser.add_argument('--dynamic', help='Dynamically extract regexes', action='store_true', required=False, dest='dynamic')
   parser.add_argument('--dynamic-timeout', help='Timeout (sec) for dynamically extracting regexes', type=int, required=False, default=0, dest='dynamicTimeout')
+  parser.add_argument('--dep-cache-dir', help='Dynamic extraction: persistent package caches for the projects\' build tools, shared by all of the projects (cf. dyn-regex-extractor.py --dep-cache-dir)', required=False, default=None, dest='depCacheDir')
+  parser.add_argument('--dep-mirror', help='Dynamic extraction: stand-in for the registry\'s network repository (cf. dyn-regex-extractor.py --dep-mirror). Requires --dep-cache-dir', required=False, default=None, dest='depMirror')
+  parser.add_argument('--test-timeout', help='Dynamic extraction: wall-clock limit (sec) for each project\'s preprocessing and test suite (cf. dyn-regex-extractor.py --test-timeout)', type=int, required=False, default=None, dest='testTimeout')
+  parser.add_argument('--test-cpu-limit', help='Dynamic extraction: CPU-time limit (sec) for each project\'s preprocessing and test suite (cf. dyn-regex-extractor.py --test-cpu-limit)', type=int, required=False, default=None, dest='testCPULimit')
+  parser.add_argument('--test-memory-limit', help='Dynamic extraction: memory limit (MB) for each project\'s preprocessing and test suite (cf. dyn-regex-extractor.py --test-memory-limit)', type=int, required=False, default=None, dest='testMemoryLimit')
+  parser.add_argument('--test-max-procs', help='Dynamic extraction: process limit for each project\'s preprocessing and test suite (cf. dyn-regex-extractor.py --test-max-procs)', type=int, required=False, default=None, dest='testMaxProcs')
   parser.add_argument('--out-file', '-o', help='Where to write NDJSON results? These are updated GitHubProject\'s with the regexPath and/or dynRegexPath set', required=True, dest='outFile')
   parser.add_argument('--parallelism', '-p', help='Maximum cores to use', type=int, required=False, default=libLF.parallel.CPUCount.CPU_BOUND)
+  parser.add_argument('--cpu-budget-dir', help='Directory for the libLF.parallel.CPUBudget that projects share with the parallel work within them, e.g. per-file static extraction and pypi build attempts (default: a new tmp dir). Share it to bound several concurrent runs', required=False, default=None, dest='cpuBudgetDir')
+  parser.add_argument('--cost-stats-file', help='Stats store for the cost model that schedules the most expensive projects first: NDJSON of tarball features and of predicted and actual extraction times. Read at start-up, appended to as projects finish (cf. CostModel)', required=False, default=None, dest='costStatsFile')
+  parser.add_argument('--timings-file', help='Where to write NDJSON of each project\'s stage timings (default: OUT_FILE{}). Summarize with aggregate-timings.py'.format(TIMINGS_SUFFIX), required=False, default=None, dest='timingsFile')
+  parser.add_argument('--incremental', help='Skip extractions whose inputs (tarball, extractor, mode) are unchanged since the last run. Each regex file gets a sidecar manifest ({}) recording them'.format(MANIFEST_SUFFIX), action='store_true', required=False, default=False)
   args = parser.parse_args()
 
   extractionModes = []
@@ -238,12 +580,26 @@ if __name__ == '__main__':
     mode = ExtractionMode(ExtractionMode.STATIC, args.staticTimeout)
     extractionModes.append(mode)
   if args.dynamic:
-    mode = ExtractionMode(ExtractionMode.DYNAMIC, args.dynamicTimeout)
+    dynamicArgs = []
+    if args.depCacheDir is not None:
+      dynamicArgs += ["--dep-cache-dir", os.path.abspath(args.depCacheDir)]
+    if args.depMirror is not None:
+      if args.depCacheDir is None:
+        parser.error('--dep-mirror requires --dep-cache-dir')
+      dynamicArgs += ["--dep-mirror", args.depMirror]
+    limitArgs = []
+    for flag, limit in [("--test-timeout", args.testTimeout), ("--test-cpu-limit", args.testCPULimit),
+                        ("--test-memory-limit", args.testMemoryLimit), ("--test-max-procs", args.testMaxProcs)]:
+      if limit is not None:
+        limitArgs += [flag, str(limit)]
+    mode = ExtractionMode(ExtractionMode.DYNAMIC, args.dynamicTimeout, dynamicArgs, limitArgs)
     extractionModes.append(mode)
 
   if not extractionModes:
     libLF.log("Usage: must provide --static or --dynamic (or both!)")
     sys.exit(1)
 
+  timingsFile = args.timingsFile if args.timingsFile is not None else args.outFile + TIMINGS_SUFFIX
+
   # Here we go!
-  main(args.projectFile, extractionModes, args.outFile, args.parallelism)
+  main(args.projectFile, extractionModes, args.outFile, args.parallelism, args.cpuBudgetDir, args.incremental, args.costStatsFile, timingsFile)
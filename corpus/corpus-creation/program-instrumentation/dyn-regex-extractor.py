@@ -5,7 +5,7 @@
 # Algorithm:
 #   Pick a regex output file name 
 #   Untar the tarball
-#   Identify the source files (cloc)
+#   Identify the source files (libLF.getUnvendoredSourceFiles)
 #   Transform the source files in place
 #   Run the appropriate "build + run tests" incantation
 #   Retrieve the regexes from the regex output file
@@ -30,6 +30,8 @@ import tarfile
 import re
 import subprocess
 import shutil
+import json
+import xml.etree.ElementTree
 
 import time
 import tempfile
@@ -56,8 +58,12 @@ MODULE_RUN_DIR = os.path.join(MODULE_HOME, "run")
 # Instrumentor: X source-file regex-log-file
 #   When the instrumented source file is executed,
 #   it should emit NDJSON records with keys: file pattern flags
+#   Batch mode: X --file-list file-list regex-log-file
+#     Each line of file-list is "src" (rewritten in place) or "src<TAB>dest".
+#     Prints one NDJSON record per file with keys: fileName instrumented
 # Runner: X --proj-dir DIR
 #   returncode: 0 if tests pass
+#   If moduleRunnerTakesCPUBudget, also accepts --cpu-budget-dir DIR (cf. libLF.parallel.CPUBudget)
 
 registryToPaths = {
   # npm
@@ -69,7 +75,8 @@ registryToPaths = {
     'instrumentorInvocationPrefix':  {
       'javascript': ''
     },
-    'moduleRunner': os.path.join(MODULE_RUN_DIR, 'npm-build-test.py')
+    'moduleRunner': os.path.join(MODULE_RUN_DIR, 'npm-build-test.py'),
+    'moduleRunnerTakesCPUBudget': False
   },
 
   # maven
@@ -81,7 +88,8 @@ registryToPaths = {
     'instrumentorInvocationPrefix':  {
       'java': 'java -jar'
     },
-    'moduleRunner': os.path.join(MODULE_RUN_DIR, 'maven-build-test.py')
+    'moduleRunner': os.path.join(MODULE_RUN_DIR, 'maven-build-test.py'),
+    'moduleRunnerTakesCPUBudget': False
   },
 
   # pypi
@@ -93,13 +101,12 @@ registryToPaths = {
     'instrumentorInvocationPrefix':  {
       'python': ''
     },
-    'moduleRunner': os.path.join(MODULE_RUN_DIR, 'pypi-build-test.py')
+    'moduleRunner': os.path.join(MODULE_RUN_DIR, 'pypi-build-test.py'),
+    'moduleRunnerTakesCPUBudget': True # Build attempts run in parallel
   },
 }
 
 def checkRegistryDependencies(registry):
-  libLF.checkShellDependencies(['cloc'], mustBeExecutable=True)
-
   paths = [
     registryToPaths[registry]['preprocessor'],
     *registryToPaths[registry]['instrumentor'].values(),
@@ -108,6 +115,141 @@ def checkRegistryDependencies(registry):
   libLF.log("Checking paths for registry {}: {}".format(registry, paths))
   libLF.checkShellDependencies(paths, mustBeExecutable=False)
 
+#######
+# Dependency caches
+#######
+
+class DependencyCache:
+  """Persistent package caches for the registries' build tools.
+
+  Otherwise each project downloads its dependencies into a fresh tmp tree.
+  Every project (and every concurrent worker) can share one cacheDir.
+  The npm and pip caches are content-addressed and do their own locking,
+  so we need only tell them where the cache is, through their environment.
+  Maven only locks its local repository from 3.9 on. With an older Maven,
+  each project gets a local repository of its own (still kept across runs).
+
+  mirror (optional) stands in for the registry's network repository:
+    npm:   registry URL (e.g. a local verdaccio)
+    pypi:  package index URL, or a local directory of wheels/sdists (then pip stays offline)
+    maven: repository URL, used as a mirror of every repository.
+           Needs Maven >= 3.9, which reads the settings we add to MAVEN_ARGS.
+           Those settings are your ~/.m2/settings.xml with its mirrors replaced by ours.
+  """
+  # Maven >= 3.9: lock the shared local repository per artifact
+  MAVEN_LOCKING_OPTS = '-Daether.syncContext.named.factory=file-lock -Daether.syncContext.named.nameMapper=file-gav'
+  MAVEN_MIN_SHARED_VERSION = (3, 9)
+  MAVEN_USER_SETTINGS = os.path.join(os.path.expanduser('~'), '.m2', 'settings.xml')
+
+  def __init__(self, cacheDir, mirror=None):
+    self.cacheDir = os.path.abspath(cacheDir)
+    self.mirror = mirror
+    self.mavenVersion = None # Looked up on first use
+
+  def env(self, registry, ghp):
+    """Returns a copy of os.environ that points registry's tools at our caches, for ghp's build"""
+    env = dict(os.environ)
+    if registry == 'npm':
+      env.update(self._npmEnv())
+    elif registry == 'pypi':
+      env.update(self._pypiEnv())
+    elif registry == 'maven':
+      env.update(self._mavenEnv(env.get('MAVEN_OPTS', ''), env.get('MAVEN_ARGS', ''), ghp))
+    libLF.log("DependencyCache: {} builds use {}".format(registry, { k: v for k, v in env.items() if os.environ.get(k) != v }))
+    return env
+
+  def _subdir(self, name):
+    d = os.path.join(self.cacheDir, name)
+    os.makedirs(d, exist_ok=True)
+    return d
+
+  def _npmEnv(self):
+    env = {
+      'npm_config_cache': self._subdir('npm'),
+      # Use cached package metadata without revalidating it
+      'npm_config_prefer_offline': 'true',
+    }
+    if self.mirror:
+      env['npm_config_registry'] = self.mirror
+    return env
+
+  def _pypiEnv(self):
+    env = {
+      'PIP_CACHE_DIR': self._subdir('pip'),
+    }
+    if self.mirror:
+      if os.path.isdir(self.mirror):
+        env['PIP_FIND_LINKS'] = os.path.abspath(self.mirror)
+        env['PIP_NO_INDEX'] = '1'
+      else:
+        env['PIP_INDEX_URL'] = self.mirror
+    return env
+
+  def _mavenEnv(self, mavenOpts, mavenArgs, ghp):
+    m2Dir = self._subdir('m2')
+    if self._mavenSharesRepo():
+      localRepo = os.path.join(m2Dir, 'repository')
+      mavenOpts = ' '.join([mavenOpts, DependencyCache.MAVEN_LOCKING_OPTS])
+    else:
+      localRepo = os.path.join(m2Dir, 'projects', '{}__{}'.format(ghp.owner, ghp.name), 'repository')
+    env = {
+      'MAVEN_OPTS': ' '.join([mavenOpts, '-Dmaven.repo.local={}'.format(localRepo)]).strip(),
+      'GRADLE_USER_HOME': self._subdir('gradle'),
+    }
+
+    if self.mirror:
+      if self.mavenVersion < DependencyCache.MAVEN_MIN_SHARED_VERSION:
+        libLF.log('DependencyCache: Maven {} does not read MAVEN_ARGS, so builds will not use mirror {}'.format(self.mavenVersion, self.mirror))
+      settings = self._mavenSettings()
+      # Named by content, so concurrent workers with different mirrors don't collide
+      settingsFile = os.path.join(m2Dir, 'settings-{}.xml'.format(libLF.hashString(settings)))
+      if not os.path.isfile(settingsFile):
+        libLF.writeFileAtomically(settingsFile, settings)
+      env['MAVEN_ARGS'] = ' '.join([mavenArgs, '--settings {}'.format(settingsFile)]).strip()
+    return env
+
+  def _mavenSharesRepo(self):
+    """True if the installed Maven locks its local repository, so that concurrent builds can share one"""
+    if self.mavenVersion is None:
+      self.mavenVersion = (0, 0)
+      try:
+        out = subprocess.run(['mvn', '-v'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL).stdout.decode('utf-8', errors='replace')
+        m = re.search(r'Apache Maven (\d+)\.(\d+)', out)
+        if m:
+          self.mavenVersion = (int(m.group(1)), int(m.group(2)))
+      except OSError as err:
+        libLF.log('DependencyCache: Could not run mvn -v: {}'.format(err))
+      libLF.log('DependencyCache: Maven version {}, shared local repository: {}'.format(self.mavenVersion, DependencyCache.MAVEN_MIN_SHARED_VERSION <= self.mavenVersion))
+    return DependencyCache.MAVEN_MIN_SHARED_VERSION <= self.mavenVersion
+
+  def _mavenSettings(self):
+    """The user's settings, with our mirror in place of theirs.
+    We set the local repository through MAVEN_OPTS, which takes precedence."""
+    root = None
+    if os.path.isfile(DependencyCache.MAVEN_USER_SETTINGS):
+      try:
+        root = xml.etree.ElementTree.parse(DependencyCache.MAVEN_USER_SETTINGS).getroot()
+      except xml.etree.ElementTree.ParseError as err:
+        libLF.log('DependencyCache: Ignoring unparseable {}: {}'.format(DependencyCache.MAVEN_USER_SETTINGS, err))
+    if root is None:
+      root = xml.etree.ElementTree.Element('settings')
+
+    # Keep the user's namespace, if any, without prefixing every element
+    ns = root.tag[1:root.tag.index('}')] if root.tag.startswith('{') else ''
+    xml.etree.ElementTree.register_namespace('', ns)
+    def tag(name):
+      return '{' + ns + '}' + name if ns else name
+
+    mirrors = root.find(tag('mirrors'))
+    if mirrors is None:
+      mirrors = xml.etree.ElementTree.SubElement(root, tag('mirrors'))
+    for m in list(mirrors):
+      mirrors.remove(m)
+    mirror = xml.etree.ElementTree.SubElement(mirrors, tag('mirror'))
+    for name, value in [('id', 'dependency-cache-mirror'), ('mirrorOf', '*'), ('url', self.mirror)]:
+      xml.etree.ElementTree.SubElement(mirror, tag(name)).text = value
+    return xml.etree.ElementTree.tostring(root, encoding='unicode') + '\n'
+
 #######
 # I/O
 #######
@@ -137,8 +279,11 @@ def loadGHPFile(ghpFile):
 # Analysis stages
 #######
 
-def analyzeGHP(ghp):
+def analyzeGHP(ghp, nWorkers, cpuBudgetDir, depCache, testLimits, timings):
   """Analyze this libLF.GitHubProject
+
+  testLimits: libLF.ResourceLimits for each of the preprocessor and the test suite
+  timings: libLF.StageTimings, to which we add a stage for each step
   
   Returns:
     (testsPassed, libLF.RegexUsage[])
@@ -147,21 +292,31 @@ def analyzeGHP(ghp):
   libLF.log("{}/{} will use dyno regex file {}".format(ghp.owner, ghp.name, dynoRegexFileName))
 
   libLF.log("Untarring")
-  untarDir = unpackTarball(ghp)
+  with timings.stage('untar'):
+    untarDir = unpackTarball(ghp)
   libLF.log("Untarred to {}".format(untarDir))
 
+  # Environment for the build tools
+  buildEnv = None
+  if depCache is not None:
+    buildEnv = depCache.env(ghp.registry, ghp)
+
   libLF.log("Running preprocessing stage")
-  preprocessProject(ghp, untarDir)
+  with timings.stage('preprocess'):
+    preprocessProject(ghp, untarDir, buildEnv, testLimits)
 
   libLF.log("Finding source files")
-  sourceFiles = getSourceFiles(ghp, untarDir)
+  with timings.stage('sourceDiscovery'):
+    sourceFiles = getSourceFiles(ghp, untarDir)
   libLF.log("source files: {}".format(sourceFiles))
 
   libLF.log("Instrumenting source files")
-  instrumentSourceFiles(ghp, sourceFiles, dynoRegexFileName)
+  with timings.stage('instrumentation'):
+    instrumentSourceFiles(ghp, sourceFiles, dynoRegexFileName, nWorkers, cpuBudgetDir)
 
   libLF.log("Running test suite")
-  testsSucceeded = runTestSuite(ghp, untarDir)
+  with timings.stage('testRun'):
+    testsSucceeded = runTestSuite(ghp, untarDir, cpuBudgetDir, buildEnv, testLimits)
   if testsSucceeded:
     libLF.log("Application test suite succeeded")
   else:
@@ -170,10 +325,12 @@ def analyzeGHP(ghp):
   regexes = []
   if testsSucceeded or not REQUIRE_TESTS_PASS:
     libLF.log("Retrieving regexes from {}".format(dynoRegexFileName))
-    regexes = retrieveRegexes(dynoRegexFileName)
+    with timings.stage('regexRetrieval'):
+      regexes = retrieveRegexes(dynoRegexFileName)
 
   libLF.log("Cleaning up untarDir {}".format(untarDir))
-  cleanUp(untarDir, dynoRegexFileName)
+  with timings.stage('cleanup'):
+    cleanUp(untarDir, dynoRegexFileName)
 
   return testsSucceeded, regexes
 
@@ -200,15 +357,20 @@ def unpackTarball(ghp):
     tar.extractall(path=tmpDir) 
     return tmpDir
 
-def preprocessProject(ghp, untarDir):
-  """Prepocess project using the appropriate plugin"""
+def preprocessProject(ghp, untarDir, buildEnv, limits):
+  """Prepocess project using the appropriate plugin
+
+  buildEnv: environment for the plugin, or None to inherit ours
+  limits: libLF.ResourceLimits for the plugin's process tree
+  """
   preprocessor = registryToPaths[ghp.registry]['preprocessor']
   libLF.log
   projDir = getProjDir(untarDir)
 
   cmd = [preprocessor, "--proj-dir", projDir]
   libLF.log(" ".join(cmd))
-  subprocess.run(cmd)
+  res = libLF.runLimited(cmd, limits, env=buildEnv)
+  libLF.log("Preprocessor: {}".format(res.toDict()))
 
 ###
 #   Identify the source files
@@ -222,42 +384,97 @@ def getSourceFiles(ghp, untarDir):
 #   Transform the source files in place
 ###
 
-def instrumentSourceFiles(ghp, lang2sourceFiles, regexDumpFile):
+# Instrument files in chunks of this size or more...
+MIN_INSTRUMENTATION_CHUNK_SIZE = 20
+# ...but aim for this many chunks per worker, so one slow chunk doesn't hold up the rest
+INSTRUMENTATION_CHUNKS_PER_WORKER = 4
+
+class InstrumentationTask(libLF.parallel.ParallelTask):
+  """Instrument a chunk of a project's files, all in one language, with one instrumentor process"""
+  def __init__(self, registry, lang, sourceFiles, regexDumpFile):
+    self.registry = registry
+    self.lang = lang
+    self.sourceFiles = sourceFiles
+    self.regexDumpFile = regexDumpFile
+
+  def run(self):
+    """Rewrite each of our sourceFiles in place
+
+    Returns:
+      (nInstrumented, nFailed)
+    """
+    instrumentor = registryToPaths[self.registry]['instrumentor'][self.lang]
+    invocationPrefix = registryToPaths[self.registry]['instrumentorInvocationPrefix'][self.lang]
+
+    fd, fileListName = tempfile.mkstemp(suffix=".txt", prefix="dyno-regexes-filelist-")
+    with os.fdopen(fd, 'w') as fileList:
+      for sourceFile in self.sourceFiles:
+        fileList.write(sourceFile['name'] + '\n')
+    fd, logFileName = tempfile.mkstemp(suffix=".log", prefix="dyno-regexes-tmpfile-")
+    os.close(fd)
+
+    cmdWords = [*invocationPrefix.split(" "), instrumentor] if len(invocationPrefix) else [instrumentor]
+    cmdWords += ['--file-list', fileListName, self.regexDumpFile]
+    libLF.log("instrumenting {} files: {} 2>{}".format(len(self.sourceFiles), " ".join(cmdWords), logFileName))
+    with open(logFileName, 'w') as logFile:
+      res = subprocess.run(cmdWords, stdout=subprocess.PIPE, stderr=logFile)
+
+    # Files the instrumentor could not handle are left as they were
+    instrumented = set()
+    for line in res.stdout.decode('utf-8', errors='replace').splitlines():
+      try:
+        obj = libLF.fromNDJSON(line)
+        if obj['instrumented']:
+          instrumented.add(obj['fileName'])
+      except BaseException:
+        libLF.log("Could not parse instrumentor output: {}".format(line))
+    if res.returncode != 0:
+      libLF.log("Error, instrumentor returned {} (cf. {})".format(res.returncode, logFileName))
+    for sourceFile in self.sourceFiles:
+      if sourceFile['name'] not in instrumented:
+        libLF.log("Error on file {}, preserving original".format(sourceFile['name']))
+
+    os.unlink(fileListName)
+    if DELETE_TMP_FILES:
+      os.unlink(logFileName)
+    return len(instrumented), len(self.sourceFiles) - len(instrumented)
+
+def getInstrumentationTasks(ghp, lang2sourceFiles, regexDumpFile, nWorkers):
+  tasks = []
   for lang, sourceFiles in lang2sourceFiles.items():
-    if lang in registryToPaths[ghp.registry]['instrumentor']:
-      instrumentor = registryToPaths[ghp.registry]['instrumentor'][lang]
-      libLF.log("registry {}: instrumentor {}".format(ghp.registry, instrumentor))
-      libLF.log("instrumentSourceFiles: instrumenting {} {} files".format(len(sourceFiles), lang))
-
-      fd, tmpFileName = tempfile.mkstemp(suffix=".instrumented", prefix="dyno-regexes-tmpfile-")
-      os.close(fd)
-      fd, logFileName = tempfile.mkstemp(suffix=".log", prefix="dyno-regexes-tmpfile-")
-      os.close(fd)
-      for sourceFile in sourceFiles:
-        # Replace each sourceFile with the instrumented version
-        with open(tmpFileName, 'w') as tmpFile, open(logFileName, 'w') as logFile:
-          invocationPrefix = registryToPaths[ghp.registry]['instrumentorInvocationPrefix'][lang]
-          libLF.log("instrumenting file: {} {} {} {} > {} 2>{}" \
-            .format(invocationPrefix, instrumentor,
-                    sourceFile['name'], regexDumpFile, tmpFileName, logFileName))
-          if len(invocationPrefix):
-            cmdWords = [*invocationPrefix.split(" "), instrumentor, sourceFile['name'], regexDumpFile]
-          else:
-            cmdWords = [instrumentor, sourceFile['name'], regexDumpFile]
-          res = subprocess.run(cmdWords, stdout=tmpFile, stderr=logFile)
-
-          # If successful, replace the original
-          if res.returncode == 0:
-            libLF.log("cp {} {}".format(tmpFile.name, sourceFile['name']))
-            shutil.copy(tmpFileName, sourceFile['name'])
-          else:
-            libLF.log("Error on file {}, preserving original".format(sourceFile['name']))
-
-          if DELETE_TMP_FILES:
-            os.unlink(tmpFileName)
-            os.unlink(logFileName)
-    else:
+    if lang not in registryToPaths[ghp.registry]['instrumentor']:
       libLF.log("instrument: no instrumentor for {}, skipping {} files".format(lang, len(sourceFiles)))
+      continue
+    libLF.log("registry {}: instrumentor {}".format(ghp.registry, registryToPaths[ghp.registry]['instrumentor'][lang]))
+    libLF.log("instrumentSourceFiles: instrumenting {} {} files".format(len(sourceFiles), lang))
+
+    chunkSize = max(MIN_INSTRUMENTATION_CHUNK_SIZE, -(-len(sourceFiles) // (nWorkers * INSTRUMENTATION_CHUNKS_PER_WORKER)))
+    for i in range(0, len(sourceFiles), chunkSize):
+      tasks.append(InstrumentationTask(ghp.registry, lang, sourceFiles[i:i + chunkSize], regexDumpFile))
+  return tasks
+
+def instrumentSourceFiles(ghp, lang2sourceFiles, regexDumpFile, nWorkers, cpuBudgetDir):
+  """Replace each source file with its instrumented version.
+
+  Each instrumentor process handles a chunk of files, and we run up to nWorkers of them at once
+  (fewer if the libLF.parallel.CPUBudget in cpuBudgetDir is busy).
+  """
+  tasks = getInstrumentationTasks(ghp, lang2sourceFiles, regexDumpFile, nWorkers)
+  if not tasks:
+    return
+
+  budget = None
+  if cpuBudgetDir is not None:
+    budget = libLF.parallel.CPUBudget(cpuBudgetDir)
+
+  nInstrumented, nFailed = 0, 0
+  for result in libLF.parallel.imap_unordered_budget_genr(tasks, min(nWorkers, len(tasks)), budget):
+    if isinstance(result, BaseException):
+      libLF.log("Error instrumenting a chunk of files: {}".format(result))
+    else:
+      nInstrumented += result[0]
+      nFailed += result[1]
+  libLF.log("instrumentSourceFiles: instrumented {} files, {} failed".format(nInstrumented, nFailed))
 
 ###
 #   Run the appropriate "build + run tests" incantation
@@ -280,8 +497,13 @@ def getProjDir(untarRoot):
     return getProjDir(nonDotFiles[0].path)
   return untarRoot
 
-def runTestSuite(ghp, untarDir):
-  """Returns True if tests succeed, else False"""
+def runTestSuite(ghp, untarDir, cpuBudgetDir, buildEnv, limits):
+  """Returns True if tests succeed, else False
+
+  buildEnv: environment for the runner, or None to inherit ours
+  limits: libLF.ResourceLimits for the runner's process tree.
+          If it exceeds one we kill the tree, and the tests did not succeed.
+  """
   runner = registryToPaths[ghp.registry]['moduleRunner']
 
   projDir = getProjDir(untarDir)
@@ -290,55 +512,123 @@ def runTestSuite(ghp, untarDir):
   fd, logFile = tempfile.mkstemp(suffix=".log", prefix="moduleRunner-")
   os.close(fd)
 
-  cmd = "{} --proj-dir {}".format(runner, projDir)
-  libLF.log("CMD: {} > {} 2>&1".format(cmd, logFile))
+  cmd = [runner, "--proj-dir", projDir]
+  if cpuBudgetDir is not None and registryToPaths[ghp.registry]['moduleRunnerTakesCPUBudget']:
+    cmd += ["--cpu-budget-dir", cpuBudgetDir]
+  libLF.log("CMD: {} > {} 2>&1".format(" ".join(cmd), logFile))
   with open(logFile, 'w') as logStream:
-    res = subprocess.run(cmd.split(" "), stdout=logStream, stderr=logStream)
+    res = libLF.runLimited(cmd, limits, stdout=logStream, stderr=logStream, env=buildEnv)
+  libLF.log("Test suite: {}".format(res.toDict()))
 
   if DELETE_TMP_FILES:
     os.unlink(logFile)
-  return res.returncode == 0
+  return res.rc == 0 and res.limitExceeded is None
 
 ###
 #   Retrieve the regexes from the regex output file
 ###
+# The instrumented code writes each regex once per process, but a test suite
+# may run many processes, so the log can still be large.
+# Logs bigger than this are deduplicated in hash-partitioned buckets on disk,
+# so we hold about this much of the log in memory at a time.
+DEDUP_BUCKET_BYTES = 256 * 1024 * 1024
+# Before bucketing, skip lines we saw recently. Bounds the memory of that filter.
+DEDUP_RECENT_RECORDS = 100000
+
+def _regexLogRecords(regexOutputFileName, counts):
+  """Yield each (file, pattern, flags) in this regex log"""
+  with open(regexOutputFileName, mode='r', errors='replace') as regexStream:
+    for line in regexStream:
+      counts['raw'] += 1
+      # Try to parse as NDJSON.
+      # In Java we rely on a "poor man's JSON" implementation which may sometimes
+      # produce malformed strings. In other languages, this should always work.
+      try:
+        obj = libLF.fromNDJSON(line)
+        record = (obj['file'], obj['pattern'], obj['flags'])
+        hash(record)
+      except:
+        counts['malformed'] += 1
+        libLF.log("Could not fromNDJSON line: {}".format(line))
+        continue
+      yield record
+
+def uniqRegexLogRecords(regexOutputFileName, counts):
+  """Yield each unique (file, pattern, flags) in this regex log, in a bounded amount of memory
+
+  Updates counts: raw malformed unique
+  """
+  records = _regexLogRecords(regexOutputFileName, counts)
+
+  nBuckets = max(1, -(-os.path.getsize(regexOutputFileName) // DEDUP_BUCKET_BYTES))
+  if nBuckets == 1:
+    seen = set()
+    for record in records:
+      if record not in seen:
+        seen.add(record)
+        counts['unique'] += 1
+        yield record
+    return
+
+  # Partition by hash: duplicates land in the same bucket
+  bucketDir = tempfile.mkdtemp(prefix=tmpFilePrefix + "-dedup-")
+  libLF.log("Partitioning regex log into {} buckets under {}".format(nBuckets, bucketDir))
+  try:
+    buckets = [open(os.path.join(bucketDir, str(i)), 'w') for i in range(nBuckets)]
+    recent = set()
+    for record in records:
+      if record in recent:
+        continue
+      if DEDUP_RECENT_RECORDS <= len(recent):
+        recent.clear()
+      recent.add(record)
+      buckets[hash(record) % nBuckets].write(json.dumps(record) + '\n')
+    for bucket in buckets:
+      bucket.close()
+    del recent
+
+    for i in range(nBuckets):
+      seen = set()
+      with open(os.path.join(bucketDir, str(i)), 'r') as bucket:
+        for line in bucket:
+          record = tuple(json.loads(line))
+          if record not in seen:
+            seen.add(record)
+            counts['unique'] += 1
+            yield record
+  finally:
+    shutil.rmtree(bucketDir, ignore_errors=True)
+
 def retrieveRegexes(regexOutputFileName):
   """Returns libLF.RegexUsage[]
 
   (Since regexOutputFileName contains regexes from multiple source files,
   multiple files are represented in the returned libLF.RegexUsage[])
 
-  Duplicates by <file, pattern> are removed.
+  Duplicates by <file, pattern, flags> are removed.
   """
 
   libLF.log("Loading regexes from {}".format(regexOutputFileName))
   
   # Bin by file, removing duplicates
-  file2uniqRegexes = {} # x[filename][pattern] = record
-  with open(regexOutputFileName, mode='r') as regexStream:
-    for line in regexStream:
-      # Try to parse as NDJSON.
-      # In Java we rely on a "poor man's JSON" implementation which may sometimes
-      # produce malformed strings. In other languages, this should always work.
-      try:
-        obj = libLF.fromNDJSON(line)
-      except:
-        libLF.log("Could not fromNDJSON line: {}".format(line))
-        continue
-
-      if obj['file'] not in file2uniqRegexes:
-        file2uniqRegexes[obj['file']] = {}
-      file2uniqRegexes[obj['file']][obj['pattern']] = \
-        {
-          'pattern': obj['pattern'],
-          'flags': obj['flags']
-        }
+  counts = { 'raw': 0, 'malformed': 0, 'unique': 0 }
+  file2uniqRegexes = {} # x[filename] = record[]
+  for fileName, pattern, flags in uniqRegexLogRecords(regexOutputFileName, counts):
+    if fileName not in file2uniqRegexes:
+      file2uniqRegexes[fileName] = []
+    file2uniqRegexes[fileName].append(
+      {
+        'pattern': pattern,
+        'flags': flags
+      })
+  libLF.log("Regex log had {} lines ({} malformed), {} unique regexes" \
+    .format(counts['raw'], counts['malformed'], counts['unique']))
   
   # Convert to libLF.RegexUsage[] via libLF.SimpleFileWithRegexes
   ruList = []
   for fileName in file2uniqRegexes:
     sfwr = libLF.SimpleFileWithRegexes().initFromRaw(
-      fileName, "XXX", True, list(file2uniqRegexes[fileName].values())
+      fileName, "XXX", True, file2uniqRegexes[fileName]
     )
     ruList += libLF.sfwrToRegexUsageList(sfwr)
 
@@ -362,8 +652,8 @@ def cleanUp(tmpDir, intermediateRegexFile):
 
 #########################
 
-def main(ghpFile, outFile):
-  libLF.log('main: ghpFile {} outFile {}'.format(ghpFile, outFile))
+def main(ghpFile, outFile, nWorkers, cpuBudgetDir, depCacheDir, depMirror, testLimits, timingsFile):
+  libLF.log('main: ghpFile {} outFile {} nWorkers {} cpuBudgetDir {} depCacheDir {} depMirror {} testLimits {} timingsFile {}'.format(ghpFile, outFile, nWorkers, cpuBudgetDir, depCacheDir, depMirror, vars(testLimits), timingsFile))
 
   # Load GHPs
   libLF.log("main: Loading libLF.GitHubProject from {}".format(ghpFile))
@@ -376,9 +666,20 @@ def main(ghpFile, outFile):
   libLF.log("main: Checking dependencies for registry: {}".format(ghp.registry))
   checkRegistryDependencies(ghp.registry)
   
+  depCache = None
+  if depCacheDir is not None:
+    depCache = DependencyCache(depCacheDir, depMirror)
+
   # Off we go!
   libLF.log("main: Analyzing GHP")
-  testsSucceeded, regexUsages = analyzeGHP(ghp)
+  timings = libLF.StageTimings()
+  try:
+    testsSucceeded, regexUsages = analyzeGHP(ghp, nWorkers, cpuBudgetDir, depCache, testLimits, timings)
+  finally:
+    # Even if we failed part-way: the stages we got through are the interesting ones
+    libLF.log("main: Stage timings: {}".format(timings.toDict()))
+    if timingsFile is not None:
+      libLF.writeFileAtomically(timingsFile, json.dumps(timings.toDict()) + '\n')
 
   if testsSucceeded:
     libLF.log("main: All tests succeeded (rc 0)")
@@ -396,8 +697,23 @@ def main(ghpFile, outFile):
 parser = argparse.ArgumentParser(description='Dynamically extract regexes from a libLF.GitHubProject. Only regexes in the primary language of the project will be extracted. Extraction is performed by instrumenting the project source, installing its dependencies, and then running the test suite of the project. cf. ghp-extract-regexes.py')
 parser.add_argument('--ghp-file', '-r',  help='File containing NDJSON of a libLF.GitHubProject', required=True, dest='ghpFile')
 parser.add_argument('--out-file', '-o', help='Where to write NDJSON of libLF.RegexUsage[]', required=True, dest='outFile')
+parser.add_argument('--parallelism', '-p', help='Maximum number of instrumentor processes to run at once', type=int, required=False, default=libLF.parallel.CPUCount.CPU_BOUND)
+parser.add_argument('--cpu-budget-dir', help='libLF.parallel.CPUBudget shared with the caller. We assume the caller holds one of its slots for us, and take more as they free up', required=False, default=None, dest='cpuBudgetDir')
+parser.add_argument('--dep-cache-dir', help='Persistent package caches (npm cache, maven local repository, pip cache) for the build tools. Safe to share between projects and concurrent runs (cf. DependencyCache)', required=False, default=None, dest='depCacheDir')
+parser.add_argument('--dep-mirror', help='Stand-in for the registry\'s network repository: a registry/index/repository URL, or for pypi a local directory of packages. Requires --dep-cache-dir', required=False, default=None, dest='depMirror')
+parser.add_argument('--timings-file', help='Where to write NDJSON of the wall and CPU time of each stage (cf. libLF.StageTimings)', required=False, default=None, dest='timingsFile')
+parser.add_argument('--test-timeout', help='Wall-clock limit (sec) for each of the preprocessor and the test suite, including everything they spawn', type=int, required=False, default=None, dest='testTimeout')
+parser.add_argument('--test-cpu-limit', help='CPU-time limit (sec) for each of the preprocessor and the test suite, summed over everything they spawn', type=int, required=False, default=None, dest='testCPULimit')
+parser.add_argument('--test-memory-limit', help='Memory limit (MB of RSS) for each of the preprocessor and the test suite, summed over everything they spawn', type=int, required=False, default=None, dest='testMemoryLimit')
+parser.add_argument('--test-max-procs', help='Limit on the processes the preprocessor or the test suite may run at once', type=int, required=False, default=None, dest='testMaxProcs')
 
 args = parser.parse_args()
+if args.depMirror is not None and args.depCacheDir is None:
+  parser.error('--dep-mirror requires --dep-cache-dir')
+
+testLimits = libLF.ResourceLimits(wallClockSec=args.testTimeout, cpuSec=args.testCPULimit,
+  memoryBytes=None if args.testMemoryLimit is None else args.testMemoryLimit * 1024 * 1024,
+  maxProcs=args.testMaxProcs)
 
 # Here we go!
-main(args.ghpFile, args.outFile)
+main(args.ghpFile, args.outFile, args.parallelism, args.cpuBudgetDir, args.depCacheDir, args.depMirror, testLimits, args.timingsFile)
@@ -18,7 +18,8 @@ MAVEN_CLI = '/home/davisjam/local-install/apache-maven-3.6.0/bin/mvn'
 MAVEN_CLI = 'mvn'
 libLF.checkShellDependencies([MAVEN_CLI], mustBeExecutable=True)
 
-GRADLE_USER_HOME = '/tmp/.gradle'
+# Callers may point us at a shared cache (cf. dyn-regex-extractor.py DependencyCache)
+GRADLE_USER_HOME = os.environ.get('GRADLE_USER_HOME', '/tmp/.gradle')
 
 #########
 # Classes to drive the Maven and Gradle build systems
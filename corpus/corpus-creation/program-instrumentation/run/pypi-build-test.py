@@ -24,13 +24,27 @@ class BuildSystem:
   BUILD_SYSTEM_NOSE = "nose"
   BUILD_SYSTEM_PYTEST = "pytest"
 
+  # buildFile -> shallowest dir containing it, relative to the project root (cf. indexBuildFiles)
+  # If None, we walk the project to find our buildFile
+  buildFile2relDir = None
+
   def __init__(self):
     self.name = None
     self.cli = None
     self.buildFile = None
+
+  def setBuildFileIndex(self, buildFile2relDir):
+    """Use this index instead of walking the project. It works for copies of the project too."""
+    self.buildFile2relDir = buildFile2relDir
   
   def findBuildDir(self, projRoot):
     if self.buildFile is not None:
+      if self.buildFile2relDir is not None:
+        relDir = self.buildFile2relDir.get(self.buildFile)
+        if relDir is None:
+          return None
+        return os.path.normpath(os.path.join(projRoot, relDir))
+
       libLF.log("Searching for {} under {}".format(self.buildFile, projRoot))
       buildDir = self._findShallowestDirContaining(projRoot, self.buildFile)
       return buildDir
@@ -168,6 +182,23 @@ BUILD_SYSTEMS = [
 
 ### Utilities
 
+def indexBuildFiles(projRoot, buildFiles):
+  """Walk projRoot once, looking for all of buildFiles
+
+  Returns:
+    buildFile2relDir: for each buildFile we found, the shallowest dir containing it, relative to projRoot.
+                      Tie goes to the first subdir visited by os.walk
+  """
+  buildFile2relDir = {}
+  buildFile2depth = {}
+  for dirpath, _, filenames in os.walk(projRoot):
+    depth = len(dirpath.split(os.path.sep))
+    for buildFile in buildFiles.intersection(filenames):
+      if buildFile not in buildFile2depth or depth < buildFile2depth[buildFile]:
+        buildFile2depth[buildFile] = depth
+        buildFile2relDir[buildFile] = os.path.relpath(dirpath, projRoot)
+  return buildFile2relDir
+
 def getAvailablePythonBinaries():
   optionShortNames = ["python2", "python3"]
   availablePythonBinaries = []
@@ -192,10 +223,41 @@ def determineAvailableBuildSystems(root):
     libLF.log("Error, no available build systems")
     sys.exit(1)
 
+###########
+# Build attempts
+
+# Setuptools and friends rewrite these in place, so hard-linked workspaces get private copies.
+MUTABLE_BUILD_FILES_RE = r'(\.egg-info/|(^|/)(PKG-INFO|setup\.cfg|\.coverage)$)'
+
+class BuildAttemptTask(libLF.parallel.ParallelTask):
+  """Try to build and test the project with one build system and python binary.
+
+  If workspaceBase is not None, we work in a private clone of the project, so that
+  attempts can run concurrently without tripping over each other's build artifacts.
+  Otherwise we work in projDir itself.
+  """
+  def __init__(self, buildSystem, projDir, pythonBin, workspaceBase):
+    self.buildSystem = buildSystem
+    self.projDir = projDir
+    self.pythonBin = pythonBin
+    self.workspaceBase = workspaceBase
+
+  def run(self):
+    """Returns (buildSystem name, pythonBin, testsPassed)"""
+    if self.workspaceBase is None:
+      return self._tryBuild(self.projDir)
+    with self.workspaceBase.workspace(prefix="pypi-build-test-") as workDir:
+      return self._tryBuild(workDir)
+
+  def _tryBuild(self, workDir):
+    libLF.log("Testing with python {}, buildSystem {} in {}".format(self.pythonBin, self.buildSystem.name, workDir))
+    testsPassed = self.buildSystem.tryBuild(workDir, self.pythonBin)
+    return self.buildSystem.name, self.pythonBin, testsPassed
+
 ###########
 # main
 
-def main(pypiProjDir):
+def main(pypiProjDir, nWorkers, cpuBudgetDir):
   # Which python's do we have?
   pythonBinaries = getAvailablePythonBinaries()
   if not pythonBinaries:
@@ -203,21 +265,40 @@ def main(pypiProjDir):
     sys.exit(1)
   libLF.log("Available python binaries: {}".format(pythonBinaries))
 
+  # Find every build file in one walk
+  buildFile2relDir = indexBuildFiles(pypiProjDir, set(bs.buildFile for bs in BUILD_SYSTEMS if bs.buildFile is not None))
+  for bs in BUILD_SYSTEMS:
+    bs.setBuildFileIndex(buildFile2relDir)
+
   # Which build system(s) might work on this project?
   availableBuildSystems = determineAvailableBuildSystems(pypiProjDir)
 
   # Give it a whirl
-  for buildSystem in availableBuildSystems:
-    for pythonBin in pythonBinaries:
-      libLF.log("Testing with python {}, buildSystem {}".format(pythonBin, buildSystem.name))
-      testsPassed = buildSystem.tryBuild(pypiProjDir, pythonBin)
-      if testsPassed:
-        libLF.log("Tests ran and passed (python {})".format(pythonBin))
-        # Don't exit in triump.
-        # "python setup.py test" often returns after executing 0 tests because it can't find them.
-        # Easier to just try to run the test suite using every available build system.
-      else:
-        libLF.log("Tests did not run, or ran and failed (python {})".format(pythonBin))
+  # Don't stop at the first success.
+  # "python setup.py test" often returns after executing 0 tests because it can't find them.
+  # Easier to just try to run the test suite using every available build system.
+  # The attempts are independent, so we run them at once.
+  attempts = [(buildSystem, pythonBin) for buildSystem in availableBuildSystems for pythonBin in pythonBinaries]
+  # pypiProjDir is already unpacked and instrumented. Each concurrent attempt gets a cheap clone of it.
+  workspaceBase = None
+  if 1 < len(attempts) and 1 < nWorkers:
+    workspaceBase = libLF.WorkspaceBase(pypiProjDir, copyRE=MUTABLE_BUILD_FILES_RE)
+    libLF.log("Cloning {} for each attempt by {}".format(pypiProjDir, workspaceBase.cloneMethod))
+  tasks = [BuildAttemptTask(buildSystem, pypiProjDir, pythonBin, workspaceBase) for buildSystem, pythonBin in attempts]
+
+  budget = None
+  if cpuBudgetDir is not None:
+    budget = libLF.parallel.CPUBudget(cpuBudgetDir)
+  libLF.log("Making {} build attempts, {} at a time{}".format(len(tasks), nWorkers, " (isolated)" if workspaceBase is not None else ""))
+  for result in libLF.parallel.imap_unordered_budget_genr(tasks, nWorkers, budget):
+    if isinstance(result, BaseException):
+      libLF.log("Error during a build attempt: {}".format(result))
+      continue
+    buildSystemName, pythonBin, testsPassed = result
+    if testsPassed:
+      libLF.log("Tests ran and passed (python {}, buildSystem {})".format(pythonBin, buildSystemName))
+    else:
+      libLF.log("Tests did not run, or ran and failed (python {}, buildSystem {})".format(pythonBin, buildSystemName))
 
   libLF.log("Finished attempting tests")
   sys.exit(0)
@@ -228,8 +309,10 @@ if __name__ == '__main__':
   # Parse args
   parser = argparse.ArgumentParser(description='Build and run the test suite of a Python project that uses the distutils, tox, or nox distribution system.')
   parser.add_argument('--proj-dir',  help='Project root dir', required=True, dest='projDir')
+  parser.add_argument('--parallelism', '-p', help='Maximum number of build attempts to run at once. Concurrent attempts each get a copy of the project', type=int, required=False, default=libLF.parallel.CPUCount.CPU_BOUND)
+  parser.add_argument('--cpu-budget-dir', help='libLF.parallel.CPUBudget shared with the caller. We assume the caller holds one of its slots for us, and take more as they free up', required=False, default=None, dest='cpuBudgetDir')
 
   args = parser.parse_args()
 
   # Here we go!
-  main(args.projDir)
+  main(args.projDir, args.parallelism, args.cpuBudgetDir)
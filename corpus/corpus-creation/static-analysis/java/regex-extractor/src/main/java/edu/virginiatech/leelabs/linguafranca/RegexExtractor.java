@@ -20,8 +20,13 @@ import com.github.javaparser.resolution.UnsolvedSymbolException;
 
 import com.google.common.base.Strings;
 
+import java.io.BufferedReader;
 import java.io.File;
 import java.io.IOException;
+import java.io.InputStreamReader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Paths;
 
 import java.util.regex.Pattern;
 import java.util.regex.Matcher;
@@ -234,26 +239,62 @@ public class RegexExtractor {
     return replacement;
   }
 
+  private static Output_SimpleFileWithRegexes analyzeFile(String fileName) {
+    File fileToAnalyze = new File(fileName);
+    Output_SimpleFileWithRegexes out = null;
+    try {
+      List<MyRegex> regexes = extractRegexes(fileToAnalyze);
+      out =
+        new Output_SimpleFileWithRegexes(fileName, "java", true, regexes);
+      System.err.println("Got " + regexes.size() + " regexes");
+    } catch (Exception e) {
+      System.err.println("main: Exception: " + e);
+      e.printStackTrace(System.err);
+      out =
+        new Output_SimpleFileWithRegexes(fileName, "java", false, null);
+    }
+    return out;
+  }
+
+  /**
+   * Batch mode: analyze each file named in fileList (one per line, "-" for stdin).
+   * Prints one line per file, so one JVM serves a whole project.
+   */
+  private static void analyzeFileList(String fileList) throws IOException {
+    BufferedReader reader = fileList.equals("-")
+      ? new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8))
+      : Files.newBufferedReader(Paths.get(fileList), StandardCharsets.UTF_8);
+    Gson gson = new Gson();
+    try {
+      String fileName;
+      while ((fileName = reader.readLine()) != null) {
+        if (fileName.isEmpty()) {
+          continue;
+        }
+        System.out.println(gson.toJson(analyzeFile(fileName)));
+        System.out.flush();
+      }
+    } finally {
+      reader.close();
+    }
+  }
+
   public static void main(String[] args) {
     if (args.length == 1) {
       String fileName = args[0];
-      File fileToAnalyze = new File(fileName);
-      Output_SimpleFileWithRegexes out = null;
-      try {
-        List<MyRegex> regexes = extractRegexes(fileToAnalyze);
-        out =
-          new Output_SimpleFileWithRegexes(fileName, "java", true, regexes);
-        System.err.println("Got " + regexes.size() + " regexes");
-      } catch (Exception e) {
-        System.err.println("main: Exception: " + e);
-        e.printStackTrace(System.err);
-        out =
-          new Output_SimpleFileWithRegexes(fileName, "java", false, null);
-      }
+      Output_SimpleFileWithRegexes out = analyzeFile(fileName);
       Gson gson = new Gson();
       System.out.println(gson.toJson(out));
+    } else if (args.length == 2 && args[0].equals("--file-list")) {
+      try {
+        analyzeFileList(args[1]);
+      } catch (IOException e) {
+        System.err.println("main: Could not read file list: " + e);
+        System.exit(-1);
+      }
     } else {
       System.out.println("Usage: INVOCATION file-to-analyze.java");
+      System.out.println("       INVOCATION --file-list file-list");
       System.exit(-1);
     }
   }
@@ -24,6 +24,11 @@ import java.io.File;
 import java.io.IOException;
 import java.io.InputStream;
 import java.io.InputStreamReader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.nio.file.StandardCopyOption;
 
 import java.util.regex.Pattern;
 import java.util.regex.Matcher;
@@ -123,7 +128,10 @@ public class RegexInstrumentor {
     return expr.getName().asString().equals("matches");
   }
 
-  private static void instrumentRegexes(String fileName, String outputFile) throws IOException {
+  /**
+   * @returns: the instrumented source of fileName
+   */
+  private static String instrumentRegexes(String fileName, String outputFile) throws IOException {
     File file = new File(fileName);
 
     TypeSolver reflectionTypeSolver = new ReflectionTypeSolver();
@@ -182,7 +190,49 @@ public class RegexInstrumentor {
        }
      }.visit(compilationUnit, null);
 
-      System.out.print(compilationUnit);
+      return compilationUnit.toString();
+  }
+
+  /**
+   * Batch mode: instrument each file named in fileList ("-" for stdin), so one JVM serves a whole project.
+   * Each line is "src" (rewritten in place) or "src<TAB>dest" (e.g. a parallel output tree).
+   * A file is only (re)written if we can instrument it.
+   * Prints one JSON object per file with keys: fileName instrumented
+   */
+  private static void instrumentFileList(String fileList, String outputFile) throws IOException {
+    BufferedReader reader = fileList.equals("-")
+      ? new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8))
+      : Files.newBufferedReader(Paths.get(fileList), StandardCharsets.UTF_8);
+    Gson gson = new Gson();
+    try {
+      String line;
+      while ((line = reader.readLine()) != null) {
+        if (line.isEmpty()) {
+          continue;
+        }
+        String[] fields = line.split("\t", 2);
+        String fileName = fields[0];
+        Path dest = Paths.get(fields.length == 2 ? fields[1] : fields[0]);
+
+        int instrumented = 0;
+        try {
+          String instrumentedSource = instrumentRegexes(fileName, outputFile);
+          if (dest.toAbsolutePath().getParent() != null) {
+            Files.createDirectories(dest.toAbsolutePath().getParent());
+          }
+          Path tmp = Paths.get(dest.toString() + ".instrumenting");
+          Files.write(tmp, instrumentedSource.getBytes(StandardCharsets.UTF_8));
+          Files.move(tmp, dest, StandardCopyOption.REPLACE_EXISTING, StandardCopyOption.ATOMIC_MOVE);
+          instrumented = 1;
+        } catch (Exception e) {
+          System.err.println("instrumentFileList: Exception on " + fileName + ": " + e);
+        }
+        System.out.println(gson.toJson(new InstrumentationResult(fileName, instrumented)));
+        System.out.flush();
+      }
+    } finally {
+      reader.close();
+    }
   }
 
 
@@ -254,7 +304,7 @@ public class RegexInstrumentor {
       try {
         codeTemplate = loadTemplateFile();
         // System.err.println("Template:\n" + codeTemplate);
-        instrumentRegexes(fileName, outputFile);
+        System.out.print(instrumentRegexes(fileName, outputFile));
         rc = 0;
       } catch (Exception e) {
         System.err.println("main: Exception: " + e);
@@ -262,9 +312,28 @@ public class RegexInstrumentor {
         rc = 1;
       }
       System.exit(rc);
+    } else if (args.length == 3 && args[0].equals("--file-list")) {
+      try {
+        codeTemplate = loadTemplateFile();
+        instrumentFileList(args[1], args[2]);
+      } catch (IOException e) {
+        System.err.println("main: Could not read file list: " + e);
+        System.exit(-1);
+      }
     } else {
       System.out.println("Usage: INVOCATION source-to-instrument.java regex-log-file");
+      System.out.println("       INVOCATION --file-list file-list regex-log-file");
       System.exit(-1);
     }
   }
 }
+
+// What instrumentFileList reports for each file
+class InstrumentationResult {
+  String fileName;
+  int instrumented;
+  public InstrumentationResult(String fileName, int instrumented) {
+    this.fileName = fileName;
+    this.instrumented = instrumented;
+  }
+}
@@ -18,6 +18,14 @@
  *   regex-log-file - output file where the instrumented code will write the
  *                    extracted regexes
  *
+ * Batch mode (--file-list file-list regex-log-file): instrument each file named
+ * in file-list, in one process. Each line of file-list is either
+ * "source-to-instrument.js" (rewritten in place) or
+ * "source-to-instrument.js<TAB>dest.js" (instrumented code written to dest.js,
+ * e.g. in a parallel output tree). A file is only (re)written if instrumentation
+ * succeeds. Prints one JSON object per file, in file-list order, with keys:
+ * fileName instrumented. This saves a node startup (and babel load) per file.
+ *
  * Restrictions:
  *   1. In order to output regexes, we must be able to access the FS.
  *      In browser contexts this is not possible, and our instrumentation
@@ -32,19 +40,58 @@
 "use strict";
 
 const traverse = require("./traverse").traverse,
-  fs = require("fs");
+  fs = require("fs"),
+  path = require("path");
 
 // Usage
-if (process.argv.length != 4) {
+const batchMode = (process.argv.length === 5 && process.argv[2] === '--file-list');
+if (process.argv.length != 4 && !batchMode) {
   console.log('Usage: ' + process.argv[1] + ' source-to-instrument.js regex-log-file');
+  console.log('       ' + process.argv[1] + ' --file-list file-list regex-log-file');
   console.error(`You gave ${JSON.stringify(process.argv)}`);
   process.exit(1);
 }
 
-const sourceF = process.argv[2];
-const instrumentFile = process.argv[3];
-const source = fs.readFileSync(sourceF, { encoding: 'utf8' });
+// Write instrumented sourceF to destF (atomically, so a reader never sees part of it).
+// Returns true on success.
+async function instrumentToFile(sourceF, destF, instrumentFile) {
+  try {
+    const source = fs.readFileSync(sourceF, { encoding: 'utf8' });
+    const chunks = [];
+    await traverse(source, sourceF, instrumentFile, (code) => chunks.push(code + '\n'));
+
+    fs.mkdirSync(path.dirname(destF), { recursive: true });
+    const tmpF = destF + '.instrumenting-' + process.pid;
+    fs.writeFileSync(tmpF, chunks.join(''));
+    fs.renameSync(tmpF, destF);
+    return true;
+  } catch (e) {
+    console.error(`Error instrumenting ${sourceF}: ${e}`);
+    return false;
+  }
+}
+
+async function main() {
+  if (batchMode) {
+    const fileList = (process.argv[3] === '-') ? 0 : process.argv[3]; // 0 is stdin
+    const instrumentFile = process.argv[4];
+    const lines = fs.readFileSync(fileList, { encoding: 'utf8' })
+      .split('\n')
+      .filter((line) => line.length > 0);
+    for (const line of lines) {
+      const [sourceF, destF] = line.split('\t');
+      const instrumented = await instrumentToFile(sourceF, destF || sourceF, instrumentFile);
+      console.log(JSON.stringify({ fileName: sourceF, instrumented: instrumented ? 1 : 0 }));
+    }
+  } else {
+    const sourceF = process.argv[2];
+    const instrumentFile = process.argv[3];
+    const source = fs.readFileSync(sourceF, { encoding: 'utf8' });
+
+    await traverse(source, sourceF, instrumentFile).catch((e) => {
+      console.error(e);
+    });
+  }
+}
 
-traverse(source, sourceF, instrumentFile).catch((e) => {
-  console.error(e);
-});
+main();
@@ -11,16 +11,31 @@ const parse = require("@babel/parser").parse,
   types = require("babel-types"),
   fs = require("fs");
 
-module.exports.traverse = function(source, sourceF, instrumentFile) {
+// emit: where to send the output (instrumented code, or JSON of the regexes). Default: console.log
+// Parse TypeScript directly rather than transpiling it first.
+// Type annotations do not change which regexes a file declares.
+function parserPlugins(sourceF) {
+  if (/\.tsx$/i.test(sourceF)) {
+    return ["typescript", "jsx"];
+  } else if (/\.ts$/i.test(sourceF)) {
+    return ["typescript"];
+  }
+  return [];
+}
+
+module.exports.traverse = function(source, sourceF, instrumentFile, emit) {
+  emit = emit || console.log;
   return new Promise((resolve, reject) => {
     let ast = 0;
     ast = parse(source, {
         sourceType: "module",
+        plugins: parserPlugins(sourceF),
     });
 
     if (!ast) {
       ast = parse(source, {
           sourceType: "script",
+          plugins: parserPlugins(sourceF),
       });
     }
 
@@ -84,12 +99,19 @@ module.exports.traverse = function(source, sourceF, instrumentFile) {
         // Create a template node. The instrumentation code is wrapped in an
         // immediately-invoked anonymous function that writes the regex to a
         // file and then returns it.
+        // Test suites may evaluate a regex millions of times, so each process
+        // writes a given line only once (global.__lfRegexLogSeen is shared by
+        // every instrumented module).
         const instrumentation = template(`
           (()=>{
             const regexp = new RegExp(REGEXP);
-            const fs = require('fs');
             const obj = {'file': SOURCEF, 'pattern': regexp.source, 'flags': regexp.flags };
-            fs.writeFileSync(FILE, JSON.stringify(obj) + "\\n", {flag: "a"});
+            const line = JSON.stringify(obj) + "\\n";
+            const seen = (global.__lfRegexLogSeen = global.__lfRegexLogSeen || new Set());
+            if (!seen.has(FILE + line)) {
+              seen.add(FILE + line);
+              require('fs').writeFileSync(FILE, line, {flag: "a"});
+            }
             return regexp;
           })()
         `);
@@ -103,7 +125,7 @@ module.exports.traverse = function(source, sourceF, instrumentFile) {
         }));
       });
 
-      console.log(generate(ast).code);
+      emit(generate(ast).code);
     } else {
 
       const fullObj = {
@@ -112,7 +134,8 @@ module.exports.traverse = function(source, sourceF, instrumentFile) {
         couldParse: 1,
         regexes: regexObjs
       };
-      console.log(JSON.stringify(fullObj));
+      emit(JSON.stringify(fullObj));
     }
+    resolve();
   });
 }
@@ -33,6 +33,15 @@
 #       funcName is the re module function being invoked
 #       pattern and flags are each either a string or 'DYNAMIC-{PATTERN|FLAGS}'
 #       If the regexp invocation cannot have flags, the flags string will be 'FLAGLESS' instead
+#
+#   Batch mode (--file-list file-list, '-' for stdin) prints one such object per line, one per file.
+#   Files that do not parse are reported with couldParse false, so the caller can retry them
+#   with the other interpreter.
+#
+# Library use:
+#   static-regex-extractor.py imports this file and calls extractRegexesFromSource
+#   in-process, so it must stay importable (no work at import time).
+#   Set QUIET to silence the per-node logging.
 
 import os
 import subprocess
@@ -87,8 +96,24 @@ func_to_flagsIndex = { 'compile': 1,
                           'subn': 4
                         }
 
+# Set by callers who import us
+QUIET = False
+
 def log (msg):
-  sys.stderr.write('{}\n'.format(msg))
+  if not QUIET:
+    sys.stderr.write('{}\n'.format(msg))
+
+def getStringLiteral(node):
+  """Returns the string if this AST node is a string literal, else None.
+
+  String literals are ast.Str in python2 and ast.Constant in python3.8+"""
+  if hasattr(ast, 'Constant') and type(node) is ast.Constant:
+    if isinstance(node.value, str):
+      return node.value
+    return None
+  if type(node) is getattr(ast, 'Str', None):
+    return node.s
+  return None
 
 class RegexpInstance():
   funcName = ''
@@ -148,6 +173,14 @@ class ASTWalkerForFlags(ast.NodeVisitor):
     log('ASTWalkerForFlags: got num {}'.format(node.n))
     self.flags.append('{}'.format(node.n))
 
+  # python3.8+ has Constant instead of Num
+  def visit_Constant(self, node):
+    if type(node.value) in (int, float, complex):
+      log('ASTWalkerForFlags: got num {}'.format(node.value))
+      self.flags.append('{}'.format(node.value))
+    else:
+      self.generic_visit(node)
+
   # All Names should be 're'
   def visit_Name(self, node):
     # Must be Name node of an Attribute, where name is an re alias
@@ -228,9 +261,9 @@ class ASTWalkerForRegexps(ast.NodeVisitor):
         log(ast.dump(node))
 
         # Get pattern
-        if type(node.args[0]) is ast.Str:
+        pattern = getStringLiteral(node.args[0])
+        if pattern is not None:
           log('Pattern is static')
-          pattern = node.args[0].s
         else:
           log('Pattern is dynamic')
           pattern = 'DYNAMIC-PATTERN'
@@ -296,10 +329,60 @@ def countLOC(sourcefile):
   else:
     return -1
 
+def extractRegexesFromSource(content, sourcefile):
+  """Returns the fileInfo object for this source code. Raises on parse errors."""
+  root = ast.parse(content, sourcefile)
+
+  walker = ASTWalkerForRegexps()
+  walker.visit(root)
+
+  fileInfo = { 'fileName': sourcefile,
+               'couldParse': True,
+               'regexes': [regexp.__dict__ for regexp in walker.getRegexps()],
+               'language': 'python'
+             }
+  return fileInfo
+
+def extractRegexesFromFile(sourcefile):
+  """Returns the fileInfo object for sourcefile. Raises on parse errors."""
+  with open(sourcefile, 'r') as FH:
+    return extractRegexesFromSource(FH.read(), sourcefile)
+
+def mainFileList(fileList):
+  """Batch mode: one line of output per file in fileList ('-' for stdin).
+
+  Files we cannot parse are reported with couldParse False,
+  so the caller can retry them with a different Python interpreter.
+  """
+  if fileList == '-':
+    sourcefiles = sys.stdin.read().splitlines()
+  else:
+    with open(fileList, 'r') as FH:
+      sourcefiles = FH.read().splitlines()
+
+  for sourcefile in sourcefiles:
+    if not sourcefile:
+      continue
+    try:
+      fileInfo = extractRegexesFromFile(sourcefile)
+    except Exception as e:
+      log('Could not parse {}: {}'.format(sourcefile, e))
+      fileInfo = { 'fileName': sourcefile,
+                   'couldParse': False,
+                   'regexes': [],
+                   'language': 'python'
+                 }
+    sys.stdout.write(json.dumps(fileInfo) + '\n')
+    sys.stdout.flush()
+
 def main():
   # Usage
+  if len(sys.argv) == 3 and sys.argv[1] == '--file-list':
+    mainFileList(sys.argv[2])
+    sys.exit(0)
   if len(sys.argv) != 2:
     log('Usage: {} python-file.py'.format(sys.argv[0]))
+    log('       {} --file-list file-list'.format(sys.argv[0]))
     sys.exit(1)
 
   # Check for dependencies
@@ -323,21 +406,8 @@ def main():
 
   # Read file and prep an AST.
   try:
-    with open(sourcefile, 'r') as FH:
-      content = FH.read()
-      root = ast.parse(content, sourcefile)
-  
-      walker = ASTWalkerForRegexps()
-      walker.visit(root)
-      
-      fileInfo = { 'fileName': sourcefile,
-                   'couldParse': True,
-                   'regexes': [regexp.__dict__ for regexp in walker.getRegexps()],
-                   'language': 'python'
-                 }
-      
-      sys.stdout.write(json.dumps(fileInfo) + '\n')
-      
+    fileInfo = extractRegexesFromFile(sourcefile)
+    sys.stdout.write(json.dumps(fileInfo) + '\n')
   except Exception as e:
     # Easy-to-parse to stdout
     errMsg = 'Something went wrong, perhaps try with a different Python interpreter'
@@ -350,4 +420,5 @@ def main():
     # Byee
     sys.exit(1)
 
-main()
+if __name__ == '__main__':
+  main()
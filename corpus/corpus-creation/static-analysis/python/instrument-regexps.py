@@ -2,6 +2,7 @@ from __future__ import print_function
 import ast
 import astor # Convert AST to source
 import json
+import os
 import sys
 
 sourceFile = ''
@@ -15,32 +16,42 @@ def log(msg):
     sys.stderr.write('{}\n'.format(msg))
 
 
+# Instrumented code reports its regexes through this module, which lives alongside us.
+runtimeModuleDir = os.path.dirname(os.path.realpath(__file__))
+runtimeModuleAlias = '_lfRegexLog'
+
+# Inserted at the top of each instrumented file.
+# The project's tests may run in a virtualenv (e.g. tox) that ignores our PYTHONPATH,
+# so we tell it where to find lfRegexLog.
+preambleCode = """
+import sys as _lfSys
+if {dir} not in _lfSys.path:
+    _lfSys.path.append({dir})
+import lfRegexLog as {alias}
+"""
+
 # Wrap the given regex node with the instrumentation template.
 def instrumentNode(node):
-    # Create AST node for lambda function that writes a regex to a file and
-    # returns it. Since lambda functions do not allow statements, wrap the file
-    # methods in a tuple expression.
-    templateCode = r"""lambda regex, flags, f, srcFile, json:(f.write(json.dumps({"file": srcFile, "pattern": regex, "flags": flags}) + '\n'), f.close(), regex)[2]"""
-    template = ast.parse(templateCode, mode='eval')
-
-    # Create AST node for call to open() for writing to the regex file.
-    openCall = ast.Call(func=ast.Name(id='open', cxt=ast.Load()),
-        args=[ast.Str(outputFile), ast.Str('a')], keywords=[])
-
-    # Create AST node for call to __import__() to pass the json library to the
-    # lambda since we can't use an import statement in a lambda body.
-    importCall = ast.Call(func=ast.Name(id='__import__', cxt=ast.Load()),
-        args=[ast.Str('json')], keywords=[])
-
-    # Create AST node to immediately call the lambda function. Pass the original
-    # regex node, flags (unimplemented), the open() call, and soure file name to
-    # the lambda function.
-    return ast.Call(func=template, args=[node, ast.Str('UNKNOWN'), openCall, ast.Str(sourceFile), importCall], keywords=[])
+    # Create AST node for a call to the runtime module, which logs the regex
+    # (once per process) and returns it. Pass the original regex node, flags
+    # (unimplemented), source file name, and regex log file.
+    logFunc = ast.Attribute(value=ast.Name(id=runtimeModuleAlias, ctx=ast.Load()), attr='log', ctx=ast.Load())
+    return ast.Call(func=logFunc, args=[node, ast.Str('UNKNOWN'), ast.Str(sourceFile), ast.Str(outputFile)], keywords=[])
+
+def insertPreamble(tree):
+    """Import the runtime module in this ast.Module, after any docstring and __future__ imports"""
+    preamble = ast.parse(preambleCode.format(dir=repr(runtimeModuleDir), alias=runtimeModuleAlias)).body
+
+    i = 1 if ast.get_docstring(tree) is not None else 0
+    while i < len(tree.body) and isinstance(tree.body[i], ast.ImportFrom) and tree.body[i].module == '__future__':
+        i += 1
+    tree.body[i:i] = preamble
 
 # Walk full AST for regexps
 class RegexInstrumentor(ast.NodeTransformer):
     def __init__(self):
         self.reAliases = list()
+        self.nInstrumented = 0
 
     # ImportFrom: Detect missed aliases for re functions
     def visit_ImportFrom(self, node):
@@ -73,6 +84,7 @@ class RegexInstrumentor(ast.NodeTransformer):
 
               if funcID in self.reAliases and funcName in regexpFuncNames:
                   node.args[0] = instrumentNode(node.args[0])
+                  self.nInstrumented += 1
         except Exception as e:
             log(e)
             pass
@@ -83,24 +95,88 @@ class RegexInstrumentor(ast.NodeTransformer):
         return node
 
 
-# Usage
-if len(sys.argv) != 3:
-    log('Usage: {} source-to-instrument.py regex-log-file'.format(sys.argv[0]))
-    sys.exit(1)
-
-sourceFile = sys.argv[1]
-outputFile = sys.argv[2]
-
-# Read file and prep an AST.
-try:
-    with open(sourceFile, 'r') as f:
-        tree = ast.parse(f.read(), sourceFile)
-        instrumentedTree = RegexInstrumentor().visit(tree)
-        ast.fix_missing_locations(instrumentedTree)
-        print(astor.to_source(tree))
-
-except Exception as e:
-    # Easy-to-parse to stdout
-    log(e)
-    log('Could not instrument file.')
-    sys.exit(1)
+def instrumentSource(content, sourcefile):
+    """Returns the instrumented version of content, the source of sourcefile"""
+    global sourceFile
+    sourceFile = sourcefile
+    tree = ast.parse(content, sourceFile)
+    instrumentor = RegexInstrumentor()
+    instrumentedTree = instrumentor.visit(tree)
+    if instrumentor.nInstrumented:
+        insertPreamble(instrumentedTree)
+    ast.fix_missing_locations(instrumentedTree)
+    return astor.to_source(tree)
+
+def writeFileAtomically(fileName, content):
+    dirName = os.path.dirname(fileName)
+    if dirName and not os.path.isdir(dirName):
+        try:
+            os.makedirs(dirName)
+        except OSError:
+            pass # Someone else made it
+    tmpFileName = '{}.instrumenting-{}'.format(fileName, os.getpid())
+    with open(tmpFileName, 'w') as f:
+        f.write(content)
+    os.rename(tmpFileName, fileName)
+
+def mainFileList(fileList):
+    """Batch mode: instrument each file in fileList ('-' for stdin).
+
+    Each line is "src" (rewritten in place) or "src<TAB>dest".
+    A file is only (re)written if we can instrument it.
+    Prints one JSON object per file with keys: fileName instrumented
+    """
+    if fileList == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(fileList, 'r') as f:
+            lines = f.read().splitlines()
+
+    for line in lines:
+        if not line:
+            continue
+        fields = line.split('\t')
+        src = fields[0]
+        dest = fields[1] if len(fields) > 1 else src
+
+        instrumented = 0
+        try:
+            with open(src, 'r') as f:
+                content = f.read()
+            writeFileAtomically(dest, instrumentSource(content, src))
+            instrumented = 1
+        except Exception as e:
+            log(e)
+            log('Could not instrument file {}.'.format(src))
+        print(json.dumps({'fileName': src, 'instrumented': instrumented}))
+        sys.stdout.flush()
+
+def main():
+    global outputFile
+
+    # Usage
+    if len(sys.argv) == 4 and sys.argv[1] == '--file-list':
+        outputFile = sys.argv[3]
+        mainFileList(sys.argv[2])
+        sys.exit(0)
+
+    if len(sys.argv) != 3:
+        log('Usage: {} source-to-instrument.py regex-log-file'.format(sys.argv[0]))
+        log('       {} --file-list file-list regex-log-file'.format(sys.argv[0]))
+        sys.exit(1)
+
+    outputFile = sys.argv[2]
+
+    # Read file and prep an AST.
+    try:
+        with open(sys.argv[1], 'r') as f:
+            print(instrumentSource(f.read(), sys.argv[1]))
+
+    except Exception as e:
+        # Easy-to-parse to stdout
+        log(e)
+        log('Could not instrument file.')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# Author: Jamie Davis <davisjam@vt.edu>
+# Description: Runtime support for python code instrumented by instrument-regexps.py
+#
+# Instrumented code calls log() each time it evaluates a regex.
+# A test suite may evaluate the same regex millions of times,
+# so we only write each (file, pattern, flags) once per process,
+# through one open handle per regex log file.
+# We flush each line as we write it: the program under test may die by signal
+# (e.g. a test timeout) or os._exit, so we cannot count on running at exit.
+#
+# Must work under both python2 and python3: instrumented projects may use either.
+# Must never raise: we run inside the program under test.
+
+import json
+
+_seen = set() # (logFile, srcFile, pattern, flags)
+_logFile2handle = {}
+
+def _patternToJSON(regex):
+    """Patterns may be str, bytes, or already-compiled"""
+    pattern = getattr(regex, 'pattern', regex)
+    if isinstance(pattern, bytes) and not isinstance(pattern, str):
+        pattern = pattern.decode('latin-1')
+    return pattern
+
+def log(regex, flags, srcFile, logFile):
+    """Record that srcFile evaluated regex. Returns regex."""
+    try:
+        pattern = _patternToJSON(regex)
+        key = (logFile, srcFile, pattern, flags)
+        if key in _seen:
+            return regex
+        _seen.add(key)
+
+        handle = _logFile2handle.get(logFile)
+        if handle is None:
+            handle = open(logFile, 'a')
+            _logFile2handle[logFile] = handle
+        handle.write(json.dumps({'file': srcFile, 'pattern': pattern, 'flags': flags}) + '\n')
+        handle.flush()
+    except Exception:
+        pass
+    return regex
@@ -8,6 +8,7 @@ use warnings;
 
 use IPC::Cmd qw[can_run]; # Check PATH
 use JSON::PP; # I/O
+use File::Temp qw(tempfile);
 
 # Check dependencies.
 if (not defined $ENV{REGEX_GENERALIZABILITY_PROJECT_ROOT}) {
@@ -29,8 +30,12 @@ if (not can_run("python3")) {
 }
 
 # Check args.
+if (scalar(@ARGV) == 2 and $ARGV[0] eq "--file-list") {
+  &extractFileList($ARGV[1]);
+  exit 0;
+}
 if (scalar(@ARGV) != 1) {
-  die "Usage: $0 python-filename.py\n";
+  die "Usage: $0 python-filename.py\n       $0 --file-list file-list\n";
 }
 
 my $pythonFile = $ARGV[0];
@@ -64,6 +69,64 @@ else {
 
 ########
 
+# Batch mode: one python2 process for all of the files, then one python3 process for the files python2 could not parse.
+# Prints one line per file, as soon as we have it: files that parse as we go, then the rest.
+sub extractFileList {
+  my ($fileList) = @_;
+
+  local $| = 1; # Flush each line
+
+  my @pythonFiles = grep { length($_) } split("\n", &readFile($fileList));
+  my %done;
+  my @todo = @pythonFiles;
+  for my $python ("python2", "python3") {
+    last if not @todo;
+
+    my ($listFH, $listFile) = tempfile("extract-python-regexes-XXXXXX", TMPDIR => 1, UNLINK => 1);
+    print $listFH join("\n", @todo) . "\n";
+    close($listFH);
+
+    if (open(my $PIPE, '-|', "$python $extractRegexps --file-list '$listFile'")) {
+      while (my $line = <$PIPE>) {
+        chomp $line;
+        my $result = eval { decode_json($line) };
+        next if not defined $result or not defined $result->{fileName};
+        if ($result->{couldParse} and not $done{$result->{fileName}}) {
+          $done{$result->{fileName}} = 1;
+          print STDOUT "$line\n";
+        }
+      }
+      close($PIPE);
+    }
+    else {
+      print STDERR "Could not run $python: $!\n";
+    }
+    @todo = grep { not $done{$_} } @todo;
+    if (@todo) {
+      print STDERR "Could not extract regexes from " . scalar(@todo) . " files using $python\n";
+    }
+  }
+
+  for my $pythonFile (@todo) {
+    my $out = { "fileName"   => $pythonFile,
+                "couldParse" => 0
+              };
+    print STDOUT encode_json($out) . "\n";
+  }
+}
+
+sub readFile {
+  my ($file) = @_;
+  if ($file eq "-") {
+    local $/;
+    return <STDIN>;
+  }
+  open(my $FH, '<', $file) or die "Error, could not open $file: $!\n";
+  my $contents = do { local $/; <$FH> };
+  close($FH);
+  return $contents;
+}
+
 sub cmd {
   my ($cmd) = @_;
   my $out = `$cmd`;
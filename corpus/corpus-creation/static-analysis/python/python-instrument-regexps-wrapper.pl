@@ -8,6 +8,7 @@ use warnings;
 
 use IPC::Cmd qw[can_run]; # Check PATH
 use JSON::PP; # I/O
+use File::Temp qw(tempfile);
 
 # Check dependencies.
 if (not defined $ENV{REGEX_GENERALIZABILITY_PROJECT_ROOT}) {
@@ -29,8 +30,12 @@ if (not can_run("python3")) {
 }
 
 # Check args.
+if (scalar(@ARGV) == 3 and $ARGV[0] eq "--file-list") {
+  &instrumentFileList($ARGV[1], $ARGV[2]);
+  exit 0;
+}
 if (scalar(@ARGV) != 2) {
-  die "Usage: $0 python-filename.py regex-log-file\n";
+  die "Usage: $0 python-filename.py regex-log-file\n       $0 --file-list file-list regex-log-file\n";
 }
 
 my $pythonFile = $ARGV[0];
@@ -60,6 +65,57 @@ else {
 
 ########
 
+# Batch mode: one python2 process for all of the files, then one python3 process for the files python2 could not instrument.
+# Each line of the file list is "src" (rewritten in place) or "src<TAB>dest".
+# Prints one line per file.
+sub instrumentFileList {
+  my ($fileList, $regexLogFile) = @_;
+
+  my @lines = grep { length($_) } split("\n", &readFile($fileList));
+  my %file2instrumented;
+  my @todo = @lines;
+  for my $python ("python2", "python3") {
+    last if not @todo;
+
+    my ($listFH, $listFile) = tempfile("instrument-python-regexes-XXXXXX", TMPDIR => 1, UNLINK => 1);
+    print $listFH join("\n", @todo) . "\n";
+    close($listFH);
+
+    my ($rc, $out) = &cmd("$python $extractRegexps --file-list '$listFile' '$regexLogFile'");
+    for my $line (split("\n", $out)) {
+      my $result = eval { decode_json($line) };
+      next if not defined $result or not defined $result->{fileName};
+      if ($result->{instrumented}) {
+        $file2instrumented{$result->{fileName}} = 1;
+      }
+    }
+    @todo = grep { not $file2instrumented{(split("\t", $_))[0]} } @todo;
+    if (@todo) {
+      print STDERR "Could not instrument " . scalar(@todo) . " files using $python\n";
+    }
+  }
+
+  for my $line (@lines) {
+    my $pythonFile = (split("\t", $line))[0];
+    my $out = { "fileName"     => $pythonFile,
+                "instrumented" => ($file2instrumented{$pythonFile} ? 1 : 0)
+              };
+    print STDOUT encode_json($out) . "\n";
+  }
+}
+
+sub readFile {
+  my ($file) = @_;
+  if ($file eq "-") {
+    local $/;
+    return <STDIN>;
+  }
+  open(my $FH, '<', $file) or die "Error, could not open $file: $!\n";
+  my $contents = do { local $/; <$FH> };
+  close($FH);
+  return $contents;
+}
+
 sub cmd {
   my ($cmd) = @_;
   my $out = `$cmd`;
@@ -16,6 +16,10 @@ import tarfile
 import re
 import subprocess
 import shutil
+import tempfile
+import importlib.util
+import contextlib
+import json
 
 #######
 # Globals
@@ -23,32 +27,7 @@ import shutil
 
 CLEAN_TMP_DIR = True # TODO
 
-registryToExtensionLists = {
-    'crates.io': [r'\.rs', r'\.rlib'],
-    'cpan': [r'\.pl', r'\.pm'],
-    'npm': [r'\.js', r'\.ts'],
-    'pypi': [r'\.py'],
-    'maven': [r'\.java'],
-    'rubygems': [r'\.rb'],
-    'packagist': [r'\.php'],
-    'nuget': [r'\.cs'],
-    'godoc': [r'\.go']
-}
-
-extensionToLang = {
-    r'\.rs': 'rust',
-    r'\.rlib': 'rust',
-    r'\.pl': 'Perl',
-    r'\.pm': 'Perl',
-    r'\.js': 'javascript',
-    r'\.ts': 'typescript',
-    r'\.py': 'python',
-    r'\.java': 'Java',
-    r'\.rb': 'Ruby',
-    r'\.php': 'PHP',
-    r'\.cs': 'c#',
-    r'\.go': 'go'
-}
+# Source file extensions: libLF.registryToExtensionLists, libLF.extensionToLang
 
 registryToFileOutputRE = {
     'cpan': ['Perl'],
@@ -98,6 +77,28 @@ langToExtractorPath = {
     'java': os.path.join(extractorDir, 'java', 'regex-extractor', 'release', 'regex-extractor-1.0.jar'),
 }
 
+# Python regexes are extracted in-process with this module's AST walker
+pythonExtractorPath = os.path.join(extractorDir, 'python', 'extract-regexps.py')
+
+# The code that determines each language's extraction results, for libLF.ExtractionCache
+langToExtractorFiles = {
+    'javascript': [langToExtractorPath['javascript'], os.path.join(extractorDir, 'js', 'traverse.js')],
+    'typescript': [langToExtractorPath['typescript'], langToExtractorPath['javascript'], os.path.join(extractorDir, 'js', 'traverse.js'), os.path.join(extractorDir, 'ts', 'transpile-ts2js-tsc.js')],
+    'python': [pythonExtractorPath],
+    'java': [langToExtractorPath['java']],
+}
+_pythonExtractor = None
+
+def getPythonExtractor():
+    """Returns the python/extract-regexps.py module, imported on first use"""
+    global _pythonExtractor
+    if _pythonExtractor is None:
+        spec = importlib.util.spec_from_file_location('extract_regexps', pythonExtractorPath)
+        _pythonExtractor = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_pythonExtractor)
+        _pythonExtractor.QUIET = True
+    return _pythonExtractor
+
 def cleanUp(tmpDir):
     if CLEAN_TMP_DIR:
         libLF.log('cleanUp: Wiping {}'.format(tmpDir))
@@ -107,54 +108,327 @@ def cleanUp(tmpDir):
         except:
             pass
 
-def runExtractor(sourceFile, extractor, registry):
-    libLF.log('Extracting regexes from {} using {}'.format(sourceFile['name'], extractor))
+# A sourceFile is a dict:
+#   name: how we report the file (its path in the project)
+#   path: where to read it, if not at name (optional)
+#   content: its bytes, if we streamed it out of a tarball (optional)
 
+def sourceFilePath(sourceFile):
+    return sourceFile.get('path', sourceFile['name'])
+
+def sfwrToRegexUsages(sfwr, sourceFile):
+    """Convert an extractor's SimpleFileWithRegexes for sourceFile to a RegexUsage[]"""
+    if not sfwr.couldParse:
+      libLF.log('Could not parse: {}'.format(sourceFile['name']))
+
+    # TODO ruList = libLF.sfwrToRegexUsageList(sfwr)
+    ruList = []
+    for regex in sfwr.regexes:
+        ru = libLF.RegexUsage()
+        basePath = os.path.basename(sourceFile['name'])
+        ru.initFromRaw(regex['pattern'], regex['flags'], None, None, sourceFile['name'], basePath)
+        ruList.append(ru)
+    libLF.log('Got {} regexes from {}'.format(len(ruList), sourceFile['name']))
+    return ruList
+
+def extractorInvocation(extractor):
+    """Returns the argv prefix to run this extractor"""
     # Any special invocation recipe?
     if extractor.endswith(".jar"):
-        invocationPrefix = "java -jar"
-    else:
-        invocationPrefix = ""
+        return ["java", "-jar", extractor]
+    return [extractor]
+
+def runExtractor(sourceFile, extractor, registry, invocation=None):
+    """Extract regexes from sourceFile with its own extractor process.
+
+    Returns a SimpleFileWithRegexes, or None on failure."""
+    libLF.log('Extracting regexes from {} using {}'.format(sourceFile['name'], extractor))
 
     try:
         # Extract
-        cmd = "{} '{}' '{}' 2>/dev/null".format(invocationPrefix, extractor, sourceFile['name'])
+        cmd = "{} 2>/dev/null".format(' '.join("'{}'".format(arg) for arg in (invocation or extractorInvocation(extractor)) + [sourceFilePath(sourceFile)]))
         out = libLF.chkcmd(cmd)
         try:
             sfwr = libLF.SimpleFileWithRegexes()
             sfwr.initFromNDJSON(out)
-            if not sfwr.couldParse:
-              libLF.log('Could not parse: {}'.format(sourceFile['name']))
-
-            # TODO ruList = libLF.sfwrToRegexUsageList(sfwr)
-            ruList = []
-            for regex in sfwr.regexes:
-                ru = libLF.RegexUsage()
-                basePath = os.path.basename(sourceFile['name'])
-                ru.initFromRaw(regex['pattern'], regex['flags'], None, None, sourceFile['name'], basePath)
-                ruList.append(ru)
-            libLF.log('Got {} regexes from {}'.format(len(ruList), sourceFile['name']))
-            return ruList
+            return sfwr
         except KeyboardInterrupt:
             raise
         except Exception as err:
-            libLF.log('Error converting output from SFWR to RU: {}\n  {}'.format(out, err))
+            libLF.log('Error parsing extractor output as SFWR: {}\n  {}'.format(out, err))
     except KeyboardInterrupt:
         raise 
     except BaseException as err:
         libLF.log('Error extracting regexes from {} using {}: {}'.format(sourceFile['name'], extractor, err))
 
-def extractRegexes(registry, lang, sourceFile):
-    """Extract regexes from this sourceFile."""
-    output = runExtractor(sourceFile, langToExtractorPath[lang], registry)
-    return output
+def runExtractorBatch(sourceFiles, extractor, registry, invocation=None):
+    """Extract regexes from all of these sourceFiles with one extractor process.
+
+    The extractor is run in batch mode (--file-list) and its per-file results are
+    streamed back as they are printed, so we pay its start-up cost once per language
+    rather than once per file.
+    Any file the extractor does not report on (e.g. because it crashed part-way)
+    is retried on its own using runExtractor.
+
+    invocation overrides extractorInvocation(extractor), e.g. to pick an interpreter.
+
+    Yields (sourceFile, SimpleFileWithRegexes or None) for each sourceFile.
+    """
+    libLF.log('Extracting regexes from {} files using {}'.format(len(sourceFiles), extractor))
+    path2sourceFile = { sourceFilePath(sourceFile): sourceFile for sourceFile in sourceFiles }
+    reported = set()
+
+    with tempfile.NamedTemporaryFile(mode='w', prefix='static-regex-extractor-', suffix='.txt') as fileList:
+        fileList.write(''.join(sourceFilePath(sourceFile) + '\n' for sourceFile in sourceFiles))
+        fileList.flush()
+
+        cmd = (invocation or extractorInvocation(extractor)) + ['--file-list', fileList.name]
+        libLF.log('CMD: {}'.format(' '.join(cmd)))
+        try:
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True) as proc:
+                for line in proc.stdout:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    sourceFile = None
+                    try:
+                        obj = libLF.fromNDJSON(line)
+                        sourceFile = path2sourceFile.get(obj['fileName'])
+                        if sourceFile is None or sourceFile['name'] in reported:
+                            libLF.log('Ignoring unexpected extractor output: {}'.format(line))
+                            continue
+                        reported.add(sourceFile['name'])
+
+                        sfwr = libLF.SimpleFileWithRegexes()
+                        sfwr.initFromNDJSON(line)
+                    except KeyboardInterrupt:
+                        raise
+                    except Exception as err:
+                        libLF.log('Error parsing extractor output as SFWR: {}\n  {}'.format(line, err))
+                        sfwr = None
+                    if sourceFile is not None:
+                        yield sourceFile, sfwr
+            if proc.returncode != 0:
+                libLF.log('Extractor {} exited with rc {}'.format(extractor, proc.returncode))
+        except OSError as err:
+            libLF.log('Error extracting regexes using {}: {}'.format(extractor, err))
+
+    # Fall back to one-at-a-time for anything the batch missed
+    for sourceFile in sourceFiles:
+        if sourceFile['name'] not in reported:
+            libLF.log('Batch extraction did not report on {}, retrying it alone'.format(sourceFile['name']))
+            yield sourceFile, runExtractor(sourceFile, extractor, registry, invocation=invocation)
+
+def extractPythonRegexesFromFile(sourceFile):
+    """Extract regexes from one python file in-process, with the running interpreter.
+
+    Returns a SimpleFileWithRegexes. couldParse is False on syntax errors."""
+    sfwr = libLF.SimpleFileWithRegexes()
+    try:
+        content = sourceFile.get('content')
+        if content is None:
+            with open(sourceFilePath(sourceFile), 'rb') as inStream:
+                content = inStream.read()
+        fileInfo = getPythonExtractor().extractRegexesFromSource(content, sourceFile['name'])
+        sfwr.initFromRaw(fileInfo['fileName'], fileInfo['language'], fileInfo['couldParse'], fileInfo['regexes'])
+    except KeyboardInterrupt:
+        raise
+    except Exception as err:
+        # Usually a SyntaxError. The caller will try python2.
+        sfwr.initFromRaw(sourceFile['name'], 'python', False, [])
+    return sfwr
+
+def extractPythonRegexesBatch(sourceFiles):
+    """Extract regexes from these python files in-process.
+
+    Files the running interpreter cannot parse (e.g. python2-only syntax) are
+    handed to python2 in one batch-mode process, if python2 is available.
+
+    Yields (sourceFile, SimpleFileWithRegexes or None).
+    """
+    libLF.log('Extracting regexes from {} python files in-process'.format(len(sourceFiles)))
+    needPython2 = []
+    for sourceFile in sourceFiles:
+        sfwr = extractPythonRegexesFromFile(sourceFile)
+        if sfwr.couldParse:
+            yield sourceFile, sfwr
+        else:
+            needPython2.append((sourceFile, sfwr))
+
+    if needPython2:
+        libLF.log('{} python files did not parse in-process, trying python2'.format(len(needPython2)))
+        if shutil.which('python2') is None:
+            libLF.log('No python2 in PATH, so these files could not be parsed')
+            yield from needPython2
+        else:
+            with sourceFilesOnDisk([sourceFile for sourceFile, _ in needPython2]) as onDisk:
+                yield from runExtractorBatch(onDisk, pythonExtractorPath, 'pypi', invocation=['python2', pythonExtractorPath])
+
+@contextlib.contextmanager
+def sourceFilesOnDisk(sourceFiles):
+    """Yields sourceFiles, readable on disk.
+
+    Streamed sourceFiles (with in-memory content) are spooled to a tmp dir
+    for the duration, for the extractors that can only read files.
+    Only one chunk is on disk at a time."""
+    if not any('content' in sourceFile for sourceFile in sourceFiles):
+        yield sourceFiles
+        return
+
+    with tempfile.TemporaryDirectory(prefix='static-regex-extractor-spool-') as spoolDir:
+        onDisk = []
+        for i, sourceFile in enumerate(sourceFiles):
+            if 'content' not in sourceFile:
+                onDisk.append(sourceFile)
+                continue
+            # Keep the basename, extractors may care about the extension
+            path = os.path.join(spoolDir, str(i), os.path.basename(sourceFile['name']))
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as outStream:
+                outStream.write(sourceFile['content'])
+            onDisk.append({ 'name': sourceFile['name'], 'path': path })
+        yield onDisk
+
+def extractRegexesBatch(registry, lang, sourceFiles):
+    """Extract regexes from these sourceFiles, all in language lang.
+
+    Python is handled in-process. Other languages use their extractor in batch mode.
+
+    Yields (sourceFile, SimpleFileWithRegexes or None)."""
+    if lang == 'python':
+        yield from extractPythonRegexesBatch(sourceFiles)
+    else:
+        with sourceFilesOnDisk(sourceFiles) as onDisk:
+            yield from runExtractorBatch(onDisk, langToExtractorPath[lang], registry)
+
+def readSourceFile(sourceFile):
+    """Returns the bytes of sourceFile"""
+    if 'content' in sourceFile:
+        return sourceFile['content']
+    with open(sourceFilePath(sourceFile), 'rb') as inStream:
+        return inStream.read()
+
+class ExtractionTask(libLF.parallel.ParallelTask):
+    """Extract regexes from a chunk of a project's files, all in one language"""
+    def __init__(self, registry, lang, sourceFiles, cacheDir=None):
+        self.registry = registry
+        self.lang = lang
+        self.sourceFiles = sourceFiles
+        self.cacheDir = cacheDir
+
+    def run(self):
+        """Returns [(sourceFile, RegexUsage[] or None), ...]"""
+        results = []
+
+        # Consult the cache
+        toExtract = self.sourceFiles
+        name2contentHash = {}
+        if self.cacheDir:
+            cache = libLF.ExtractionCache(self.cacheDir, langToExtractorFiles, inProcessLangs=['python'])
+            toExtract = []
+            for sourceFile in self.sourceFiles:
+                try:
+                    contentHash = libLF.hashBytes(readSourceFile(sourceFile))
+                except OSError as err:
+                    libLF.log('Could not read {}: {}'.format(sourceFile['name'], err))
+                    toExtract.append(sourceFile)
+                    continue
+                sfwr = cache.lookup(self.lang, contentHash, sourceFile)
+                if sfwr is None:
+                    name2contentHash[sourceFile['name']] = contentHash
+                    toExtract.append(sourceFile)
+                else:
+                    results.append((sourceFile, sfwrToRegexUsages(sfwr, sourceFile)))
+            libLF.log('Extraction cache: {} hits, {} misses'.format(cache.nHits, cache.nMisses))
+
+        # Extract the rest
+        if toExtract:
+            for sourceFile, sfwr in extractRegexesBatch(self.registry, self.lang, toExtract):
+                if sfwr is None:
+                    results.append((sourceFile, None))
+                    continue
+                # Failures may be environmental (e.g. no python2), so only cache successes
+                if sfwr.couldParse and sourceFile['name'] in name2contentHash:
+                    try:
+                        cache.store(self.lang, name2contentHash[sourceFile['name']], sfwr)
+                    except OSError as err:
+                        libLF.log('Could not cache {}: {}'.format(sourceFile['name'], err))
+                results.append((sourceFile, sfwrToRegexUsages(sfwr, sourceFile)))
+        return results
+
+# Files per ExtractionTask.
+# Chunks amortize extractor start-up, but we want several per worker so that
+# a few slow files do not leave the other workers idle.
+MIN_CHUNK_SIZE = {
+    'python': 5, # In-process, nothing to amortize
+}
+DEFAULT_MIN_CHUNK_SIZE = 50
+CHUNKS_PER_WORKER = 4
+
+def getExtractionTasks(registry, lang2sourceFiles, nWorkers, cacheDir):
+    tasks = []
+    for lang, sourceFiles in lang2sourceFiles.items():
+        if not sourceFiles:
+            continue
+        minChunkSize = MIN_CHUNK_SIZE.get(lang, DEFAULT_MIN_CHUNK_SIZE)
+        chunkSize = max(minChunkSize, -(-len(sourceFiles) // (nWorkers * CHUNKS_PER_WORKER)))
+        for i in range(0, len(sourceFiles), chunkSize):
+            tasks.append(ExtractionTask(registry, lang, sourceFiles[i:i + chunkSize], cacheDir))
+    # Biggest chunks first
+    tasks.sort(key=lambda task: len(task.sourceFiles), reverse=True)
+    return tasks
 
 def checkRegistryDeps(registry):
     dependenciesToCheck = []
     for l in registryToLangs[registry]:
+        if l.lower() == 'python':
+            # In-process
+            dependenciesToCheck.append(pythonExtractorPath)
+            continue
         dependenciesToCheck.append(langToExtractorPath[l.lower()])
     libLF.checkShellDependencies(dependenciesToCheck, mustBeExecutable=False)
 
+def tarballSourceFileChunks(tarball, registry, vendorRules):
+    """Stream the candidate source files out of tarball, without unpacking it.
+
+    Candidates are chosen by extension (libLF.getSourceFileLanguage) and are not vendored (vendorRules).
+    Yields (lang, sourceFiles) chunks; each sourceFile has its content in memory.
+    """
+    langs = libLF.registryToPrimaryLanguages[registry]
+    lang2chunk = {}
+    vendorCounters = libLF.VendorCounters()
+
+    libLF.log('Streaming source files from {}'.format(tarball))
+    nMembers = 0
+    nCandidates = 0
+    with tarfile.open(tarball, "r|gz") as tar:
+        for member in tar:
+            nMembers += 1
+            if not member.isfile():
+                continue
+            lang = libLF.getSourceFileLanguage(member.name, langs, readShebang=False)
+            if lang is None:
+                continue
+            # A tarball stream cannot skip a directory, so each member is checked
+            rule = vendorRules.matchingRule(member.name)
+            if rule is not None:
+                vendorCounters.skippedFile(rule)
+                continue
+
+            nCandidates += 1
+            content = tar.extractfile(member).read()
+            chunk = lang2chunk.setdefault(lang, [])
+            chunk.append({ 'name': member.name, 'content': content })
+            if MIN_CHUNK_SIZE.get(lang, DEFAULT_MIN_CHUNK_SIZE) <= len(chunk):
+                yield lang, chunk
+                lang2chunk[lang] = []
+
+    for lang, chunk in lang2chunk.items():
+        if chunk:
+            yield lang, chunk
+    libLF.log('Streamed {} candidate source files from {} tarball members'.format(nCandidates, nMembers))
+    vendorCounters.log()
+
 def unpackTarball(tarball):
    tmpDir = os.path.join(os.sep, 'tmp', 'regex-extractor', str(os.getpid()))
    libLF.log('Unpacking {} to {}'.format(tarball, tmpDir))
@@ -165,9 +439,41 @@ def unpackTarball(tarball):
        tar.extractall(path=tmpDir) 
        return tmpDir
 
-def main(projectCodePath, registry, outFile):
+def main(projectCodePath, registry, outFile, nWorkers, cpuBudgetDir, streamTarball, vendorRulesFile, cacheDir, timingsFile):
   checkRegistryDeps(registry)
 
+  if vendorRulesFile:
+    vendorRules = libLF.VendorRules.fromFile(vendorRulesFile)
+  else:
+    vendorRules = libLF.DEFAULT_VENDOR_RULES
+
+  # Share cores with our caller's pool, if it has a budget
+  budget = None
+  if cpuBudgetDir:
+    budget = libLF.parallel.CPUBudget(cpuBudgetDir)
+    nWorkers = min(nWorkers, budget.nSlots())
+
+  timings = libLF.StageTimings()
+  try:
+    analyzeProject(projectCodePath, registry, outFile, nWorkers, budget, streamTarball, vendorRules, cacheDir, timings)
+  finally:
+    # Even if we failed part-way: the stages we got through are the interesting ones
+    libLF.log("main: Stage timings: {}".format(timings.toDict()))
+    if timingsFile is not None:
+      libLF.writeFileAtomically(timingsFile, json.dumps(timings.toDict()) + '\n')
+
+def analyzeProject(projectCodePath, registry, outFile, nWorkers, budget, streamTarball, vendorRules, cacheDir, timings):
+  """Extract the regexes from this project into outFile
+
+  timings: libLF.StageTimings, to which we add a stage for each step
+  """
+  if streamTarball and not os.path.isdir(projectCodePath):
+    # Nothing to unpack or clean up. Source discovery is interleaved with extraction.
+    with timings.stage('streamExtraction'):
+      tasks = (ExtractionTask(registry, lang, sourceFiles, cacheDir) for lang, sourceFiles in tarballSourceFileChunks(projectCodePath, registry, vendorRules))
+      extractFromTasks(tasks, registry, outFile, nWorkers, budget)
+    return
+
   if os.path.isdir(projectCodePath):
     wasTarball = False
     srcDir = projectCodePath
@@ -175,41 +481,63 @@ def main(projectCodePath, registry, outFile):
     wasTarball = True
     try:
       # We should clean up srcDir later
-      srcDir = unpackTarball(projectCodePath)
+      with timings.stage('untar'):
+        srcDir = unpackTarball(projectCodePath)
     except BaseException as err:
       libLF.log("Error while unpacking {}: {}".format(projectCodePath, err))
       raise err
 
-  lang2sourceFiles = libLF.getUnvendoredSourceFiles(srcDir, registry)
+  with timings.stage('sourceDiscovery'):
+    lang2sourceFiles = libLF.getUnvendoredSourceFiles(srcDir, registry, vendorRules=vendorRules)
 
   # TODO Project metrics: nFiles, cloc, ...
 
+  with timings.stage('extraction'):
+    tasks = getExtractionTasks(registry, lang2sourceFiles, nWorkers, cacheDir)
+    libLF.log('Extracting from {} chunks'.format(len(tasks)))
+    extractFromTasks(tasks, registry, outFile, nWorkers, budget)
+
+  if wasTarball:
+    with timings.stage('cleanup'):
+      cleanUp(srcDir)
+
+def extractFromTasks(tasks, registry, outFile, nWorkers, budget):
+  """Run these ExtractionTasks, writing RegexUsages to outFile as each completes"""
+  libLF.log('Extracting with up to {} workers (budget: {})'.format(nWorkers, budget.budgetDir if budget else None))
   nFilesAnalyzed = 0
   nRegexesFound = 0
   with open(outFile, 'w') as outStream:
-    for lang, sourceFiles in lang2sourceFiles.items():
-      for sourceFile in sourceFiles:
-        output = extractRegexes(registry, lang, sourceFile)
+    # Write each chunk's regexes as it completes
+    for result in libLF.parallel.imap_unordered_budget_genr(tasks, nWorkers, budget):
+      if isinstance(result, BaseException):
+        libLF.log('Error extracting regexes from a chunk: {}'.format(result))
+        continue
+      for sourceFile, output in result:
         nFilesAnalyzed += 1
         if output is not None:
           for ru in output:
             nRegexesFound += 1
             ru.regexes = registry
             outStream.write(ru.toNDJSON() + '\n')
+      outStream.flush()
   libLF.log('Extracted a total of {} regexes from {} files'.format(nRegexesFound, nFilesAnalyzed))
 
-  if wasTarball:
-    cleanUp(srcDir)
-
 ###############################################
 
-# Parse args
-parser = argparse.ArgumentParser(description='Statically extract regexes from a module\'s GitHub project. Only regexes in the primary language of the module will be extracted. cf. ghp-extract-regexes.py')
-parser.add_argument('--registry', '-r',  help='What registry did the module associated with this libLF.GitHub project come from?', required=True)
-parser.add_argument('--src-path', '-t', help='GitHub project (tarball or root dir)', required=True, dest='srcPath')
-parser.add_argument('--out-file', '-o', help='Where to write RegexUsage objects as NDJSON?', required=True, dest='outFile')
+if __name__ == '__main__':
+  # Parse args
+  parser = argparse.ArgumentParser(description='Statically extract regexes from a module\'s GitHub project. Only regexes in the primary language of the module will be extracted. cf. ghp-extract-regexes.py')
+  parser.add_argument('--registry', '-r',  help='What registry did the module associated with this libLF.GitHub project come from?', required=True)
+  parser.add_argument('--src-path', '-t', help='GitHub project (tarball or root dir)', required=True, dest='srcPath')
+  parser.add_argument('--out-file', '-o', help='Where to write RegexUsage objects as NDJSON?', required=True, dest='outFile')
+  parser.add_argument('--parallelism', '-p', help='Maximum cores to use', type=int, required=False, default=libLF.parallel.CPUCount.CPU_BOUND)
+  parser.add_argument('--stream-tarball', help='Read source files straight out of the tarball instead of unpacking it to /tmp. Files are chosen by extension only, not shebang', action='store_true', required=False, default=False, dest='streamTarball')
+  parser.add_argument('--vendor-rules', help='File of linguist-style vendoring rules (cf. libLF.VendorRules), one regex per line. Default: libLF.DEFAULT_VENDOR_RULES', required=False, default=None, dest='vendorRulesFile')
+  parser.add_argument('--cache-dir', help='Content-addressed cache of per-file extraction results (cf. libLF.ExtractionCache). Safe to share between concurrent runs', required=False, default=None, dest='cacheDir')
+  parser.add_argument('--cpu-budget-dir', help='libLF.parallel.CPUBudget shared with the caller. We assume the caller holds one of its slots for us, and take more as they free up', required=False, default=None, dest='cpuBudgetDir')
+  parser.add_argument('--timings-file', help='Where to write NDJSON of the wall and CPU time of each stage (cf. libLF.StageTimings)', required=False, default=None, dest='timingsFile')
 
-args = parser.parse_args()
+  args = parser.parse_args()
 
-# Here we go!
-main(args.srcPath, args.registry, args.outFile)
+  # Here we go!
+  main(args.srcPath, args.registry, args.outFile, args.parallelism, args.cpuBudgetDir, args.streamTarball, args.vendorRulesFile, args.cacheDir, args.timingsFile)
@@ -3,6 +3,11 @@
 # Approach:
 # 1. Use tsc to transpile to a JS file.
 # 2. Use our JS regex extractor on the resulting JS.
+#
+# In batch mode (--file-list) we handle a whole project at once:
+# 1. Our JS regex extractor parses the TS files directly, all in one process.
+# 2. Any it cannot parse are transpiled by tsc (one process for all of them),
+#    and the resulting JS goes through the JS regex extractor (one more process).
 
 # Import libLF
 import os
@@ -33,6 +38,28 @@ def transpile(tsSrc, jsDest):
     cmd = "'{}' '{}' > '{}'".format(transpiler, tsSrc, jsDest)
     libLF.chkcmd(cmd)
 
+def transpileFiles(tsFile2jsFile):
+    """Transpile each TypeScript file into its JS file with one transpiler process.
+
+    Returns the TypeScript files that were transpiled.
+    """
+    with tempfile.NamedTemporaryFile(mode='w', prefix='extract-ts-regexes-', suffix='.txt') as fileList:
+        for tsFile, jsFile in tsFile2jsFile.items():
+            fileList.write('{}\t{}\n'.format(tsFile, jsFile))
+        fileList.flush()
+        cmd = "'{}' --file-list '{}'".format(transpiler, fileList.name)
+        out = libLF.chkcmd(cmd)
+
+    transpiled = set()
+    for line in out.splitlines():
+        try:
+            obj = libLF.fromNDJSON(line)
+            if obj['transpiled']:
+                transpiled.add(obj['fileName'])
+        except BaseException:
+            libLF.log('Could not parse transpiler output: {}'.format(line))
+    return transpiled
+
 def extractRegexesFromJS(jsFile):
     """Extract regexes from this JS file.
 
@@ -48,6 +75,26 @@ def extractRegexesFromJS(jsFile):
     sfwr.initFromNDJSON(out)
     return sfwr
 
+def extractRegexesFromJSFiles(jsFiles):
+    """Extract regexes from these JS files with one extractor process.
+
+    Returns a libLF.SimpleFileWithRegexes for each JS file, in order.
+    """
+    with tempfile.NamedTemporaryFile(mode='w', prefix='extract-ts-regexes-', suffix='.txt') as fileList:
+        fileList.write('\n'.join(jsFiles) + '\n')
+        fileList.flush()
+        cmd = "'{}' --file-list '{}'".format(regexExtractor, fileList.name)
+        out = libLF.chkcmd(cmd)
+
+    jsFile2sfwr = {}
+    for line in out.splitlines():
+        if not line.strip():
+            continue
+        sfwr = libLF.SimpleFileWithRegexes()
+        sfwr.initFromNDJSON(line)
+        jsFile2sfwr[sfwr.fileName] = sfwr
+    return [jsFile2sfwr.get(jsFile) for jsFile in jsFiles]
+
 def main(tsFile):
     checkDependencies([transpiler, regexExtractor])
     _, jsTmpFile = tempfile.mkstemp(suffix='.js')
@@ -68,12 +115,67 @@ def main(tsFile):
         sfwr.initFromRaw(fileName=tsFile, language='typescript', couldParse=0, regexes=[])
     print(sfwr.toNDJSON())
 
+def mainFileList(fileList):
+    """Batch mode: print one SimpleFileWithRegexes per TypeScript file in fileList ('-' for stdin)"""
+    checkDependencies([transpiler, regexExtractor])
+    if fileList == '-':
+        tsFiles = sys.stdin.read().splitlines()
+    else:
+        with open(fileList, 'r') as inStream:
+            tsFiles = inStream.read().splitlines()
+    tsFiles = [f for f in tsFiles if f]
+
+    # Parse the TypeScript directly
+    tsFile2sfwr = {}
+    try:
+        if tsFiles:
+            for tsFile, sfwr in zip(tsFiles, extractRegexesFromJSFiles(tsFiles)):
+                if sfwr is not None and sfwr.couldParse:
+                    tsFile2sfwr[tsFile] = sfwr
+    except BaseException as err:
+        libLF.log('Error extracting regexes: {}'.format(err))
+
+    # Transpile whatever we could not parse, then extract from all of the JS at once
+    todo = [tsFile for tsFile in tsFiles if tsFile not in tsFile2sfwr]
+    if todo:
+        libLF.log('Transpiling {} TypeScript files we could not parse directly'.format(len(todo)))
+        with tempfile.TemporaryDirectory(prefix='extract-ts-regexes-') as jsDir:
+            tsFile2jsFile = { tsFile: os.path.join(jsDir, '{}.js'.format(i)) for i, tsFile in enumerate(todo) }
+            try:
+                transpiled = transpileFiles(tsFile2jsFile)
+                jsFiles = [tsFile2jsFile[tsFile] for tsFile in todo if tsFile in transpiled]
+                jsFile2sfwr = dict(zip(jsFiles, extractRegexesFromJSFiles(jsFiles))) if jsFiles else {}
+                for tsFile in todo:
+                    sfwr = jsFile2sfwr.get(tsFile2jsFile[tsFile])
+                    if sfwr is not None:
+                        tsFile2sfwr[tsFile] = sfwr
+            except BaseException as err:
+                libLF.log('Error extracting regexes: {}'.format(err))
+
+    for tsFile in tsFiles:
+        sfwr = tsFile2sfwr.get(tsFile)
+        if sfwr is None:
+            sfwr = libLF.SimpleFileWithRegexes()
+            sfwr.initFromRaw(fileName=tsFile, language='typescript', couldParse=0, regexes=[])
+        else:
+            # Real file name, not temp file
+            sfwr.fileName = tsFile
+        print(sfwr.toNDJSON())
+        sys.stdout.flush()
+
 ###############################################
 
 # Parse args
 parser = argparse.ArgumentParser(description='Extract regexes from a TypeScript file')
-parser.add_argument('file_to_extract', help='TypeScript file from which to extract regexes')
+parser.add_argument('file_to_extract', help='TypeScript file from which to extract regexes', nargs='?')
+parser.add_argument('--file-list', help='Batch mode: extract regexes from each TypeScript file named in this file (one per line, - for stdin). Prints one result per line', required=False,
+  dest='fileList')
 
 args = parser.parse_args()
 # Here we go!
-main(args.file_to_extract)
+if args.fileList:
+    mainFileList(args.fileList)
+elif args.file_to_extract:
+    main(args.file_to_extract)
+else:
+    parser.error('Give a file to extract or --file-list')
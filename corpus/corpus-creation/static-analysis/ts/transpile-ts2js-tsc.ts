@@ -4,32 +4,62 @@
 //
 // Roughly equivalent to some command-line invocation of tsc,
 // but I'm not sure which one. Anyway...
+//
+// Batch mode (--file-list file-list): transpile each file in one process,
+// so we load the compiler once per project rather than once per file.
+// Each line of file-list is "ts-file.ts<TAB>js-file.js" ('-' for stdin).
+// Prints one JSON object per file with keys: fileName transpiled
 
 import * as ts from "typescript";
 import * as fs from "fs";
 
+function transpile(tsFile: string): string {
+  const tsCode = fs.readFileSync(tsFile, "utf8");
+
+  // https://github.com/Microsoft/TypeScript-wiki/blob/master/Using-the-Compiler-API.md#a-simple-transform-function
+  let result = ts.transpileModule(tsCode, {
+    compilerOptions: { module: ts.ModuleKind.CommonJS }
+  });
+  return result.outputText;
+}
+
+function transpileFileList(fileList: string) {
+  const lines = fs.readFileSync(fileList === "-" ? 0 : fileList, "utf8")
+    .split("\n")
+    .filter((line) => line.length > 0);
+  for (const line of lines) {
+    const [tsFile, jsFile] = line.split("\t");
+    let transpiled = 0;
+    try {
+      fs.writeFileSync(jsFile, transpile(tsFile));
+      transpiled = 1;
+    } catch (err) {
+      console.error(`Error transpiling ${tsFile}: ${err}`);
+    }
+    console.log(JSON.stringify({ fileName: tsFile, transpiled: transpiled }));
+  }
+}
+
+if (process.argv.length == 4 && process.argv[2] == "--file-list") {
+  transpileFileList(process.argv[3]);
+  process.exit(0);
+}
+
 // Accepts a tsFile as argument.
 if (process.argv.length != 3) {
   console.log(`Usage: ${require('path').basename(process.argv[1])} ts-file.ts`);
+  console.log(`       ${require('path').basename(process.argv[1])} --file-list file-list`);
   console.log(`  Transpiles TS to JS and prints to stdout`);
   process.exit(1);
 }
 const tsFile = process.argv[2];
-const tsCode = fs.readFileSync(process.argv[2], "utf8");
 
 // Transpile
-
-// https://github.com/Microsoft/TypeScript-wiki/blob/master/Using-the-Compiler-API.md#a-simple-transform-function
 try {
-  let result = ts.transpileModule(tsCode, {
-    compilerOptions: { module: ts.ModuleKind.CommonJS }
-  });
-
   // Emit
-  console.log(result.outputText);
+  console.log(transpile(tsFile));
   process.exit(0);
 } catch (err) {
   console.error(`Error: ${err}`);
   process.exit(1);
 }
-
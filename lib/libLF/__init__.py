@@ -7,4 +7,9 @@ from libLF.lf_ndjson import *
 from libLF.lf_module import *
 from libLF.lf_github import *
 from libLF.lf_superLinear import *
+from libLF.lf_regexParser import *
+from libLF.lf_regexFeatures import *
+from libLF.lf_workspace import *
+from libLF.lf_limits import *
+from libLF.lf_timing import *
 import libLF.lf_parallel as parallel
\ No newline at end of file
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# Benchmarks for libLF hot paths.
+# Inputs are synthetic, sized like the candidates we extract from InternetRegexSource's.
+
+# Import our lib
+import os
+import sys
+sys.path.append('{}/lib'.format(os.environ['REGEX_GENERALIZABILITY_PROJECT_ROOT']))
+import libLF
+
+import argparse
+import contextlib
+import json
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+#####
+# Inputs
+#####
+
+# Snippet fragments seen in StackOverflow posts and RegExLib entries
+_REGEX_FRAGMENTS = [
+  r'^\d{3}-\d{4}$', r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}', r'(?:https?://)?',
+  r'\s*', r'(\w+)\s*=\s*"([^"]*)"', r'[^\n]+', r'(?<=\$)\d+(\.\d\d)?', r'\bfoo\b',
+]
+_CODE_FRAGMENTS = [
+  'var x = re.compile(', 'console.log(m);', 'preg_match($re, $s)', 'new RegExp(s)', 'count = count + 1',
+]
+_TEXT_FRAGMENTS = [
+  'hello', 'world', 'the', 'quick', 'brown', 'fox', 'I', 'want', 'to', 'match', 'a', 'string',
+]
+
+def makeCandidates(nCandidates, maxLen, pText, pRegex, seed=0):
+  """Returns nCandidates strings of up to maxLen characters.
+
+  Each is built from text fragments (probability pText),
+  regex fragments (pRegex), and code fragments (the rest)."""
+  rng = random.Random(seed)
+  candidates = []
+  for _ in range(nCandidates):
+    fragments = []
+    length = 0
+    targetLen = rng.randint(1, maxLen)
+    while length < targetLen:
+      r = rng.random()
+      if r < pText:
+        frag = rng.choice(_TEXT_FRAGMENTS) + ' '
+      elif r < pText + pRegex:
+        frag = rng.choice(_REGEX_FRAGMENTS)
+      else:
+        frag = rng.choice(_CODE_FRAGMENTS)
+      fragments.append(frag)
+      length += len(frag)
+    candidates.append(''.join(fragments)[:targetLen])
+  return candidates
+
+# StackOverflow: many short inline snippets, mostly prose.
+# RegExLib: fewer, longer entries, mostly regex.
+CANDIDATE_SETS = [
+  # label, nCandidates, maxLen, pText, pRegex
+  ('StackOverflow-sized', 50000, 80, 0.7, 0.2),
+  ('RegExLib-sized', 5000, 1000, 0.2, 0.79),
+]
+
+def makeNpmTree(root, nOwnFiles, nDeps, nFilesPerDep, seed=0):
+  """Lay out a synthetic npm project under root, mostly node_modules"""
+  rng = random.Random(seed)
+  def writeFiles(d, nFiles):
+    os.makedirs(d, exist_ok=True)
+    for i in range(nFiles):
+      ext = rng.choice(['.js', '.js', '.js', '.ts', '.json', '.md'])
+      with open(os.path.join(d, 'f{}{}'.format(i, ext)), 'w') as outStream:
+        outStream.write('var x = /a+/;\n' * rng.randint(1, 50))
+  writeFiles(os.path.join(root, 'lib'), nOwnFiles)
+  for dep in range(nDeps):
+    writeFiles(os.path.join(root, 'node_modules', 'dep{}'.format(dep), 'lib'), nFilesPerDep)
+
+#####
+# Benchmarks
+#####
+
+def timeIt(label, func, nReps):
+  times = []
+  for _ in range(nReps):
+    start = time.perf_counter()
+    func()
+    times.append(time.perf_counter() - start)
+  best = min(times)
+  print('{:<50} best {:8.4f}s  mean {:8.4f}s'.format(label, best, sum(times) / len(times)))
+  return best
+
+def benchIsRegexPattern(nReps):
+  for label, nCandidates, maxLen, pText, pRegex in CANDIDATE_SETS:
+    candidates = makeCandidates(nCandidates, maxLen, pText, pRegex)
+    timeIt('isRegexPattern: {} x{}'.format(label, nCandidates), lambda: [libLF.isRegexPattern(c) for c in candidates], nReps)
+    timeIt('classifyRegexPatterns: {} x{}'.format(label, nCandidates), lambda: libLF.classifyRegexPatterns(candidates), nReps)
+
+def benchScorePatternsReadingDifficulty(nReps):
+  label, nCandidates, maxLen, pText, pRegex = CANDIDATE_SETS[-1]
+  patterns = makeCandidates(nCandidates, maxLen, 0, 1)
+  def scoreUncached():
+    libLF.scorePatternReadingDifficulty.cache_clear()
+    libLF.parseRegex.cache_clear()
+    libLF.scorePatternsReadingDifficulty(patterns)
+  timeIt('scorePatternsReadingDifficulty: {} x{} (uncached)'.format(label, nCandidates), scoreUncached, nReps)
+  timeIt('scorePatternsReadingDifficulty: {} x{} (cached)'.format(label, nCandidates), lambda: libLF.scorePatternsReadingDifficulty(patterns), nReps)
+
+def benchSourceFileDiscovery(nReps):
+  nOwnFiles, nDeps, nFilesPerDep = 100, 200, 20
+  with tempfile.TemporaryDirectory() as root:
+    makeNpmTree(root, nOwnFiles, nDeps, nFilesPerDep)
+    label = 'npm-like tree, {} files, {}% node_modules'.format(nOwnFiles + nDeps*nFilesPerDep, int(100*nDeps*nFilesPerDep/(nOwnFiles + nDeps*nFilesPerDep)))
+    if shutil.which('cloc'):
+      timeIt('cloc: {}'.format(label), lambda: clocFileCounts(root), nReps)
+    timeIt('getAllSourceFiles: {}'.format(label), lambda: libLF.getAllSourceFiles(root, 'npm'), nReps)
+    timeIt('getUnvendoredSourceFiles: {}'.format(label), lambda: libLF.getUnvendoredSourceFiles(root, 'npm'), nReps)
+
+    # The native walk should find the same files that cloc did
+    if shutil.which('cloc'):
+      clocCounts = clocFileCounts(root)
+      for lang, sourceFiles in libLF.getAllSourceFiles(root, 'npm').items():
+        print('  {:<12} native {:6d} files  cloc {:6d} files'.format(lang, len(sourceFiles), clocCounts.get(lang, 0)))
+    else:
+      print('  cloc is not in your PATH, so the native walk was not compared against it')
+
+def clocFileCounts(root):
+  """Returns { lang: number of files } as cloc sees root, with lower-case langs"""
+  with tempfile.NamedTemporaryFile(suffix='.json', prefix='cloc-') as reportFile:
+    subprocess.run(["cloc", root, "--json", "--by-file", "--report-file", reportFile.name],
+      check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(reportFile.name, 'r') as clocOut:
+      res = json.load(clocOut)
+  lang2count = {}
+  # The keys of res are "header", "SUM", and file names
+  for key, val in res.items():
+    if key not in ["header", "SUM"]:
+      lang = val["language"].lower()
+      lang2count[lang] = lang2count.get(lang, 0) + 1
+  return lang2count
+
+class _UnbufferedLogWriter():
+  """libLF.log as it was: format the prefix afresh and write each line to stderr"""
+  def write(self, level, msg):
+    sys.stderr.write('{} {}/{}: {}\n'.format(time.strftime('%d/%m/%Y %H:%M:%S'), platform.node(), os.getpid(), msg))
+  def flush(self):
+    pass
+
+@contextlib.contextmanager
+def _logging(level, unbuffered=False):
+  """Log at level (to /dev/null, at the fd level so that stderr keeps its buffering)"""
+  libLF.flushLog()
+  sys.stderr.flush()
+  savedFd = os.dup(2)
+  devNull = os.open(os.devnull, os.O_WRONLY)
+  os.dup2(devNull, 2)
+  savedWriter = libLF.lf_utils._logWriter
+  if unbuffered:
+    libLF.lf_utils._logWriter = _UnbufferedLogWriter()
+  libLF.setLogLevel(level)
+  try:
+    yield
+  finally:
+    libLF.flushLog()
+    sys.stderr.flush()
+    libLF.lf_utils._logWriter = savedWriter
+    libLF.setLogLevel('INFO')
+    os.dup2(savedFd, 2)
+    os.close(savedFd)
+    os.close(devNull)
+
+# (label, level, unbuffered): every message written as before, then the same buffered, then the default
+_LOGGING_MODES = [
+  ('DEBUG, unbuffered (as before)', 'DEBUG', True),
+  ('DEBUG, buffered', 'DEBUG', False),
+  ('INFO (debug disabled)', 'INFO', False),
+]
+
+def benchLog(nReps):
+  nCalls = 100000
+  logger = libLF.getLogger('bench-libLF')
+  for label, level, unbuffered in _LOGGING_MODES:
+    with _logging(level, unbuffered):
+      timeIt('log.debug x{}: {}'.format(nCalls, label), lambda: [logger.debug('/{}/ -> /{}/', 'a+', i) for i in range(nCalls)], nReps)
+
+def _measureRegexesHotPath(patterns, resultLines):
+  """What measure-regexes.py does per regex outside of AutomataCLI, logging included"""
+  log = libLF.getLogger('measure-regexes')
+  csharpPatterns = [libLF.RegexTranslator.translateRegex(p, "", "C#", altUnicodeFlag='i') for p in patterns]
+  for p, c in zip(patterns, csharpPatterns):
+    log.debug("MyTask: /{}/ -> /{}/", p, c)
+  for p in patterns:
+    try:
+      libLF.countRegexFeatures(p, "")
+    except libLF.RegexParseError as err:
+      log.debug("countFeatures: {}", err)
+  for i, line in enumerate(resultLines):
+    log.debug("Results for regex {} ( /{}/ ): {}", i, csharpPatterns[i], line)
+    json.loads(line)
+
+def benchMeasureRegexesLogging(nReps):
+  # Regex-heavy candidates, some of which only translate syntactically
+  patterns = makeCandidates(20000, 80, 0, 1) + [r'(?P<x>a){2,}\Q.\E'] * 2000
+  # AutomataCLI reports a graph and dozens of metrics per regex
+  resultLines = [json.dumps({ 'regexMetrics': { 'validCSharpRegex': True, 'pattern': p, 'efreeNFAGraph': '0\n1\n0 1 a\n' * 20 } }) for p in patterns]
+  for label, level, unbuffered in _LOGGING_MODES:
+    with _logging(level, unbuffered):
+      best = timeIt('measure-regexes per regex x{}: {}'.format(len(patterns), label), lambda: _measureRegexesHotPath(patterns, resultLines), nReps)
+    print('{:<50} {:8.0f} regexes/s'.format('', len(patterns) / best))
+
+BENCHMARKS = {
+  'isRegexPattern': benchIsRegexPattern,
+  'scorePatternsReadingDifficulty': benchScorePatternsReadingDifficulty,
+  'sourceFileDiscovery': benchSourceFileDiscovery,
+  'log': benchLog,
+  'measureRegexesLogging': benchMeasureRegexesLogging,
+}
+
+def main(benchmarks, nReps):
+  for name in benchmarks:
+    BENCHMARKS[name](nReps)
+
+#####
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Benchmark libLF hot paths')
+  parser.add_argument('--bench', help='Which benchmarks to run (default: all)', choices=sorted(BENCHMARKS.keys()), action='append', required=False,
+    dest='benchmarks')
+  parser.add_argument('--reps', type=int, help='Repetitions per benchmark', required=False, default=3,
+    dest='nReps')
+  args = parser.parse_args()
+
+  main(args.benchmarks or sorted(BENCHMARKS.keys()), args.nReps)
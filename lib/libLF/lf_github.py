@@ -3,13 +3,9 @@
 
 import libLF.lf_ndjson as lf_ndjson
 import libLF
-import json
 import re
 
 import os
-import tempfile
-import subprocess
-import time
 
 class SimpleGitHubProjectNameAndStars:
   """GitHub project name with # stars
@@ -191,153 +187,278 @@ class GitHubProject:
 # Module file analysis
 ###############
 
-def getAllSourceFiles(dirName, registry):
-  """Get all source files for a project from this module registry
-
-  Args:
-    dirName: source root
-    registry: lower-case string, e.g. 'npm' or 'maven'
-  Returns:
-    lang2sourceFiles: { 'JavaScript': [{obj1}, ...] , ...
-      Each sourceFile object is as described by getFileSummaryFromCLOC
-      The languages are those languages used in the given registry
-      This does not yet have filtering for vendored code applied
-  """
-  assert(registry.lower() in libLF.registryToPrimaryLanguages)
-
-  # Get source files for all languages present in dir
-  _language2files = getFileSummaryFromCLOC(dirName)
-
-  # Copy out the records of interest
-  lang2sourceFiles = {}
-  for lang in libLF.registryToPrimaryLanguages[registry]:
-    lang2sourceFiles[lang] = _language2files[lang]
-  return lang2sourceFiles
-
-def _looksVendored(filePath):
-  # cf. https://github.com/github/linguist/blob/master/lib/linguist/vendor.yml
-  lowerCaseThirdPartyDirs = ["third-party", "third_party", "thirdparty",
-                    "3rd-party", "3rd_party", "3rdparty",
-                    "vendor", "vendors",
-                    "extern", "external",
-                    "node_modules" # npm
-                   ]
-
-  # Check if in a vendor or build dir
-  splitPath = libLF.pathSplitAll(filePath)
-  splitPath.pop() # Basename
-  for d in splitPath:
-    if d.lower() in lowerCaseThirdPartyDirs:
-        return True
-  return False
-
-def removeVendoredSourceFiles(lang2sourceFiles):
-  """Remove the vendored (third-party) source files
-
-  Args:
-    lang2sourceFiles: see getSourceFiles()
-      NB: Modified in-place!
-  Returns:
-    unvendoredSourceFiles: sourceFiles with third-party files removed
-
-  Identifies third-party files using heuristics taken from GitHub.
-  """
-  for lang, sourceFiles in lang2sourceFiles.items():
-    lang2sourceFiles[lang] = [
-      fileObj
-      for fileObj in sourceFiles
-      if not _looksVendored(fileObj["name"])
-    ]
-  return sourceFiles
-
-def getFileSummaryFromCLOC(dirName):
-  """Simple analyses on files in a module
-
-  Returns language2files{}
-  Keys are from the values of libLF.registryToPrimaryLanguages
+# Interpreted languages may be in extensionless scripts, identified by shebang
+_SHEBANG_RE = re.compile(rb'^#!\s*\S*?(?:\benv\s+(?:-\S+\s+)*)?\b(node|nodejs|python[0-9.]*|ruby|perl|php)\b')
+_shebangInterpreterToLang = {
+  'node': 'javascript',
+  'nodejs': 'javascript',
+  'python': 'python',
+  'ruby': 'ruby',
+  'perl': 'perl',
+  'php': 'php',
+}
+_SHEBANG_LEN = 128
+
+# Line comment markers, for countLOC
+_langToLineCommentRE = {
+  'python': re.compile(r'#'),
+  'ruby': re.compile(r'#'),
+  'perl': re.compile(r'#'),
+  'php': re.compile(r'#|//'),
+}
+_DEFAULT_LINE_COMMENT_RE = re.compile(r'//')
+
+def getSourceFileLanguage(fileName, langs, readShebang=True):
+  """Which of langs is fileName written in? None if none.
+
+  Uses the extension, or for extensionless files the shebang line (if readShebang)."""
+  _, ext = os.path.splitext(fileName)
+  if ext:
+    lang = libLF.extensionToLang.get(ext.lower())
+  elif readShebang:
+    lang = _getShebangLanguage(fileName)
+  else:
+    lang = None
+  if lang in langs:
+    return lang
+  return None
+
+def _getShebangLanguage(fileName):
+  try:
+    with open(fileName, 'rb') as inStream:
+      head = inStream.read(_SHEBANG_LEN)
+  except OSError:
+    return None
+  m = _SHEBANG_RE.match(head)
+  if m:
+    interpreter = m.group(1).decode('ascii').rstrip('0123456789.')
+    return _shebangInterpreterToLang.get(interpreter)
+  return None
+
+def countLOC(fileName, lang):
+  """Lines of non-comment non-whitespace, roughly as cloc does it.
+
+  Only line comments are recognized, so lines inside block comments are counted."""
+  commentRE = _langToLineCommentRE.get(lang, _DEFAULT_LINE_COMMENT_RE)
+  loc = 0
+  with open(fileName, 'r', errors='replace') as inStream:
+    for line in inStream:
+      line = line.strip()
+      if line and not commentRE.match(line):
+        loc += 1
+  return loc
+
+class SourceFile(dict):
+  """A source file record: { "name": XYZ, "LOC": XYZ }
+
+  LOC is counted the first time someone asks for it."""
+  def __init__(self, name, lang):
+    super().__init__(name=name)
+    self.lang = lang
+
+  def __missing__(self, key):
+    if key == "LOC":
+      try:
+        self["LOC"] = countLOC(self["name"], self.lang)
+      except OSError:
+        self["LOC"] = 0
+      return self["LOC"]
+    raise KeyError(key)
+
+def getFileSummaryNative(dirName, langs, vendorRules=None, vendorCounters=None):
+  """Find the source files in these languages under dirName
+
+  Returns language2files{}, with a key for each of langs:
     { "javascript": [
         { "name": XYZ,
           "LOC": XYZ
         },
         ...
       ],
-      "ruby": [
-        {...}, ...
-      ],
       ...
     }
+  LOC (lines of non-comment non-whitespace) is computed lazily, see SourceFile.
+  Languages are identified by extension (libLF.extensionToLang) or shebang.
 
-  LOC: lines of non-comment non-whitespace
-
-  Requires that 'cloc' be in your PATH
+  vendorRules: a VendorRules. If given, vendored directories are pruned as we walk
+    and vendored files are skipped.
+  vendorCounters: a VendorCounters, updated with what vendorRules skipped.
   """
+  language2files = { lang: [] for lang in langs }
+
+  # (path, path relative to dirName)
+  dirsToVisit = [(dirName, '')]
+  while dirsToVisit:
+    d, relD = dirsToVisit.pop()
+    try:
+      with os.scandir(d) as it:
+        entries = list(it)
+    except OSError as err:
+      libLF.log("Could not scan {}: {}".format(d, err))
+      continue
+
+    for entry in entries:
+      relPath = relD + entry.name
+      if entry.is_dir(follow_symlinks=False):
+        if vendorRules is not None:
+          rule = vendorRules.matchingRule(relPath + '/')
+          if rule is not None:
+            if vendorCounters is not None:
+              vendorCounters.prunedDir(rule)
+            continue
+        dirsToVisit.append((entry.path, relPath + '/'))
+      elif entry.is_file(follow_symlinks=False):
+        lang = getSourceFileLanguage(entry.path, language2files)
+        if lang is None:
+          continue
+        if vendorRules is not None:
+          rule = vendorRules.matchingRule(relPath)
+          if rule is not None:
+            if vendorCounters is not None:
+              vendorCounters.skippedFile(rule)
+            continue
+        language2files[lang].append(SourceFile(entry.path, lang))
 
-  language2files = {}
-  for reg in libLF.registryToPrimaryLanguages:
-    for lang in libLF.registryToPrimaryLanguages[reg]:
-      language2files[lang] = []
+  return language2files
 
-  # Get a tmp file for CLOC output
-  fd, clocDataFileName = tempfile.mkstemp(suffix='.json', prefix='cloc-')
-  os.close(fd)
+def getAllSourceFiles(dirName, registry, vendorRules=None, vendorCounters=None):
+  """Get all source files for a project from this module registry
 
-  try:
-    # Run CLOC
-    cmd = ["cloc", dirName, "--json", "--by-file", "--report-file", clocDataFileName]
-    libLF.log("CMD: " + " ".join(cmd))
-    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    time.sleep(0.1) # I see intermittent parse failures. Maybe this will help?
-
-    # Grab output
-    libLF.log("Loading report from {}".format(clocDataFileName))
-    with open(clocDataFileName, 'r') as clocOut:
-      res = json.load(clocOut)
-      # The keys of res are "header", "SUM", and file names
-      for key in res:
-        if os.path.isfile(key) and not os.path.islink(key):
-          sourceFile = key
-          loc = res[key]["code"]
-          lang = res[key]["language"]
-          # Keep if it's in a language of interest
-          if lang.lower() in language2files:
-            fileObj = {
-              "name": sourceFile,
-              "LOC": loc
-            }
-            language2files[lang.lower()].append(fileObj)
-  except subprocess.CalledProcessError:
-    libLF.log("Command yielded non-zero rc")
-  os.unlink(clocDataFileName)
-
-  # All done
-  return language2files
+  Args:
+    dirName: source root
+    registry: lower-case string, e.g. 'npm' or 'maven'
+    vendorRules, vendorCounters: cf. getFileSummaryNative
+  Returns:
+    lang2sourceFiles: { 'javascript': [{obj1}, ...] , ...
+      Each sourceFile object is as described by getFileSummaryNative
+      The languages are those languages used in the given registry
+      Unless vendorRules are given, this does not yet have filtering for vendored code applied
+  """
+  assert(registry.lower() in libLF.registryToPrimaryLanguages)
+  return getFileSummaryNative(dirName, libLF.registryToPrimaryLanguages[registry], vendorRules=vendorRules, vendorCounters=vendorCounters)
 
-def logLang2SourceFiles(lang2sourceFiles):
-  """Log a lang2sourceFiles from CLOC"""
-  fmt = "%20s %10s %15s"
-  libLF.log(fmt % ("Language", "Num files", "Net LOC"))
-  libLF.log(fmt % ("-----", "-----", "-----"))
-  for lang in lang2sourceFiles:
-    loc = 0
-    for f in lang2sourceFiles[lang]:
-      loc += f["LOC"]
-    libLF.log(fmt % (lang, len(lang2sourceFiles[lang]), loc))
+class VendorRules:
+  """Rules that identify third-party (vendored) code
 
-def getUnvendoredSourceFiles(projDir, registry):
+  In the style of GitHub linguist's vendor.yml:
+  each rule is a regex searched for in a path relative to the project root,
+  with '/' as the separator. Directories are tested with a trailing '/',
+  so a rule like '(^|/)node_modules/' prunes the whole directory.
+  """
+  def __init__(self, patterns):
+    self.patterns = list(patterns)
+    self._regexes = [re.compile(p) for p in self.patterns]
+    # One search answers "is it vendored?". Only on a hit do we find out which rule.
+    # (Not possible if a rule uses global flags like '(?i)', then we try each rule.)
+    try:
+      self._anyRegex = re.compile('|'.join('(?:{})'.format(p) for p in self.patterns))
+    except re.error:
+      self._anyRegex = None
+
+  @staticmethod
+  def fromFile(rulesFile):
+    """One regex per line. Blank lines and lines starting with '#' are ignored."""
+    with open(rulesFile, 'r') as inStream:
+      patterns = [
+        line.strip()
+        for line in inStream
+        if line.strip() and not line.strip().startswith('#')
+      ]
+    return VendorRules(patterns)
+
+  def matchingRule(self, relPath):
+    """Returns the first rule that matches relPath, or None"""
+    if self._anyRegex is not None and not self._anyRegex.search(relPath):
+      return None
+    for pattern, regex in zip(self.patterns, self._regexes):
+      if regex.search(relPath):
+        return pattern
+    return None
+
+# cf. https://github.com/github/linguist/blob/master/lib/linguist/vendor.yml
+# Names match in any case, e.g. 'Vendor/' or 'Node_Modules/'
+DEFAULT_VENDOR_RULES = VendorRules([
+  r'(^|/)(?i:third[-_]?party|3rd[-_]?party)/',
+  r'(^|/)(?i:vendors?)/',
+  r'(^|/)(?i:extern(al)?)/',
+  r'(^|/)(?i:node_modules)/', # npm
+  r'(^|/)(?i:bower_components)/',
+  r'(^|/)(?i:\.git)/',
+  r'(?i:\.min\.js)$', # Minified
+])
+
+class VendorCounters:
+  """What VendorRules skipped in one project"""
+  def __init__(self):
+    self.nPrunedDirs = 0
+    self.nSkippedFiles = 0
+    self.ruleToNHits = {}
+
+  def prunedDir(self, rule):
+    self.nPrunedDirs += 1
+    self.ruleToNHits[rule] = self.ruleToNHits.get(rule, 0) + 1
+
+  def skippedFile(self, rule):
+    self.nSkippedFiles += 1
+    self.ruleToNHits[rule] = self.ruleToNHits.get(rule, 0) + 1
+
+  def toDict(self):
+    return { "nPrunedDirs": self.nPrunedDirs,
+             "nSkippedFiles": self.nSkippedFiles,
+             "ruleToNHits": self.ruleToNHits
+    }
+
+  def log(self):
+    libLF.log("Vendoring: pruned {} dirs, skipped {} files".format(self.nPrunedDirs, self.nSkippedFiles))
+    for rule, nHits in sorted(self.ruleToNHits.items(), key=lambda kv: -kv[1]):
+      libLF.log("  {:>8} {}".format(nHits, rule))
+
+def looksVendored(filePath, vendorRules=None):
+  """Is this file (path relative to the project root, or absolute) third-party code?
+
+  vendorRules: default DEFAULT_VENDOR_RULES"""
+  if vendorRules is None:
+    vendorRules = DEFAULT_VENDOR_RULES
+  return vendorRules.matchingRule(filePath.replace(os.sep, '/')) is not None
+
+def logLang2SourceFiles(lang2sourceFiles, withLOC=True):
+  """Log a lang2sourceFiles
+
+  withLOC: Also sum LOC. This reads every file if LOC is lazy (cf. SourceFile)."""
+  if withLOC:
+    fmt = "%20s %10s %15s"
+    libLF.log(fmt % ("Language", "Num files", "Net LOC"))
+    libLF.log(fmt % ("-----", "-----", "-----"))
+  else:
+    fmt = "%20s %10s"
+    libLF.log(fmt % ("Language", "Num files"))
+    libLF.log(fmt % ("-----", "-----"))
+  for lang in lang2sourceFiles:
+    if withLOC:
+      loc = 0
+      for f in lang2sourceFiles[lang]:
+        loc += f["LOC"]
+      libLF.log(fmt % (lang, len(lang2sourceFiles[lang]), loc))
+    else:
+      libLF.log(fmt % (lang, len(lang2sourceFiles[lang])))
+
+def getUnvendoredSourceFiles(projDir, registry, vendorRules=None, vendorCounters=None):
   """Return lang2sourceFiles for the languages in this registry
   
-  Filters out vendored files
+  Filters out vendored files, per vendorRules (default DEFAULT_VENDOR_RULES)
+  If vendorCounters (a VendorCounters) is given, it says what was skipped.
   cf. getSourceFiles
   """
-  lang2sourceFiles = getAllSourceFiles(projDir, registry)
-
-  libLF.log("All source files")
-  logLang2SourceFiles(lang2sourceFiles)
+  if vendorRules is None:
+    vendorRules = DEFAULT_VENDOR_RULES
+  if vendorCounters is None:
+    vendorCounters = VendorCounters()
 
-  libLF.log("Removing vendored source files")
-  removeVendoredSourceFiles(lang2sourceFiles)
+  # Vendored directories are pruned as we walk, so we never visit their files
+  lang2sourceFiles = getAllSourceFiles(projDir, registry, vendorRules=vendorRules, vendorCounters=vendorCounters)
+  vendorCounters.log()
 
   libLF.log("Non-vendored lang2sourceFiles:")
-  libLF.logLang2SourceFiles(lang2sourceFiles)
+  libLF.logLang2SourceFiles(lang2sourceFiles, withLOC=False)
 
   return lang2sourceFiles
\ No newline at end of file
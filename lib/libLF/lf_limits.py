@@ -0,0 +1,262 @@
+"""Lingua Franca: Resource-limited execution
+
+Run a command under limits on its whole process tree
+(wall clock, CPU time, memory, number of processes),
+and report how much of each it used.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+
+try:
+  import resource
+except ImportError: # Not on Windows
+  resource = None
+
+import libLF.lf_utils as lf_utils
+
+#####
+# ResourceLimits
+#####
+
+class ResourceLimits():
+  """Limits on a command and everything it spawns. None means unlimited.
+
+  wallClockSec: seconds from start to finish
+  cpuSec:       user+sys CPU seconds, summed over the tree
+  memoryBytes:  resident set size, summed over the tree
+  maxProcs:     processes in the tree at once
+  """
+  LIMIT_WALL_CLOCK = 'wallClock'
+  LIMIT_CPU = 'cpu'
+  LIMIT_MEMORY = 'memory'
+  LIMIT_PROCS = 'procs'
+
+  def __init__(self, wallClockSec=None, cpuSec=None, memoryBytes=None, maxProcs=None):
+    self.wallClockSec = wallClockSec
+    self.cpuSec = cpuSec
+    self.memoryBytes = memoryBytes
+    self.maxProcs = maxProcs
+
+  def exceeded(self, usage):
+    """Which limit usage (a ResourceUsage) exceeds, or None"""
+    if self.wallClockSec is not None and self.wallClockSec < usage.wallClockSec:
+      return ResourceLimits.LIMIT_WALL_CLOCK
+    if self.cpuSec is not None and self.cpuSec < usage.cpuSec:
+      return ResourceLimits.LIMIT_CPU
+    if self.memoryBytes is not None and self.memoryBytes < usage.maxRSSBytes:
+      return ResourceLimits.LIMIT_MEMORY
+    if self.maxProcs is not None and self.maxProcs < usage.maxProcs:
+      return ResourceLimits.LIMIT_PROCS
+    return None
+
+  def _setRlimits(self):
+    """In the child: per-process backstops, in case we cannot watch the tree"""
+    if resource is None:
+      return
+    if self.cpuSec is not None:
+      cpuSec = int(self.cpuSec) + 1
+      resource.setrlimit(resource.RLIMIT_CPU, (cpuSec, cpuSec))
+    # No RLIMIT_AS for memoryBytes: VMs (JVM, node) reserve far more address space than they use.
+    # No RLIMIT_NPROC for maxProcs: it counts all of the user's processes.
+
+#####
+# ResourceUsage
+#####
+
+class ResourceUsage():
+  """What a command's process tree used.
+
+  wallClockSec: seconds from start to finish
+  cpuSec:       user+sys CPU seconds, summed over the tree
+  maxRSSBytes:  peak resident set size, summed over the tree (at our sampling rate)
+  maxProcs:     peak processes in the tree at once (at our sampling rate)
+  """
+  def __init__(self):
+    self.wallClockSec = 0
+    self.cpuSec = 0
+    self.maxRSSBytes = 0
+    self.maxProcs = 0
+
+  def toDict(self):
+    return {
+      'wallClockSec': round(self.wallClockSec, 3),
+      'cpuSec': round(self.cpuSec, 3),
+      'maxRSSBytes': self.maxRSSBytes,
+      'maxProcs': self.maxProcs,
+    }
+
+#####
+# Running a command
+#####
+
+class LimitedRun():
+  """Outcome of runLimited.
+
+  rc:             exit code, or -signal if killed
+  stdout, stderr: str if you asked for subprocess.PIPE, else None
+  limitExceeded:  the ResourceLimits.LIMIT_* we killed it for, or None
+  usage:          ResourceUsage
+  """
+  def __init__(self, rc, stdout, stderr, limitExceeded, usage):
+    self.rc = rc
+    self.stdout = stdout
+    self.stderr = stderr
+    self.limitExceeded = limitExceeded
+    self.usage = usage
+
+  def toDict(self):
+    """rc, limitExceeded, and usage, e.g. to record alongside a command's output"""
+    return {
+      'rc': self.rc,
+      'limitExceeded': self.limitExceeded,
+      'usage': self.usage.toDict(),
+    }
+
+# Start sampling quickly so that short commands finish quickly,
+# then back off to this interval.
+POLL_MAX_SEC = 0.5
+# On hitting a limit we send SIGTERM, so that the tree can flush its output (e.g. regex logs),
+# then SIGKILL after this long.
+KILL_GRACE_SEC = 5
+
+def runLimited(cmd, limits, stdout=None, stderr=None, env=None, cwd=None, shell=False):
+  """Run cmd under limits, killing its process tree if it exceeds one.
+
+  The tree is cmd's session: we start cmd in a new session,
+  so processes that start their own sessions (daemons) escape.
+  When cmd exits we kill whatever it left running in the session.
+
+  Args:
+    cmd: as for subprocess.Popen
+    limits: ResourceLimits
+    stdout, stderr: as for subprocess.Popen. For subprocess.PIPE we return the output as str.
+
+  Returns:
+    LimitedRun
+  """
+  usage = ResourceUsage()
+  start = time.time()
+  proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=stdout, stderr=stderr,
+    env=env, cwd=cwd, shell=shell, close_fds=True,
+    start_new_session=True, preexec_fn=limits._setRlimits)
+  sid = proc.pid
+
+  # Drain pipes while we watch, so a chatty command cannot block on a full pipe
+  pipe2chunks = {}
+  readers = []
+  for name, pipe in [('stdout', proc.stdout), ('stderr', proc.stderr)]:
+    if pipe is not None:
+      pipe2chunks[name] = []
+      t = threading.Thread(target=_drain, args=(pipe, pipe2chunks[name]), daemon=True)
+      t.start()
+      readers.append(t)
+
+  limitExceeded = None
+  killDeadline = None
+  pollSec = 0.01
+  while True:
+    # Don't reap it yet: while it is a zombie, nobody else can have its pid (our sid)
+    exited = os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+    usage.wallClockSec = time.time() - start
+    if exited is not None:
+      break
+
+    _sampleSession(sid, usage)
+    if limitExceeded is None:
+      limitExceeded = limits.exceeded(usage)
+      if limitExceeded is not None:
+        lf_utils.log('runLimited: {} exceeded its {} limit ({}), killing it'.format(cmd, limitExceeded, usage.toDict()))
+        _signalSession(sid, signal.SIGTERM)
+        killDeadline = time.time() + KILL_GRACE_SEC
+    elif time.time() > killDeadline:
+      _signalSession(sid, signal.SIGKILL)
+      killDeadline = float('inf')
+
+    time.sleep(pollSec)
+    pollSec = min(2 * pollSec, POLL_MAX_SEC)
+
+  # Stragglers
+  _signalSession(sid, signal.SIGKILL)
+
+  # We reap it ourselves, so tell proc
+  _, status, rusage = os.wait4(proc.pid, 0)
+  if os.WIFSIGNALED(status):
+    proc.returncode = -os.WTERMSIG(status)
+  else:
+    proc.returncode = os.WEXITSTATUS(status)
+
+  # Reaped descendants are included in rusage.
+  # Not ru_maxrss: it counts our own footprint, which the child had until it exec'd.
+  usage.cpuSec = max(usage.cpuSec, rusage.ru_utime + rusage.ru_stime)
+  usage.maxProcs = max(usage.maxProcs, 1)
+
+  # A daemon that escaped the session may hold the pipes open. Don't wait for it.
+  for t in readers:
+    t.join(KILL_GRACE_SEC)
+  out = {name: b''.join(chunks).decode('utf-8', errors='replace') for name, chunks in pipe2chunks.items()}
+
+  return LimitedRun(proc.returncode, out.get('stdout'), out.get('stderr'), limitExceeded, usage)
+
+def _drain(pipe, chunks):
+  for chunk in iter(lambda: pipe.read(1 << 16), b''):
+    chunks.append(chunk)
+
+#####
+# Watching a session through /proc
+#####
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+def _sessionProcs(sid):
+  """Yield (pid, cpuSec, rssBytes) for each process in session sid.
+
+  cpuSec includes the process's reaped children, so summing over the session
+  counts each process once whether or not it is still alive.
+  Yields nothing if there is no /proc.
+  """
+  try:
+    pids = [int(d) for d in os.listdir('/proc') if d.isdigit()]
+  except OSError:
+    return
+  for pid in pids:
+    try:
+      with open('/proc/{}/stat'.format(pid), 'r') as inStream:
+        stat = inStream.read()
+    except OSError: # Gone already
+      continue
+    # Fields after "pid (comm)", from field 3 (state). comm may contain spaces and parens.
+    fields = stat[stat.rfind(')') + 2:].split()
+    if int(fields[3]) != sid:
+      continue
+    ticks = sum(int(f) for f in fields[11:15]) # utime stime cutime cstime
+    yield pid, ticks / _CLOCK_TICKS, int(fields[21]) * _PAGE_SIZE
+
+def _sampleSession(sid, usage):
+  """Update usage with the session's current footprint"""
+  cpuSec, rssBytes, nProcs = 0, 0, 0
+  for _, procCPUSec, procRSSBytes in _sessionProcs(sid):
+    cpuSec += procCPUSec
+    rssBytes += procRSSBytes
+    nProcs += 1
+  usage.cpuSec = max(usage.cpuSec, cpuSec)
+  usage.maxRSSBytes = max(usage.maxRSSBytes, rssBytes)
+  usage.maxProcs = max(usage.maxProcs, nProcs)
+
+def _signalSession(sid, sig):
+  """Signal every process in session sid"""
+  pids = set(pid for pid, _, _ in _sessionProcs(sid))
+  pids.add(sid)
+  try:
+    os.killpg(sid, sig)
+  except OSError:
+    pass
+  for pid in pids:
+    try:
+      os.kill(pid, sig)
+    except OSError:
+      pass
@@ -21,6 +21,35 @@ registryToPrimaryLanguages = {
   #'nuget':      ['c#'],
 }
 
+# Registry -> [extensions of source files in this registry's languages]
+registryToExtensionLists = {
+  'crates.io': ['.rs', '.rlib'],
+  'cpan': ['.pl', '.pm'],
+  'npm': ['.js', '.ts'],
+  'pypi': ['.py'],
+  'maven': ['.java'],
+  'rubygems': ['.rb'],
+  'packagist': ['.php'],
+  'nuget': ['.cs'],
+  'godoc': ['.go']
+}
+
+# Extension -> source lang, as in registryToPrimaryLanguages
+extensionToLang = {
+  '.rs': 'rust',
+  '.rlib': 'rust',
+  '.pl': 'perl',
+  '.pm': 'perl',
+  '.js': 'javascript',
+  '.ts': 'typescript',
+  '.py': 'python',
+  '.java': 'java',
+  '.rb': 'ruby',
+  '.php': 'php',
+  '.cs': 'c#',
+  '.go': 'go'
+}
+
 class ModuleInfo:
     """Represents a software module in a registry.
     
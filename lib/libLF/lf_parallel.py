@@ -4,8 +4,10 @@ Classes and methods to help with parallelizing a set of tasks.
 """
 
 import multiprocessing
+import concurrent.futures
 
 import os
+import fcntl
 
 import time
 import random
@@ -62,6 +64,107 @@ def map(tasks, nWorkers, rateLimit, limitUnits, jitter):
         results = list(pool.imap(runParallelTask, rlwt))
     return results
 
+def imap_unordered_budget_genr(tasks, maxWorkers, budget, nHeldSlots=1):
+    """Run a bunch of tasks in parallel within a CPUBudget, yielding as they become available.
+
+    Use this for parallelism nested inside another pool (e.g. per-file work
+    inside a per-project task), so that the two levels share the same cores.
+
+    @param tasks: An iterable of libLF.ParallelTask's
+    @param maxWorkers: Never run more than this many tasks at once
+    @param budget: A CPUBudget, or None for no budget (then we use maxWorkers)
+    @param nHeldSlots: Budget slots the caller already holds for us (e.g. the outer worker's slot).
+                       We take more from the budget opportunistically as tasks are scheduled.
+    @return results: in completion order. If any task.run() throws then we yield the exception
+    """
+    tasks = iter(tasks)
+    freeHeldSlots = nHeldSlots if budget is not None else maxWorkers
+    future2slot = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        task = next(tasks, None)
+        while task is not None or future2slot:
+            # Start as many tasks as we have slots for
+            while task is not None and len(future2slot) < maxWorkers:
+                if 0 < freeHeldSlots:
+                    freeHeldSlots -= 1
+                    slot = None
+                else:
+                    slot = budget.tryAcquireSlot()
+                    if slot is None:
+                        if future2slot:
+                            break
+                        # Nothing running, so wait our turn
+                        slot = budget.acquireSlot()
+                future2slot[executor.submit(_runParallelTask, task)] = slot
+                task = next(tasks, None)
+
+            # Wait for one to finish, and give back its slot
+            done, _ = concurrent.futures.wait(future2slot.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                slot = future2slot.pop(future)
+                if slot is None:
+                    freeHeldSlots += 1
+                else:
+                    budget.releaseSlot(slot)
+                yield future.result()
+
+class CPUBudget():
+    """A fixed number of CPU slots shared by cooperating processes.
+
+    The slots are lock files in budgetDir; a slot is in use while a process holds
+    an flock on its file. Since the OS drops the lock when the holder exits,
+    slots cannot leak if a worker crashes.
+
+    Create the budget once (CPUBudget.create) and pass budgetDir to the processes that share it.
+    """
+    _SLOT_PREFIX = 'slot-'
+    POLL_INTERVAL_SEC = 0.1
+
+    def __init__(self, budgetDir):
+        self.budgetDir = budgetDir
+        self.slotFiles = sorted(
+            os.path.join(budgetDir, f)
+            for f in os.listdir(budgetDir)
+            if f.startswith(CPUBudget._SLOT_PREFIX)
+        )
+        if not self.slotFiles:
+            raise ValueError('Error, no CPU slots in {}'.format(budgetDir))
+
+    @staticmethod
+    def create(budgetDir, nSlots):
+        """Make a budget of nSlots in budgetDir. Returns a CPUBudget."""
+        os.makedirs(budgetDir, exist_ok=True)
+        for i in range(nSlots):
+            with open(os.path.join(budgetDir, '{}{}'.format(CPUBudget._SLOT_PREFIX, i)), 'a'):
+                pass
+        return CPUBudget(budgetDir)
+
+    def nSlots(self):
+        return len(self.slotFiles)
+
+    def tryAcquireSlot(self):
+        """Returns a held slot, or None if all slots are in use"""
+        for slotFile in self.slotFiles:
+            fd = os.open(slotFile, os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def acquireSlot(self):
+        """Returns a held slot, waiting until one is free"""
+        while True:
+            slot = self.tryAcquireSlot()
+            if slot is not None:
+                return slot
+            time.sleep(CPUBudget.POLL_INTERVAL_SEC)
+
+    def releaseSlot(self, slot):
+        fcntl.flock(slot, fcntl.LOCK_UN)
+        os.close(slot)
+
 class CPUCount():
     """Estimates of number of CPUs you want. {CPU | IO | NETWORK}_BOUND"""
     if os.cpu_count():
@@ -98,6 +201,8 @@ def _runParallelTask(parallelTask):
         ret = parallelTask.run()
     except BaseException as err:
         ret = err
+    # Pool workers may be terminated once we return, taking their buffered log lines with them
+    lf_utils.flushLog()
     return ret 
 
 def _runParallelTaskJitter(parallelTask):
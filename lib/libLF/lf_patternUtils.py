@@ -1,4 +1,8 @@
 import re
+import functools
+
+import libLF.lf_regexParser as lf_regexParser
+import libLF.lf_regexFeatures as lf_regexFeatures
 
 #####
 # Misc regex functions
@@ -16,6 +20,46 @@ def perlStyleToPattern(pattern):
       pattern = pattern[l+1 : r]
   return pattern
 
+# Filter: Code snippets.
+# Each of these is a source of false omissions.
+# Regexes that are actually matching source code will be rejected.
+# Each is (substring, regex): a cheap substring test guards the regex search.
+_CODE_SNIPPETS = [
+  ('(regex)', None),
+  ('<regex>', None),
+  ('[regex]', None),
+  ('re.', re.compile(r're\.\w+\(')),
+  ('RegExp(', None),
+  ('preg_', re.compile(r'preg_\w+\(')),
+  ('console.log', None),
+  ('=', re.compile(r'\w\s+=\s+\w')),
+]
+
+# Regex syntax.
+# The Chapman&Stolee features (ISSTA'16, Table 4), after removing those subsumed by others:
+#   ADD KLE ANY STR END OR QST: the metacharacter itself
+#   WSP DEC WORD NWSP WNW NWRD ENDZ BKR NDEC VWSP NWNW: a backslash
+#     (escaping special characters is also a good indicator)
+#   LZY NCG PNG NLKA LKA OPT NLKB LKB BKRN: a '?'
+#   CG: (...)
+#   CCC RNG NCCC: [...]
+#   SNG DBB LWB: {n} {n,m} {n,}
+_REGEX_FEATURE_RE = r'''
+    [+*.^$|?\\]
+  | \([\s\S]+?\)
+  | \[[\s\S]+?\]
+  | \{\d+(?:,\d*)?\}
+'''
+
+# A single alternation answers in one pass over the string
+_REGEX_FEATURE_COMPILED_RE = re.compile(_REGEX_FEATURE_RE, re.VERBOSE)
+
+def _looksLikeCode(string):
+  for substring, regex in _CODE_SNIPPETS:
+    if substring in string and (regex is None or regex.search(string)):
+      return True
+  return False
+
 def isRegexPattern(string):
   """Returns True if string looks like a regex pattern, else False.
 
@@ -33,65 +77,14 @@ def isRegexPattern(string):
 
      Used during extraction of regexes from InternetSource.
   """
-
-  # Filter: Code snippets.
-  # Each of these is a source of false omissions.
-  # Regexes that are actually matching source code will be rejected.
-  if "(regex)" in string or "<regex>" in string or "[regex]" in string:
-    return False
-  if (   re.search(r're\.\w+\(', string)
-      or re.search(r'RegExp\(', string)
-      or re.search(r'preg_\w+\(', string)
-      or re.search(r'console\.log', string)
-      or re.search(r'\w\s+=\s+\w', string)
-  ):
+  if _looksLikeCode(string):
     return False
+  return _REGEX_FEATURE_COMPILED_RE.search(string) is not None
 
-  # Regex syntax.
-  if (False
-  # Chapman & Stolee
-  or re.search(r'\+', string) # ADD
-  or re.search(r'\([\s\S]+\)', string) # CG
-  or re.search(r'\*', string) # KLE
-  or re.search(r'\[[\s\S]+\]', string) # CCC
-  or re.search(r'\.', string) # ANY
-  or re.search(r'\[.*\-.*\]', string) # RNG
-  or re.search(r'\^', string) # STR
-  or re.search(r'\$', string) # END
-  or re.search(r'\[\^', string) # NCCC
-  or re.search(r'\\s', string) # WSP
-  or re.search(r'\|', string) # OR
-  or re.search(r'\\d', string) # DEC
-  or re.search(r'\\w', string) # WORD
-  or re.search(r'\?', string) # QST
-  or re.search(r'\+\?', string) # LZY - ADD
-  or re.search(r'\*\?', string) # LZY - KLE
-  or re.search(r'\(\?:', string) # NCG
-  or re.search(r'\(\?P<', string) # PNG
-  or re.search(r'{\d+}', string) # SNG
-  or re.search(r'\\S', string) # NWSP
-  or re.search(r'{\d+,\d+}', string) # DBB
-  or re.search(r'\(\?!', string) # NLKA
-  or re.search(r'\\b', string) # WNW
-  or re.search(r'\\W', string) # NWRD
-  or re.search(r'\{\d+,\}', string) # LWB
-  or re.search(r'\(\?=', string) # LKA
-  or re.search(r'\(\?\w+\)', string) # OPT
-  or re.search(r'\(\?<!', string) # NLKB
-  or re.search(r'\(\?<=', string) # LKB
-  or re.search(r'\\Z', string) # ENDZ
-  or re.search(r'\\\d+', string) # BKR
-  or re.search(r'\\D', string) # NDEC
-  or re.search(r'\(\?P=', string) # BKRN
-  or re.search(r'\\v', string) # VWSP
-  or re.search(r'\\B', string) # NWNW
-  # Escaping special characters is also a good indicator.
-  or re.search(r'\\', string)
-  or re.search(r'\\(\[|\])', string)
-  or re.search(r'\\(\(|\))', string)
-  ):
-    return True
-  return False
+def classifyRegexPatterns(strings):
+  """Returns isRegexPattern(s) for each s in strings, as a list."""
+  featureSearch = _REGEX_FEATURE_COMPILED_RE.search
+  return [not _looksLikeCode(s) and featureSearch(s) is not None for s in strings]
 
 def scorePatternWritingDifficulty(pattern):
   """Measure the human difficulty of WRITING a regex pattern.
@@ -104,7 +97,8 @@ def scorePatternWritingDifficulty(pattern):
   """
   return len(pattern)
 
-def scorePatternReadingDifficulty(pattern):
+@functools.lru_cache(maxsize=65536)
+def scorePatternReadingDifficulty(pattern, sourceLang=''):
   """Measure the human difficulty of READING a regex pattern.
 
   If score(r) < score(t), r is easier to read than t. 
@@ -120,9 +114,67 @@ def scorePatternReadingDifficulty(pattern):
 
     On this note, I experimented with the FAdo package but
     str2regexp did not work even in python2 for r'abc+' ??
+
+  So instead we score the parsed regex (see _scoreNodeReadingDifficulty):
+    - each token (character, escape, anchor) costs 1
+    - a group costs more the deeper it is nested
+    - a quantifier costs about as much as a token, regardless of its bounds
+    - a character class costs 1 per member, plus extra for negation and intersection
+    - each distinct Chapman&Stolee feature costs 1
+
+  Patterns we cannot parse fall back to len(pattern).
+  Results are cached per (pattern, sourceLang).
   """
-  # TODO This is too simplistic.
-  return len(pattern)
+  try:
+    ast = lf_regexParser.parseRegex(pattern, sourceLang)
+    featureVector = lf_regexFeatures.countRegexFeatures(pattern, sourceLang)
+  except lf_regexParser.RegexParseError:
+    return len(pattern)
+
+  nDistinctFeatures = len([count for count in featureVector.values() if count > 0])
+  return _scoreNodeReadingDifficulty(ast.root, 0) + nDistinctFeatures
+
+def scorePatternsReadingDifficulty(patterns, sourceLang=''):
+  """Returns scorePatternReadingDifficulty(p) for each p in patterns, as a list."""
+  return [scorePatternReadingDifficulty(p, sourceLang) for p in patterns]
+
+def _scoreNodeReadingDifficulty(node, depth):
+  """Reading difficulty of the subtree rooted at node, which is nested depth groups deep."""
+  P = lf_regexParser
+  if isinstance(node, (P.Alternation, P.Concatenation)):
+    score = 0
+    if isinstance(node, P.Alternation):
+      score += len(node.alternatives) - 1 # The |'s
+    for child in node.children():
+      score += _scoreNodeReadingDifficulty(child, depth)
+    return score
+  if isinstance(node, P.Group):
+    return 1 + depth + _scoreNodeReadingDifficulty(node.body, depth + 1)
+  if isinstance(node, P.Conditional):
+    return 2 + depth + sum(_scoreNodeReadingDifficulty(child, depth + 1) for child in node.children())
+  if isinstance(node, P.Quantifier):
+    score = 1
+    if node.max is not None and node.min != node.max and node.max != 1:
+      score += 1 # Two bounds to read
+    if node.lazy or node.possessive:
+      score += 1
+    return score + _scoreNodeReadingDifficulty(node.body, depth)
+  if isinstance(node, P.CharClass):
+    score = 1
+    if node.negated:
+      score += 1
+    for item in node.items:
+      if isinstance(item, P.CharClass):
+        score += _scoreNodeReadingDifficulty(item, depth + 1)
+      else:
+        score += 1
+    for intersection in node.intersections:
+      score += 2 + _scoreNodeReadingDifficulty(intersection, depth + 1)
+    return score
+  if isinstance(node, P.Comment):
+    return 0
+  # Tokens
+  return 1
 
 def unescapeDoubleQuotes(strPattern):
   """Convert any \" to ".
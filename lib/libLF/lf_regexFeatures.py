@@ -0,0 +1,113 @@
+"""Lingua Franca: Regex feature vectors
+
+Count the regex features of Chapman&Stolee ISSTA'16 (Table 4)
+by walking a parsed regex (see lf_regexParser).
+
+This is an in-process alternative to the featureVector produced by AutomataCLI.
+"""
+
+import libLF.lf_regexParser as lf_regexParser
+from libLF.lf_regexParser import Alternation, Anchor, Backreference, CharClass, CharRange, ClassEscape, Dot, Group, InlineFlags, Literal, Quantifier
+
+#####
+# Features
+#####
+
+# Chapman&Stolee abbreviations, in the order of isRegexPattern
+REGEX_FEATURES = [
+  'ADD', 'CG', 'KLE', 'CCC', 'ANY', 'RNG', 'STR', 'END', 'NCCC', 'WSP',
+  'OR', 'DEC', 'WORD', 'QST', 'LZY', 'NCG', 'PNG', 'SNG', 'NWSP', 'DBB',
+  'NLKA', 'WNW', 'NWRD', 'LWB', 'LKA', 'OPT', 'NLKB', 'LKB', 'ENDZ', 'BKR',
+  'NDEC', 'BKRN', 'VWSP', 'NWNW',
+]
+
+_ANCHOR_TO_FEATURE = {
+  Anchor.START: 'STR',
+  Anchor.END: 'END',
+  Anchor.WORD_BOUNDARY: 'WNW',
+  Anchor.NOT_WORD_BOUNDARY: 'NWNW',
+  Anchor.END_OF_STRING: 'ENDZ',
+  Anchor.END_OF_STRING_OR_FINAL_NEWLINE: 'ENDZ',
+}
+
+_CLASS_ESCAPE_TO_FEATURE = {
+  's': 'WSP',
+  'S': 'NWSP',
+  'd': 'DEC',
+  'D': 'NDEC',
+  'w': 'WORD',
+  'W': 'NWRD',
+  'v': 'VWSP',
+  # No feature of its own: horizontal whitespace is whitespace
+  'h': 'WSP',
+  'H': 'NWSP',
+}
+
+_GROUP_TO_FEATURE = {
+  Group.CAPTURE: 'CG',
+  Group.NAMED_CAPTURE: 'PNG',
+  Group.NON_CAPTURE: 'NCG',
+  Group.LOOKAHEAD: 'LKA',
+  Group.NEG_LOOKAHEAD: 'NLKA',
+  Group.LOOKBEHIND: 'LKB',
+  Group.NEG_LOOKBEHIND: 'NLKB',
+  Group.FLAGS: 'OPT',
+}
+
+def _quantifierFeature(node):
+  if node.raw.startswith('+'):
+    return 'ADD'
+  if node.raw.startswith('*'):
+    return 'KLE'
+  if node.raw.startswith('?'):
+    return 'QST'
+  if node.max is None:
+    return 'LWB'
+  if node.min == node.max:
+    return 'SNG'
+  return 'DBB'
+
+def _nodeFeatures(node):
+  """Yields the features this node contributes (possibly repeated)."""
+  if isinstance(node, Quantifier):
+    yield _quantifierFeature(node)
+    if node.lazy:
+      yield 'LZY'
+  elif isinstance(node, Group):
+    if node.kind in _GROUP_TO_FEATURE:
+      yield _GROUP_TO_FEATURE[node.kind]
+  elif isinstance(node, CharClass):
+    yield 'NCCC' if node.negated else 'CCC'
+  elif isinstance(node, CharRange):
+    yield 'RNG'
+  elif isinstance(node, Dot):
+    yield 'ANY'
+  elif isinstance(node, Anchor):
+    if node.kind in _ANCHOR_TO_FEATURE:
+      yield _ANCHOR_TO_FEATURE[node.kind]
+  elif isinstance(node, ClassEscape):
+    if node.kind in _CLASS_ESCAPE_TO_FEATURE:
+      yield _CLASS_ESCAPE_TO_FEATURE[node.kind]
+  elif isinstance(node, Literal):
+    if node.raw == '\\v':
+      yield 'VWSP'
+  elif isinstance(node, Alternation):
+    for _ in range(len(node.alternatives) - 1):
+      yield 'OR'
+  elif isinstance(node, InlineFlags):
+    yield 'OPT'
+  elif isinstance(node, Backreference):
+    yield 'BKR' if node.name is None else 'BKRN'
+
+def countRegexFeatures(pattern, sourceLang=''):
+  """Count the Chapman&Stolee features used in this pattern.
+
+  Returns { 'FEATURE': COUNT, ... } with an entry for each of REGEX_FEATURES.
+  Raises RegexParseError if the pattern is not valid in sourceLang.
+  """
+  ast = lf_regexParser.parseRegex(pattern, sourceLang)
+  featureVector = { feature: 0 for feature in REGEX_FEATURES }
+  for node in ast.walk():
+    for feature in _nodeFeatures(node):
+      featureVector[feature] += 1
+  return featureVector
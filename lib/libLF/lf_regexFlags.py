@@ -1,5 +1,19 @@
+import functools
+
 class LFFlag():
-  """Represents a regex flag."""
+  """Represents a regex flag.
+
+  Flags are interned: each subclass has one instance, so MultiLineAnchors() is MultiLineAnchors().
+  Each subclass also has a distinct 'bit', so a set of flags fits in an int (see langFlagsToBitmasks).
+  """
+  _instances = {}
+  bit = 0
+
+  def __new__(cls, *args, **kwargs):
+    if cls not in LFFlag._instances:
+      LFFlag._instances[cls] = super().__new__(cls)
+    return LFFlag._instances[cls]
+
   def __init__(self, name, desc):
     self.name = name
     self.desc = desc
@@ -217,7 +231,111 @@ _langFlagToLFFlag = {
   }
 }
 
+# Bit order for bitmasks. Append only, so that saved bitmasks stay meaningful.
+ALL_LF_FLAG_CLASSES = [
+  MultiLineAnchors, StartingAnchor, DollarIsTrueEnd, DotAll, CaseInsensitive, Comments, Eval,
+  CharsetRestrictedUnicode, CharsetUnicode, CharsetUTF8, CharsetLocale, Debug,
+  GlobalSearch, StickySearch, ASCIIMatchForBuiltInCharClasses, Optimize, Ungreedy, DebugInfo,
+]
+for _i, _lfFlagClass in enumerate(ALL_LF_FLAG_CLASSES):
+  _lfFlagClass.bit = 1 << _i
+
+# Flattened: (lang, flagInLang) -> LFFlag instance
+_langAndFlagToLFFlag = {
+  (lang, flag): lfFlagClass()
+  for lang, flagToLFFlag in _langFlagToLFFlag.items()
+  for flag, lfFlagClass in flagToLFFlag.items()
+}
+
+# Python's re module flags by value, for flags given as a number (e.g. re.I | re.M == 10)
+_pythonFlagValueToLFFlag = {
+  2: CaseInsensitive(), # re.I
+  4: CharsetLocale(), # re.L
+  8: MultiLineAnchors(), # re.M
+  16: DotAll(), # re.S
+  32: CharsetUnicode(), # re.U
+  64: Comments(), # re.X
+  128: DebugInfo(), # re.DEBUG
+  256: ASCIIMatchForBuiltInCharClasses(), # re.A
+}
+
 def langFlagToLFFlag(lang, flag):
   """Return the LF Flag for $flag in $lang."""
-  lfFlagClass = _langFlagToLFFlag[lang][flag]
-  return lfFlagClass()
+  return _langAndFlagToLFFlag[(lang, flag)]
+
+#####
+# Bulk flag normalization
+#####
+
+def langFlagsToBitmasks(langFlagsPairs):
+  """Map (lang, flags) pairs to bitmasks of LFFlag.bit's.
+
+  lang: as in langFlagToLFFlag, case-insensitive
+  flags: the flags as an extractor reports them.
+    A string of flag characters ('gim'),
+    or for Python: flag names, possibly qualified or |-joined ('re.I|re.M'), or a number ('10').
+    Or a list of any of these (['re.DOTALL', 're.UNICODE']).
+
+  Flags we do not recognize contribute nothing,
+  nor do the extractors' placeholders ('FLAGLESS', 'DYNAMIC-FLAGS').
+
+  Returns int[], in the order of langFlagsPairs.
+  """
+  masks = []
+  for lang, flags in langFlagsPairs:
+    if type(flags) is list:
+      flags = tuple(flags)
+    masks.append(_langFlagsToBitmask(lang.lower(), flags))
+  return masks
+
+def langFlagsToBitmask(lang, flags):
+  """Like langFlagsToBitmasks, for one (lang, flags) pair."""
+  return langFlagsToBitmasks([(lang, flags)])[0]
+
+def bitmaskToLFFlags(bitmask):
+  """Return the LFFlag's in this bitmask."""
+  return [lfFlagClass() for lfFlagClass in ALL_LF_FLAG_CLASSES if bitmask & lfFlagClass.bit]
+
+def countFlagsInBitmasks(bitmasks):
+  """Return { LFFlag.name: the number of bitmasks that include it } for every LFFlag."""
+  counts = { lfFlagClass().name: 0 for lfFlagClass in ALL_LF_FLAG_CLASSES }
+  # Count each distinct bitmask once
+  bitmaskCounts = {}
+  for bitmask in bitmasks:
+    bitmaskCounts[bitmask] = bitmaskCounts.get(bitmask, 0) + 1
+  for bitmask, n in bitmaskCounts.items():
+    for lfFlag in bitmaskToLFFlags(bitmask):
+      counts[lfFlag.name] += n
+  return counts
+
+@functools.lru_cache(maxsize=4096)
+def _langFlagsToBitmask(lang, flags):
+  if type(flags) is tuple:
+    mask = 0
+    for f in flags:
+      mask |= _langFlagsToBitmask(lang, f)
+    return mask
+
+  if type(flags) is not str or flags == 'FLAGLESS' or flags.startswith('DYNAMIC'):
+    return 0
+
+  mask = 0
+  if lang == 'python':
+    for token in flags.split('|'):
+      token = token.strip()
+      if token.isdigit():
+        value = int(token)
+        for flagValue, lfFlag in _pythonFlagValueToLFFlag.items():
+          if value & flagValue:
+            mask |= lfFlag.bit
+        continue
+      token = token.split('.')[-1] # re.DOTALL -> DOTALL
+      lfFlag = _langAndFlagToLFFlag.get((lang, token))
+      if lfFlag is not None:
+        mask |= lfFlag.bit
+  else:
+    for c in flags:
+      lfFlag = _langAndFlagToLFFlag.get((lang, c))
+      if lfFlag is not None:
+        mask |= lfFlag.bit
+  return mask
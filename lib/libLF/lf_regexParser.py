@@ -0,0 +1,1337 @@
+"""Lingua Franca: Regex parser
+
+Tokenize and parse regex patterns from the major dialects
+(Python, JavaScript, Perl, Java) into an AST,
+and emit an AST as an equivalent C# pattern.
+
+The AST is dialect-neutral. Dialect-specific syntax
+(e.g. Python's (?P<name>...) vs. JavaScript's (?<name>...))
+is resolved during parsing.
+"""
+
+import functools
+import re
+import unicodedata
+
+#####
+# Errors
+#####
+
+class RegexParseError(ValueError):
+  """The pattern is not a valid regex in the source dialect."""
+  def __init__(self, msg, pattern, pos):
+    super().__init__('{} at position {} in /{}/'.format(msg, pos, pattern))
+    self.pattern = pattern
+    self.pos = pos
+
+class UntranslatableRegexError(ValueError):
+  """The pattern uses a feature that has no equivalent in the destination dialect."""
+  pass
+
+#####
+# Dialects
+#####
+
+class RegexDialect:
+  """Syntax switches for a source language.
+
+  Only the syntax that differs between the dialects we study is described here.
+  """
+  def __init__(self, name,
+    pythonNamedGroups=False, angleNamedGroups=True, quoteNamedGroups=False,
+    quoting=False, possessive=False, atomicGroups=True,
+    conditionals=False, recursion=False, posixClasses=False, classSetOps=False,
+    emptyClasses=False, verticalWhitespaceClass=False, horizontalWhitespaceClass=False,
+    backslashZIsEndOfString=False, strictBraces=False, pythonLowerBoundElision=False,
+    unicodeProperties=True, identityEscapes=True,
+    alarmEscape=True, escapeEscape=True, braceOctalEscapes=False, namedCharacters=False, longUnicodeEscapes=False):
+    self.name = name
+    self.pythonNamedGroups = pythonNamedGroups # (?P<name>...), (?P=name)
+    self.angleNamedGroups = angleNamedGroups # (?<name>...), \k<name>
+    self.quoteNamedGroups = quoteNamedGroups # (?'name'...), \k'name', \g{name}
+    self.quoting = quoting # \Q...\E
+    self.possessive = possessive # a++, a*+, a?+, a{1,2}+
+    self.atomicGroups = atomicGroups # (?>...)
+    self.conditionals = conditionals # (?(1)yes|no)
+    self.recursion = recursion # (?R), (?1), (?&name), (?P>name)
+    self.posixClasses = posixClasses # [[:alpha:]]
+    self.classSetOps = classSetOps # [a-z&&[^aeiou]], [a[bc]]
+    self.emptyClasses = emptyClasses # [] and [^]
+    self.verticalWhitespaceClass = verticalWhitespaceClass # \v is a class, not a vertical tab
+    self.horizontalWhitespaceClass = horizontalWhitespaceClass # \h
+    self.backslashZIsEndOfString = backslashZIsEndOfString # Python's \Z is everyone else's \z
+    self.strictBraces = strictBraces # '{' that is not a quantifier is an error
+    self.pythonLowerBoundElision = pythonLowerBoundElision # a{,3} means a{0,3}
+    self.unicodeProperties = unicodeProperties # \p{L}
+    self.identityEscapes = identityEscapes # \y means y
+    self.alarmEscape = alarmEscape # \a is BEL
+    self.escapeEscape = escapeEscape # \e is ESC
+    self.braceOctalEscapes = braceOctalEscapes # \o{101}
+    self.namedCharacters = namedCharacters # \N{LATIN CAPITAL LETTER A}, \N{U+41}
+    self.longUnicodeEscapes = longUnicodeEscapes # \U00000041
+
+_DIALECTS = {
+  'python': RegexDialect('python',
+    pythonNamedGroups=True, angleNamedGroups=False,
+    conditionals=True,
+    backslashZIsEndOfString=True, pythonLowerBoundElision=True,
+    unicodeProperties=False, identityEscapes=False,
+    escapeEscape=False, namedCharacters=True, longUnicodeEscapes=True),
+  # \a, \e, \o and \N are identity escapes in JS: /\a/ matches 'a'
+  'javascript': RegexDialect('javascript',
+    atomicGroups=False,
+    emptyClasses=True,
+    alarmEscape=False, escapeEscape=False),
+  'perl': RegexDialect('perl',
+    quoteNamedGroups=True,
+    quoting=True, possessive=True,
+    conditionals=True, recursion=True, posixClasses=True,
+    verticalWhitespaceClass=True, horizontalWhitespaceClass=True,
+    braceOctalEscapes=True, namedCharacters=True),
+  'java': RegexDialect('java',
+    quoting=True, possessive=True,
+    classSetOps=True,
+    verticalWhitespaceClass=True, horizontalWhitespaceClass=True,
+    strictBraces=True, identityEscapes=False,
+    namedCharacters=True),
+  # Unknown source language: accept the union of the common syntaxes.
+  # \h is horizontal whitespace wherever it means anything, but \v is a vertical tab (as in C#).
+  # Other letter escapes mean different things in different languages, so we reject them
+  # rather than guess that \y means y.
+  '': RegexDialect('generic',
+    pythonNamedGroups=True, quoteNamedGroups=True,
+    quoting=True, possessive=True,
+    conditionals=True, recursion=True, posixClasses=True,
+    horizontalWhitespaceClass=True, identityEscapes=False,
+    braceOctalEscapes=True, namedCharacters=True, longUnicodeEscapes=True),
+}
+_DIALECTS['typescript'] = _DIALECTS['javascript']
+
+def getRegexDialect(sourceLang):
+  """Return the RegexDialect for this language. Unknown languages get the generic dialect."""
+  if sourceLang is None:
+    sourceLang = ''
+  return _DIALECTS.get(sourceLang.lower(), _DIALECTS[''])
+
+#####
+# AST
+#####
+
+class RegexNode:
+  """Base class for AST nodes.
+
+  Leaf nodes carry 'raw', the source text they were parsed from.
+  """
+  def children(self):
+    return []
+
+  def walk(self):
+    """Pre-order traversal of this subtree."""
+    stack = [self]
+    while stack:
+      node = stack.pop()
+      yield node
+      stack.extend(reversed(node.children()))
+
+class Alternation(RegexNode):
+  def __init__(self, alternatives):
+    self.alternatives = alternatives
+  def children(self):
+    return self.alternatives
+
+class Concatenation(RegexNode):
+  def __init__(self, items):
+    self.items = items
+  def children(self):
+    return self.items
+
+class Literal(RegexNode):
+  def __init__(self, char, raw):
+    self.char = char
+    self.raw = raw
+
+class Dot(RegexNode):
+  def __init__(self):
+    self.raw = '.'
+
+class Anchor(RegexNode):
+  """kind: one of Anchor.KINDS"""
+  START = '^'
+  END = '$'
+  WORD_BOUNDARY = 'b'
+  NOT_WORD_BOUNDARY = 'B'
+  START_OF_STRING = 'A'
+  END_OF_STRING = 'z'
+  END_OF_STRING_OR_FINAL_NEWLINE = 'Z'
+  PREVIOUS_MATCH_END = 'G'
+  KINDS = [START, END, WORD_BOUNDARY, NOT_WORD_BOUNDARY, START_OF_STRING, END_OF_STRING, END_OF_STRING_OR_FINAL_NEWLINE, PREVIOUS_MATCH_END]
+  def __init__(self, kind, raw):
+    self.kind = kind
+    self.raw = raw
+
+class ClassEscape(RegexNode):
+  """Built-in character class: kind is one of 'dDwWsShHvV'"""
+  def __init__(self, kind, raw):
+    self.kind = kind
+    self.raw = raw
+
+class UnicodeProperty(RegexNode):
+  def __init__(self, name, negated, raw):
+    self.name = name
+    self.negated = negated
+    self.raw = raw
+
+class PosixClass(RegexNode):
+  """[:alpha:] and friends. Only appears inside a CharClass."""
+  def __init__(self, name, negated, raw):
+    self.name = name
+    self.negated = negated
+    self.raw = raw
+
+class CharRange(RegexNode):
+  """lo-hi inside a CharClass. lo and hi are Literals."""
+  def __init__(self, lo, hi):
+    self.lo = lo
+    self.hi = hi
+  def children(self):
+    return [self.lo, self.hi]
+
+class CharClass(RegexNode):
+  """[...]
+
+  items: Literal, CharRange, ClassEscape, UnicodeProperty, PosixClass, or (Java) CharClass
+  intersections: CharClass[] for Java's [a-z&&[^aeiou]]
+  """
+  def __init__(self, negated, items, intersections=None):
+    self.negated = negated
+    self.items = items
+    self.intersections = intersections if intersections is not None else []
+  def children(self):
+    return self.items + self.intersections
+
+class InlineFlags(RegexNode):
+  """(?i-m) or the flags of a scoped (?i-m:...) group"""
+  def __init__(self, on, off, caret=False):
+    self.on = on
+    self.off = off
+    self.caret = caret # Perl's (?^...)
+
+class Group(RegexNode):
+  """Any parenthesized construct with a body: kind is one of Group.KINDS"""
+  CAPTURE = 'capture'
+  NAMED_CAPTURE = 'named capture'
+  NON_CAPTURE = 'non-capture'
+  LOOKAHEAD = 'lookahead'
+  NEG_LOOKAHEAD = 'negative lookahead'
+  LOOKBEHIND = 'lookbehind'
+  NEG_LOOKBEHIND = 'negative lookbehind'
+  ATOMIC = 'atomic'
+  FLAGS = 'flags' # (?i:...)
+  BRANCH_RESET = 'branch reset' # Perl (?|...)
+  KINDS = [CAPTURE, NAMED_CAPTURE, NON_CAPTURE, LOOKAHEAD, NEG_LOOKAHEAD, LOOKBEHIND, NEG_LOOKBEHIND, ATOMIC, FLAGS, BRANCH_RESET]
+  def __init__(self, kind, body, name=None, number=None, flags=None):
+    self.kind = kind
+    self.body = body
+    self.name = name
+    self.number = number # Capture groups only
+    self.flags = flags # FLAGS only
+  def children(self):
+    return [self.body]
+
+class Backreference(RegexNode):
+  """Exactly one of number, name is set."""
+  def __init__(self, raw, number=None, name=None):
+    self.raw = raw
+    self.number = number
+    self.name = name
+
+class Quantifier(RegexNode):
+  """body{min,max}. max is None if unbounded."""
+  def __init__(self, body, min, max, lazy, possessive, raw):
+    self.body = body
+    self.min = min
+    self.max = max
+    self.lazy = lazy
+    self.possessive = possessive
+    self.raw = raw
+  def children(self):
+    return [self.body]
+
+class Conditional(RegexNode):
+  """(?(condition)yes|no)
+
+  condition: a group number, a group name, or a lookaround Group
+  """
+  def __init__(self, condition, yes, no):
+    self.condition = condition
+    self.yes = yes
+    self.no = no
+  def children(self):
+    kids = []
+    if isinstance(self.condition, RegexNode):
+      kids.append(self.condition)
+    kids.append(self.yes)
+    if self.no is not None:
+      kids.append(self.no)
+    return kids
+
+class Comment(RegexNode):
+  def __init__(self, raw):
+    self.raw = raw
+
+class Unsupported(RegexNode):
+  """Valid in the source dialect, but has no C# equivalent (recursion, \\K, verbs, ...)"""
+  def __init__(self, feature, raw):
+    self.feature = feature
+    self.raw = raw
+
+class RegexAST:
+  """A parsed pattern.
+
+  Members: pattern sourceLang root nCaptureGroups groupNames{number: name}
+  """
+  def __init__(self, pattern, sourceLang, root, nCaptureGroups, groupNames):
+    self.pattern = pattern
+    self.sourceLang = sourceLang
+    self.root = root
+    self.nCaptureGroups = nCaptureGroups
+    self.groupNames = groupNames
+
+  def walk(self):
+    return self.root.walk()
+
+#####
+# Parser
+#####
+
+_HEX_DIGITS = '0123456789abcdefABCDEF'
+_OCTAL_DIGITS = '01234567'
+_SIMPLE_ESCAPES = { 'n': '\n', 't': '\t', 'r': '\r', 'f': '\f' }
+_NAME_RE = re.compile(r'[A-Za-z_]\w*')
+_BRACE_QUANT_RE = re.compile(r'\{(\d*)(,?)(\d*)\}')
+_POSIX_CLASS_RE = re.compile(r'\[:(\^?)([a-z]+):\]')
+_FLAG_CHARS = 'imsxnpadluUJ'
+
+class RegexParser:
+  """Recursive-descent parser for one pattern in one dialect."""
+  def __init__(self, pattern, sourceLang=''):
+    self.pattern = pattern
+    self.sourceLang = sourceLang
+    self.dialect = getRegexDialect(sourceLang)
+
+  def parse(self):
+    """Returns a RegexAST. Raises RegexParseError."""
+    self.pos = 0
+    self.nCaptureGroups = 0
+    self.groupNames = {}
+    self.extended = False # (?x) in effect
+    root = self._parseAlternation()
+    if self.pos < len(self.pattern):
+      # Only a ')' can stop the top-level alternation early
+      self._error('unbalanced parenthesis')
+    return RegexAST(self.pattern, self.sourceLang, root, self.nCaptureGroups, self.groupNames)
+
+  # Helpers
+
+  def _error(self, msg):
+    raise RegexParseError(msg, self.pattern, self.pos)
+
+  def _peek(self, offset=0):
+    ix = self.pos + offset
+    if ix < len(self.pattern):
+      return self.pattern[ix]
+    return None
+
+  def _lookingAt(self, s):
+    return self.pattern.startswith(s, self.pos)
+
+  def _atEnd(self):
+    return self.pos >= len(self.pattern)
+
+  def _skipExtended(self):
+    """In (?x) mode, skip whitespace and #-comments."""
+    while self.extended and not self._atEnd():
+      c = self._peek()
+      if c.isspace():
+        self.pos += 1
+      elif c == '#':
+        end = self.pattern.find('\n', self.pos)
+        self.pos = len(self.pattern) if end == -1 else end + 1
+      else:
+        break
+
+  def _readUntil(self, terminator, what):
+    end = self.pattern.find(terminator, self.pos)
+    if end == -1:
+      self._error('missing {} in {}'.format(terminator, what))
+    s = self.pattern[self.pos:end]
+    self.pos = end + len(terminator)
+    return s
+
+  def _readName(self, terminator):
+    name = self._readUntil(terminator, 'group name')
+    if not _NAME_RE.fullmatch(name):
+      self._error('bad group name <{}>'.format(name))
+    return name
+
+  # Structure
+
+  def _parseAlternation(self):
+    alternatives = [self._parseConcatenation()]
+    while self._peek() == '|':
+      self.pos += 1
+      alternatives.append(self._parseConcatenation())
+    if len(alternatives) == 1:
+      return alternatives[0]
+    return Alternation(alternatives)
+
+  def _parseConcatenation(self):
+    items = []
+    while True:
+      self._skipExtended()
+      c = self._peek()
+      if c is None or c == '|' or c == ')':
+        break
+      atoms = self._parseAtom()
+      if not atoms:
+        continue
+      items.extend(atoms)
+
+      # Quantifiers bind to the last atom
+      self._skipExtended()
+      quantified = self._parseQuantifier(items[-1])
+      if quantified is not None:
+        items[-1] = quantified
+        self._skipExtended()
+        if self._peek() in ('*', '+', '?') or (self._peek() == '{' and self._braceQuantifierAhead()):
+          self._error('multiple repeat')
+
+    if len(items) == 1:
+      return items[0]
+    return Concatenation(items)
+
+  def _braceQuantifierAhead(self):
+    m = _BRACE_QUANT_RE.match(self.pattern, self.pos)
+    if not m:
+      return False
+    lo, comma, hi = m.groups()
+    if lo:
+      return True
+    return bool(self.dialect.pythonLowerBoundElision and comma)
+
+  def _parseQuantifier(self, body):
+    """Returns a Quantifier wrapping body, or None if no quantifier follows."""
+    start = self.pos
+    c = self._peek()
+    if c == '*':
+      lo, hi = 0, None
+      self.pos += 1
+    elif c == '+':
+      lo, hi = 1, None
+      self.pos += 1
+    elif c == '?':
+      lo, hi = 0, 1
+      self.pos += 1
+    elif c == '{' and self._braceQuantifierAhead():
+      m = _BRACE_QUANT_RE.match(self.pattern, self.pos)
+      loStr, comma, hiStr = m.groups()
+      lo = int(loStr) if loStr else 0
+      if comma:
+        hi = int(hiStr) if hiStr else None
+      else:
+        hi = lo
+      if hi is not None and hi < lo:
+        self._error('min repeat greater than max repeat')
+      self.pos = m.end()
+    else:
+      return None
+
+    if not self._isQuantifiable(body):
+      self.pos = start
+      self._error('nothing to repeat')
+
+    lazy = False
+    possessive = False
+    if self._peek() == '?':
+      lazy = True
+      self.pos += 1
+    elif self._peek() == '+' and self.dialect.possessive:
+      possessive = True
+      self.pos += 1
+    return Quantifier(body, lo, hi, lazy, possessive, self.pattern[start:self.pos])
+
+  def _isQuantifiable(self, node):
+    if isinstance(node, (Quantifier, Comment)):
+      return False
+    if isinstance(node, InlineFlags):
+      return False
+    return True
+
+  # Atoms
+
+  def _parseAtom(self):
+    """Returns a list of nodes (usually one). Empty if the input was skipped."""
+    c = self._peek()
+    if c == '(':
+      node = self._parseGroup()
+      return [node] if node is not None else []
+    if c == '[':
+      return [self._parseCharClass()]
+    if c == '.':
+      self.pos += 1
+      return [Dot()]
+    if c == '^':
+      self.pos += 1
+      return [Anchor(Anchor.START, '^')]
+    if c == '$':
+      self.pos += 1
+      return [Anchor(Anchor.END, '$')]
+    if c == '\\':
+      return self._parseEscape()
+    if c in ('*', '+', '?'):
+      self._error('nothing to repeat')
+    if c == '{':
+      if self._braceQuantifierAhead() or self.dialect.strictBraces:
+        self._error('nothing to repeat')
+    self.pos += 1
+    return [Literal(c, c)]
+
+  def _parseGroup(self):
+    start = self.pos
+    self.pos += 1 # (
+
+    if self._lookingAt('*') and self.dialect.recursion:
+      # Perl backtracking control verbs: (*FAIL), (*SKIP), ...
+      raw = '(' + self._readUntil(')', 'verb') + ')'
+      return Unsupported('backtracking control verb', raw)
+
+    if not self._lookingAt('?'):
+      self.nCaptureGroups += 1
+      number = self.nCaptureGroups
+      body = self._parseGroupBody()
+      return Group(Group.CAPTURE, body, number=number)
+
+    self.pos += 1 # ?
+    c = self._peek()
+    if c == ':':
+      self.pos += 1
+      return Group(Group.NON_CAPTURE, self._parseGroupBody())
+    if c == '=':
+      self.pos += 1
+      return Group(Group.LOOKAHEAD, self._parseGroupBody())
+    if c == '!':
+      self.pos += 1
+      return Group(Group.NEG_LOOKAHEAD, self._parseGroupBody())
+    if self._lookingAt('<=') or self._lookingAt('<!'):
+      kind = Group.LOOKBEHIND if self._lookingAt('<=') else Group.NEG_LOOKBEHIND
+      self.pos += 2
+      return Group(kind, self._parseGroupBody())
+    if c == '>' and self.dialect.atomicGroups:
+      self.pos += 1
+      return Group(Group.ATOMIC, self._parseGroupBody())
+    if c == '#':
+      raw = self.pattern[start:start + 2] + self._readUntil(')', 'comment') + ')'
+      return Comment(raw)
+    if c == 'P' and self.dialect.pythonNamedGroups:
+      self.pos += 1
+      if self._lookingAt('<'):
+        self.pos += 1
+        return self._namedGroup(self._readName('>'))
+      if self._lookingAt('='):
+        self.pos += 1
+        name = self._readName(')')
+        return Backreference(self.pattern[start:self.pos], name=name)
+      if self._lookingAt('>') and self.dialect.recursion:
+        self.pos += 1
+        self._readName(')')
+        return Unsupported('recursion', self.pattern[start:self.pos])
+      self._error('unknown extension ?P')
+    if c == '<' and self.dialect.angleNamedGroups:
+      self.pos += 1
+      return self._namedGroup(self._readName('>'))
+    if c == "'" and self.dialect.quoteNamedGroups:
+      self.pos += 1
+      return self._namedGroup(self._readName("'"))
+    if c == '|' and self.dialect.recursion:
+      self.pos += 1
+      body = self._parseGroupBody()
+      return Group(Group.BRANCH_RESET, body)
+    if c == '(' and self.dialect.conditionals:
+      return self._parseConditional()
+    if self.dialect.recursion and (c == 'R' or c == '&' or (c is not None and c in '+-0123456789' and self._recursionAhead())):
+      raw = '(?' + self._readUntil(')', 'recursion') + ')'
+      return Unsupported('recursion', raw)
+    if c is not None and (c in _FLAG_CHARS or c in '-^'):
+      return self._parseFlags()
+    self._error('unknown extension ?{}'.format(c))
+
+  def _recursionAhead(self):
+    return re.match(r'[+-]?\d+\)', self.pattern[self.pos:]) is not None
+
+  def _namedGroup(self, name):
+    self.nCaptureGroups += 1
+    number = self.nCaptureGroups
+    self.groupNames[number] = name
+    body = self._parseGroupBody()
+    return Group(Group.NAMED_CAPTURE, body, name=name, number=number)
+
+  def _parseGroupBody(self):
+    """Parse through the closing ')'. Flags set inside the group end with it."""
+    savedExtended = self.extended
+    body = self._parseAlternation()
+    if self._peek() != ')':
+      self._error('missing ), unterminated subpattern')
+    self.pos += 1
+    self.extended = savedExtended
+    return body
+
+  def _parseFlags(self):
+    caret = False
+    if self._peek() == '^':
+      caret = True
+      self.pos += 1
+    on = ''
+    off = ''
+    seenDash = False
+    while True:
+      c = self._peek()
+      if c is None:
+        self._error('missing -, : or )')
+      if c == '-' and not seenDash:
+        seenDash = True
+      elif c in _FLAG_CHARS:
+        if seenDash:
+          off += c
+        else:
+          on += c
+      else:
+        break
+      self.pos += 1
+    flags = InlineFlags(on, off, caret)
+
+    if self._peek() == ')':
+      # Applies to the rest of the enclosing group
+      self.pos += 1
+      if 'x' in on:
+        self.extended = True
+      elif 'x' in off or caret:
+        self.extended = False
+      return flags
+    if self._peek() == ':':
+      self.pos += 1
+      savedExtended = self.extended
+      if 'x' in on:
+        self.extended = True
+      elif 'x' in off or caret:
+        self.extended = False
+      body = self._parseAlternation()
+      if self._peek() != ')':
+        self._error('missing ), unterminated subpattern')
+      self.pos += 1
+      self.extended = savedExtended
+      return Group(Group.FLAGS, body, flags=flags)
+    self._error('unknown flag')
+
+  def _parseConditional(self):
+    self.pos += 1 # (
+    if self._lookingAt('?=') or self._lookingAt('?!') or self._lookingAt('?<=') or self._lookingAt('?<!'):
+      self.pos -= 1
+      condition = self._parseGroup()
+    else:
+      cond = self._readUntil(')', 'conditional')
+      if cond.isdigit():
+        condition = int(cond)
+      elif len(cond) > 2 and cond[0] + cond[-1] in ('<>', "''"):
+        condition = cond[1:-1]
+      elif _NAME_RE.fullmatch(cond):
+        condition = cond
+      else:
+        self._error('bad condition <{}>'.format(cond))
+
+    body = self._parseAlternation()
+    if self._peek() != ')':
+      self._error('missing ), unterminated conditional')
+    self.pos += 1
+
+    if isinstance(body, Alternation):
+      if len(body.alternatives) > 2:
+        self._error('conditional with more than two branches')
+      yes, no = body.alternatives
+    else:
+      yes, no = body, None
+    return Conditional(condition, yes, no)
+
+  # Escapes
+
+  def _parseEscape(self, inClass=False):
+    """Parse a backslash sequence. Returns a list of nodes."""
+    start = self.pos
+    self.pos += 1 # backslash
+    c = self._peek()
+    if c is None:
+      self._error('bad escape (end of pattern)')
+    self.pos += 1
+
+    def raw():
+      return self.pattern[start:self.pos]
+
+    # Built-in classes
+    if c in 'dDwWsS':
+      return [ClassEscape(c, raw())]
+    if c in 'vV' and self.dialect.verticalWhitespaceClass:
+      return [ClassEscape(c, raw())]
+    if c in 'hH' and self.dialect.horizontalWhitespaceClass:
+      return [ClassEscape(c, raw())]
+    if c in 'pP' and self.dialect.unicodeProperties:
+      if self._peek() == '{':
+        self.pos += 1
+        name = self._readUntil('}', 'property name')
+      elif self._peek() is not None:
+        name = self._peek()
+        self.pos += 1
+      else:
+        self._error('bad property')
+      negated = (c == 'P')
+      if name.startswith('^'):
+        name = name[1:]
+        negated = not negated
+      return [UnicodeProperty(name, negated, raw())]
+
+    # Characters
+    if c in _SIMPLE_ESCAPES:
+      return [Literal(_SIMPLE_ESCAPES[c], raw())]
+    if c == 'a' and self.dialect.alarmEscape:
+      return [Literal('\x07', raw())]
+    if c == 'e' and self.dialect.escapeEscape:
+      return [Literal('\x1b', raw())]
+    if c == 'v':
+      return [Literal('\x0b', raw())]
+    if c == 'b' and inClass:
+      return [Literal('\x08', raw())]
+    if c == 'x':
+      return [self._parseHexEscape(start, ['{'], 2)]
+    if c == 'u':
+      return [self._parseHexEscape(start, ['{'], 4)]
+    if c == 'U' and self.dialect.longUnicodeEscapes:
+      return [self._parseHexEscape(start, [], 8)]
+    if c == 'c':
+      letter = self._peek()
+      if letter is None or not letter.isalpha():
+        if self.dialect.identityEscapes:
+          return [Literal('c', raw())]
+        self._error('bad control escape')
+      self.pos += 1
+      return [Literal(chr(ord(letter.upper()) ^ 0x40), raw())]
+    if c == 'o' and self.dialect.braceOctalEscapes and self._peek() == '{':
+      self.pos += 1
+      digits = self._readUntil('}', 'octal escape')
+      if not digits or any(d not in _OCTAL_DIGITS for d in digits):
+        self._error('bad octal escape')
+      return [self._codepointLiteral(int(digits, 8), raw())]
+    if c == 'N' and self.dialect.namedCharacters and self._peek() == '{':
+      self.pos += 1
+      name = self._readUntil('}', 'character name')
+      if name.startswith('U+'):
+        digits = name[2:]
+        if not digits or any(d not in _HEX_DIGITS for d in digits):
+          self._error('bad character name')
+        return [self._codepointLiteral(int(digits, 16), raw())]
+      try:
+        return [Literal(unicodedata.lookup(name), raw())]
+      except KeyError:
+        self._error('undefined character name <{}>'.format(name))
+    if c == '0':
+      digits = '0'
+      while len(digits) < 3 and self._peek() is not None and self._peek() in _OCTAL_DIGITS:
+        digits += self._peek()
+        self.pos += 1
+      return [Literal(chr(int(digits, 8)), raw())]
+    if c in '123456789':
+      digits = c
+      while self._peek() is not None and self._peek().isdigit():
+        digits += self._peek()
+        self.pos += 1
+      if inClass:
+        # No backreferences in a class. Octal if possible.
+        if all(d in _OCTAL_DIGITS for d in digits):
+          return [Literal(chr(int(digits, 8)), raw())]
+        self._error('bad escape in character class')
+      return [Backreference(raw(), number=int(digits))]
+
+    # Assertions (not inside classes)
+    if not inClass:
+      if c in 'bB':
+        return [Anchor(c, raw())]
+      if c == 'A' and self.dialect.name != 'javascript':
+        return [Anchor(Anchor.START_OF_STRING, raw())]
+      if c == 'Z' and self.dialect.name != 'javascript':
+        if self.dialect.backslashZIsEndOfString:
+          return [Anchor(Anchor.END_OF_STRING, raw())]
+        return [Anchor(Anchor.END_OF_STRING_OR_FINAL_NEWLINE, raw())]
+      if c == 'z' and self.dialect.name not in ('javascript', 'python'):
+        return [Anchor(Anchor.END_OF_STRING, raw())]
+      if c == 'G' and self.dialect.name not in ('javascript', 'python'):
+        return [Anchor(Anchor.PREVIOUS_MATCH_END, raw())]
+      if c == 'K' and self.dialect.name not in ('javascript', 'python'):
+        return [Unsupported('match reset \\K', raw())]
+      if c in 'RX' and self.dialect.name not in ('javascript', 'python'):
+        return [Unsupported('\\' + c, raw())]
+
+      # Named backreferences
+      if c == 'k' and (self.dialect.angleNamedGroups or self.dialect.quoteNamedGroups):
+        opener = self._peek()
+        closer = { '<': '>', "'": "'", '{': '}' }.get(opener)
+        if closer is not None:
+          self.pos += 1
+          name = self._readUntil(closer, 'group name')
+          if name.isdigit():
+            return [Backreference(raw(), number=int(name))]
+          if not _NAME_RE.fullmatch(name):
+            self._error('bad group name <{}>'.format(name))
+          return [Backreference(raw(), name=name)]
+        if self.dialect.name == 'javascript':
+          return [Literal('k', raw())]
+        self._error('bad named backreference')
+      if c == 'g' and self.dialect.quoteNamedGroups:
+        return [self._parsePerlG(start)]
+
+    # Quoting
+    if c == 'Q' and self.dialect.quoting:
+      end = self.pattern.find('\\E', self.pos)
+      if end == -1:
+        end = len(self.pattern)
+      literals = [Literal(ch, ch) for ch in self.pattern[self.pos:end]]
+      self.pos = min(end + 2, len(self.pattern))
+      for lit in literals:
+        lit.quoted = True
+      return literals
+    if c == 'E' and self.dialect.quoting:
+      # Stray \E is ignored
+      return []
+
+    # Anything else: escaped metacharacter or identity escape
+    if c.isalnum() and not self.dialect.identityEscapes:
+      self.pos = start
+      self._error('bad escape \\{}'.format(c))
+    return [Literal(c, raw())]
+
+  def _parseHexEscape(self, start, openers, nDigits):
+    """\\xHH, \\x{H..}, \\uHHHH, \\u{H..}, \\UHHHHHHHH"""
+    if self._peek() in openers:
+      self.pos += 1
+      digits = self._readUntil('}', 'hex escape')
+    else:
+      digits = self.pattern[self.pos:self.pos + nDigits]
+      if len(digits) != nDigits or any(d not in _HEX_DIGITS for d in digits):
+        if self.dialect.identityEscapes:
+          # e.g. JS /\xZ/ is 'xZ'
+          letter = self.pattern[start + 1]
+          return Literal(letter, self.pattern[start:self.pos])
+        self._error('incomplete escape')
+      self.pos += nDigits
+    if not digits or any(d not in _HEX_DIGITS for d in digits):
+      self._error('bad hex escape')
+    return self._codepointLiteral(int(digits, 16), self.pattern[start:self.pos])
+
+  def _codepointLiteral(self, cp, raw):
+    if cp > 0x10FFFF:
+      self._error('code point out of range')
+    return Literal(chr(cp), raw)
+
+  def _parsePerlG(self, start):
+    """\\g1 \\g{1} \\g{-1} \\g{name}"""
+    if self._peek() == '{':
+      self.pos += 1
+      ref = self._readUntil('}', 'backreference')
+    else:
+      m = re.match(r'-?\d+', self.pattern[self.pos:])
+      if not m:
+        self._error('bad \\g reference')
+      ref = m.group(0)
+      self.pos += len(ref)
+    raw = self.pattern[start:self.pos]
+    if re.fullmatch(r'-\d+', ref):
+      number = self.nCaptureGroups + int(ref) + 1
+      if number < 1:
+        self._error('reference to non-existent group')
+      return Backreference(raw, number=number)
+    if ref.isdigit():
+      return Backreference(raw, number=int(ref))
+    if _NAME_RE.fullmatch(ref):
+      return Backreference(raw, name=ref)
+    self._error('bad \\g reference')
+
+  # Character classes
+
+  def _parseCharClass(self):
+    self.pos += 1 # [
+    negated = False
+    if self._peek() == '^':
+      negated = True
+      self.pos += 1
+
+    if self._peek() == ']' and self.dialect.emptyClasses:
+      self.pos += 1
+      return CharClass(negated, [])
+
+    items = []
+    intersections = []
+    first = True
+    while True:
+      c = self._peek()
+      if c is None:
+        self._error('unterminated character set')
+      if c == ']' and not first:
+        self.pos += 1
+        break
+      first = False
+
+      if self.dialect.classSetOps and self._lookingAt('&&'):
+        self.pos += 2
+        intersections.append(self._parseIntersectionOperand())
+        continue
+      if self.dialect.classSetOps and c == '[':
+        items.append(self._parseCharClass())
+        continue
+      if self.dialect.posixClasses and c == '[':
+        m = _POSIX_CLASS_RE.match(self.pattern, self.pos)
+        if m:
+          self.pos = m.end()
+          items.append(PosixClass(m.group(2), m.group(1) == '^', m.group(0)))
+          continue
+      if self.dialect.quoting and self._lookingAt('\\Q'):
+        items.extend(self._parseClassQuote())
+        continue
+
+      item = self._parseClassAtom()
+      if item is None:
+        continue
+
+      # Range?
+      if isinstance(item, Literal) and self._peek() == '-' and self._peek(1) not in (']', None):
+        save = self.pos
+        self.pos += 1
+        hi = self._parseClassAtom()
+        if isinstance(hi, Literal):
+          if ord(hi.char) < ord(item.char):
+            self._error('bad character range {}-{}'.format(item.raw, hi.raw))
+          items.append(CharRange(item, hi))
+          continue
+        if self.dialect.name == 'python':
+          self._error('bad character range')
+        # '-' before a class escape is literal
+        self.pos = save
+      items.append(item)
+    return CharClass(negated, items, intersections)
+
+  def _parseIntersectionOperand(self):
+    """Java: the operand after && runs to the next && or the closing ]"""
+    if self._peek() == '[':
+      operand = self._parseCharClass()
+      if self._peek() == ']' or self._lookingAt('&&'):
+        return operand
+      items = [operand]
+    else:
+      items = []
+    while self._peek() != ']' and not self._lookingAt('&&'):
+      if self._peek() is None:
+        self._error('unterminated character set')
+      if self._peek() == '[':
+        items.append(self._parseCharClass())
+        continue
+      if self._lookingAt('\\Q'):
+        items.extend(self._parseClassQuote())
+        continue
+      item = self._parseClassAtom()
+      if item is not None:
+        if isinstance(item, Literal) and self._peek() == '-' and self._peek(1) not in (']', None):
+          self.pos += 1
+          hi = self._parseClassAtom()
+          if not isinstance(hi, Literal) or ord(hi.char) < ord(item.char):
+            self._error('bad character range')
+          item = CharRange(item, hi)
+        items.append(item)
+    return CharClass(False, items)
+
+  def _parseClassAtom(self):
+    """Returns a node, or None if the input was skipped (a stray \\E).
+
+    \\Q...\\E in a class is handled by the caller via _parseClassQuote.
+    """
+    c = self._peek()
+    if c == '\\':
+      nodes = self._parseEscape(inClass=True)
+      if not nodes:
+        return None
+      return nodes[0]
+    self.pos += 1
+    return Literal(c, c)
+
+  def _parseClassQuote(self):
+    """\\Q...\\E inside a class: each quoted char is a member."""
+    return self._parseEscape(inClass=True)
+
+#####
+# Parsing API
+#####
+
+@functools.lru_cache(maxsize=65536)
+def parseRegex(pattern, sourceLang=''):
+  """Parse this pattern from this language into a RegexAST.
+
+  Results are cached per (pattern, sourceLang); treat the returned AST as read-only.
+
+  Raises RegexParseError.
+  """
+  return RegexParser(pattern, sourceLang).parse()
+
+#####
+# C# emitter
+#####
+
+# Escapes whose meaning is the same in C#
+_CSHARP_SAFE_ESCAPE_RE = re.compile(r'\\(?:[ntrfaev]|x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|c[A-Za-z])')
+_CSHARP_METACHARS = set('\\.^$|?*+()[]{}#')
+_CSHARP_CLASS_METACHARS = set('\\]^-[')
+_SIMPLE_QUANTIFIER_RE = re.compile(r'(?:[*+?]|\{\d+(?:,\d*)?\})\??')
+
+# .NET supports general categories and named blocks (IsX) but not scripts
+_UNICODE_CATEGORIES = set('L Lu Ll Lt Lm Lo M Mn Mc Me N Nd Nl No P Pc Pd Ps Pe Pi Pf Po S Sm Sc Sk So Z Zs Zl Zp C Cc Cf Cs Co Cn'.split())
+
+_POSIX_CLASS_CONTENTS = {
+  'alpha': 'a-zA-Z',
+  'digit': '0-9',
+  'alnum': '0-9a-zA-Z',
+  'upper': 'A-Z',
+  'lower': 'a-z',
+  'space': r'\t\n\v\f\r ',
+  'blank': r'\t ',
+  'punct': r'!-/:-@\[-`{-~',
+  'xdigit': '0-9A-Fa-f',
+  'word': r'\w',
+  'cntrl': r'\x00-\x1F\x7F',
+  'print': r'\x20-\x7E',
+  'graph': r'\x21-\x7E',
+  'ascii': r'\x00-\x7F',
+}
+
+_VERTICAL_WHITESPACE = r'\n\x0B\f\r\x85  '
+_HORIZONTAL_WHITESPACE = r'\t\x20\xA0 ᠎ -   　'
+
+# Inline flags
+_CSHARP_FLAGS = 'imnsx'
+_CHARSET_FLAGS = 'adlLuU' # Charset modifiers; replaced by altUnicodeFlag
+_IGNORED_FLAGS = 'p' # Perl's "preserve" has no effect on matching
+
+class CSharpEmitter:
+  """Emit a RegexAST as an equivalent C# pattern.
+
+  Leaf nodes are emitted from their source text when that text means
+  the same thing in C#, so translated patterns stay close to the original.
+
+  If altUnicodeFlag is specified, charset flags like (?u) are replaced with it
+  to preserve the presence/absence of flags.
+  """
+  def __init__(self, ast, altUnicodeFlag=''):
+    self.ast = ast
+    self.altUnicodeFlag = altUnicodeFlag
+    self.groupNumberMap = self._computeGroupNumberMap()
+
+  def emit(self):
+    """Returns the C# pattern. Raises UntranslatableRegexError."""
+    return self._emit(self.ast.root)
+
+  def _untranslatable(self, msg):
+    raise UntranslatableRegexError('Error, cannot translate /{}/ to C#: {}'.format(self.ast.pattern, msg))
+
+  def _computeGroupNumberMap(self):
+    """.NET numbers the unnamed groups first, then the named groups."""
+    unnamed = [n for n in range(1, self.ast.nCaptureGroups + 1) if n not in self.ast.groupNames]
+    named = [n for n in range(1, self.ast.nCaptureGroups + 1) if n in self.ast.groupNames]
+    return { orig: ix + 1 for ix, orig in enumerate(unnamed + named) }
+
+  def _emit(self, node):
+    emitFunc = getattr(self, '_emit' + type(node).__name__)
+    return emitFunc(node)
+
+  # Structure
+
+  def _emitAlternation(self, node):
+    return '|'.join(self._emit(alt) for alt in node.alternatives)
+
+  def _emitConcatenation(self, node):
+    parts = [self._emit(item) for item in node.items]
+    for i, item in enumerate(node.items[:-1]):
+      # \1 followed by a literal 0 would read as \10
+      if isinstance(item, Backreference) and parts[i + 1][:1].isdigit():
+        parts[i] = '\\k<{}>'.format(self._backrefTarget(item))
+    return ''.join(parts)
+
+  def _emitGroup(self, node):
+    body = self._emit(node.body)
+    if node.kind == Group.CAPTURE:
+      return '(' + body + ')'
+    if node.kind == Group.NAMED_CAPTURE:
+      return '(?<{}>'.format(node.name) + body + ')'
+    if node.kind == Group.FLAGS:
+      return '(?' + self._flagString(node.flags) + ':' + body + ')'
+    if node.kind == Group.BRANCH_RESET:
+      self._untranslatable('branch reset group')
+    prefix = {
+      Group.NON_CAPTURE: '(?:',
+      Group.LOOKAHEAD: '(?=',
+      Group.NEG_LOOKAHEAD: '(?!',
+      Group.LOOKBEHIND: '(?<=',
+      Group.NEG_LOOKBEHIND: '(?<!',
+      Group.ATOMIC: '(?>',
+    }[node.kind]
+    return prefix + body + ')'
+
+  def _emitInlineFlags(self, node):
+    flags = self._flagString(node)
+    if not flags:
+      return ''
+    return '(?' + flags + ')'
+
+  def _flagString(self, flags):
+    if 'J' in flags.on + flags.off:
+      self._untranslatable('duplicate group names flag')
+    if self.ast.sourceLang.lower() == 'java' and 'd' in flags.on + flags.off:
+      self._untranslatable('UNIX_LINES flag')
+
+    on = ''
+    for c in flags.on:
+      if c in _CSHARP_FLAGS:
+        on += c
+      elif c in _CHARSET_FLAGS:
+        on += self.altUnicodeFlag
+      elif c in _IGNORED_FLAGS:
+        pass
+      else:
+        self._untranslatable('flag {}'.format(c))
+    off = ''.join(c for c in flags.off if c in _CSHARP_FLAGS)
+    if flags.caret:
+      # Perl's (?^...) resets to the defaults before applying its own flags
+      off += ''.join(c for c in 'imsx' if c not in on and c not in off)
+    on = ''.join(sorted(set(on), key=on.index))
+    off = ''.join(sorted(set(off), key=off.index))
+    if off:
+      return on + '-' + off
+    return on
+
+  def _emitQuantifier(self, node):
+    body = self._emit(node.body)
+    if isinstance(node.body, Literal) and len(body) > 1 and self._isSurrogatePair(node.body):
+      body = '(?:' + body + ')'
+
+    if _SIMPLE_QUANTIFIER_RE.fullmatch(node.raw):
+      quant = node.raw
+    else:
+      quant = self._quantifierString(node)
+
+    if node.possessive:
+      # a*+ is (?>a*)
+      return '(?>' + body + quant + ')'
+    return body + quant
+
+  def _quantifierString(self, node):
+    if node.max is None:
+      q = { 0: '*', 1: '+' }.get(node.min, '{' + str(node.min) + ',}')
+    elif node.min == 0 and node.max == 1:
+      q = '?'
+    elif node.min == node.max:
+      q = '{' + str(node.min) + '}'
+    else:
+      q = '{' + str(node.min) + ',' + str(node.max) + '}'
+    if node.lazy:
+      q += '?'
+    return q
+
+  def _emitConditional(self, node):
+    cond = node.condition
+    if isinstance(cond, int):
+      condStr = str(self._mapGroupNumber(cond))
+    elif isinstance(cond, str):
+      condStr = cond
+    else:
+      condStr = self._emit(cond)
+    s = '(?(' + condStr + ')' + self._emit(node.yes)
+    if node.no is not None:
+      s += '|' + self._emit(node.no)
+    return s + ')'
+
+  def _emitComment(self, node):
+    return node.raw
+
+  def _emitUnsupported(self, node):
+    self._untranslatable(node.feature)
+
+  # Leaves
+
+  def _emitDot(self, node):
+    return '.'
+
+  def _emitAnchor(self, node):
+    if node.kind in (Anchor.START, Anchor.END):
+      return node.kind
+    return '\\' + node.kind
+
+  def _emitClassEscape(self, node, inClass=False):
+    if node.kind in 'dDwWsS':
+      return '\\' + node.kind
+    contents = _VERTICAL_WHITESPACE if node.kind in 'vV' else _HORIZONTAL_WHITESPACE
+    negated = node.kind in 'VH'
+    if inClass:
+      if negated:
+        self._untranslatable('negated \\{} in a character class'.format(node.kind))
+      return contents
+    return '[' + ('^' if negated else '') + contents + ']'
+
+  def _emitUnicodeProperty(self, node, inClass=False):
+    name = node.name
+    if name.startswith('In') or name.startswith('Is'):
+      name = 'Is' + name[2:]
+    elif name not in _UNICODE_CATEGORIES:
+      self._untranslatable('Unicode property {}'.format(node.name))
+    return '\\' + ('P' if node.negated else 'p') + '{' + name + '}'
+
+  def _emitBackreference(self, node):
+    if node.name is not None:
+      return '\\k<' + node.name + '>'
+    target = self._backrefTarget(node)
+    if target == node.number and re.fullmatch(r'\\\d+', node.raw):
+      return node.raw
+    return '\\k<{}>'.format(target)
+
+  def _backrefTarget(self, node):
+    if node.name is not None:
+      return node.name
+    return self._mapGroupNumber(node.number)
+
+  def _mapGroupNumber(self, number):
+    return self.groupNumberMap.get(number, number)
+
+  def _emitLiteral(self, node, inClass=False):
+    raw = node.raw
+    char = node.char
+    quoted = getattr(node, 'quoted', False)
+
+    if raw.startswith('\\'):
+      if len(raw) == 2 and raw[1].isalnum() and raw[1] == char:
+        # Identity escape, e.g. JavaScript /\y/ or /\a/
+        return char
+      if _CSHARP_SAFE_ESCAPE_RE.fullmatch(raw) or (inClass and raw == '\\b'):
+        return raw
+      if len(raw) == 2 and not raw[1].isalnum():
+        return raw
+      return self._codepointEscape(char, inClass)
+
+    # Unescaped
+    if inClass:
+      if quoted and char in _CSHARP_CLASS_METACHARS:
+        return '\\' + char
+      return raw
+    if char in '{}':
+      return '\\' + char
+    if quoted and (char in _CSHARP_METACHARS or char.isspace()):
+      return '\\' + char
+    return raw
+
+  def _codepointEscape(self, char, inClass):
+    cp = ord(char)
+    if cp <= 0xFFFF:
+      return '\\u{:04X}'.format(cp)
+    if inClass:
+      self._untranslatable('astral code point U+{:X} in a character class'.format(cp))
+    # C# strings are UTF-16
+    cp -= 0x10000
+    return '\\u{:04X}\\u{:04X}'.format(0xD800 + (cp >> 10), 0xDC00 + (cp & 0x3FF))
+
+  def _isSurrogatePair(self, node):
+    return ord(node.char) > 0xFFFF
+
+  # Character classes
+
+  def _emitCharClass(self, node):
+    if not node.items and not node.intersections:
+      # JavaScript's [] matches nothing and [^] matches anything
+      return '[\\s\\S]' if node.negated else '(?!)'
+
+    contents = self._classContents(node)
+    if node.intersections:
+      if node.negated:
+        self._untranslatable('negated class with intersection')
+      if len(node.intersections) > 1 or not contents:
+        self._untranslatable('character class intersection')
+      # [A&&B] is [A-[^B]], and [A&&[^B]] is [A-[B]]
+      operand = node.intersections[0]
+      subtracted = '[' + ('' if operand.negated else '^') + self._classContents(operand) + ']'
+      contents += '-' + subtracted
+    return '[' + ('^' if node.negated else '') + contents + ']'
+
+  def _classContents(self, node):
+    parts = []
+    for i, item in enumerate(node.items):
+      if isinstance(item, CharClass):
+        # Java union: [a[bc]] is [abc]
+        if item.negated or item.intersections:
+          self._untranslatable('nested character class')
+        parts.append(self._classContents(item))
+      elif isinstance(item, CharRange):
+        parts.append(self._emitLiteral(item.lo, inClass=True) + '-' + self._emitLiteral(item.hi, inClass=True))
+      elif isinstance(item, PosixClass):
+        if item.negated:
+          self._untranslatable('negated POSIX class')
+        if item.name not in _POSIX_CLASS_CONTENTS:
+          self._untranslatable('POSIX class {}'.format(item.name))
+        parts.append(_POSIX_CLASS_CONTENTS[item.name])
+      elif isinstance(item, Literal):
+        s = self._emitLiteral(item, inClass=True)
+        if s == '-' and 0 < i < len(node.items) - 1:
+          s = '\\-'
+        elif s == '^' and i == 0 and not parts:
+          s = '\\^'
+        elif s == ']' and i == 0:
+          s = '\\]'
+        elif s == '[':
+          s = '\\['
+        parts.append(s)
+      else:
+        parts.append(self._emitClassItem(item))
+    return ''.join(parts)
+
+  def _emitClassItem(self, node):
+    if isinstance(node, ClassEscape):
+      return self._emitClassEscape(node, inClass=True)
+    if isinstance(node, UnicodeProperty):
+      return self._emitUnicodeProperty(node, inClass=True)
+    return self._emit(node)
+
+#####
+# Translation API
+#####
+
+@functools.lru_cache(maxsize=65536)
+def translateRegexToCSharp(pattern, sourceLang='', altUnicodeFlag=''):
+  """Translate this pattern from this language into C#.
+
+  Results are cached per (pattern, sourceLang, altUnicodeFlag).
+
+  Raises RegexParseError if the pattern is not valid in sourceLang,
+  and UntranslatableRegexError if it has no C# equivalent.
+  """
+  ast = parseRegex(pattern, sourceLang)
+  return CSharpEmitter(ast, altUnicodeFlag).emit()
+
+def canTranslateRegexToCSharp(pattern, sourceLang=''):
+  """True if translateRegexToCSharp will succeed.
+
+  This is the one test of "has a C# equivalent" (cf. RegexTranslator.canTranslateRegex).
+  Patterns the parser rejects are not translatable. Each dialect accepts its language's syntax
+  and the generic dialect accepts the union, so these are malformed or ambiguous.
+  """
+  try:
+    translateRegexToCSharp(pattern, sourceLang)
+    return True
+  except (RegexParseError, UntranslatableRegexError):
+    return False
@@ -2,13 +2,18 @@
 """
 
 import os
+import sys
 import tempfile
 import json
 
 import libLF
+import libLF.lf_utils as lf_utils
 
 import re
 
+# Per-regex logging, in hot loops
+_log = lf_utils.getLogger('lf_regexUsage')
+
 #####
 # SimpleRegexUsage
 #####
@@ -144,6 +149,71 @@ def sfwrToRegexUsageList(sfwr):
   libLF.log('sfwrToRegexUsageList: Got {} regexes from {}'.format(len(ruList), sfwr.fileName))
   return ruList
 
+#####
+# ExtractionCache
+#####
+
+class ExtractionCache:
+  """Content-addressed cache of extraction results, shared across projects and runs.
+
+  Keyed by (hash of the file's bytes, language, extractor version), so a file
+  is re-parsed only if it, or the extractor that parses it, has changed.
+  Vendored-by-copy files that recur across projects are parsed once.
+
+  lang2extractorFiles: { lang: [the code that determines lang's extraction results] }
+  inProcessLangs: langs extracted in this interpreter, e.g. with the ast module.
+    Their results also depend on the Python version.
+
+  Layout: cacheDir/lang/extractorVersion/ab/abcdef....json
+  Each entry is one SimpleFileWithRegexes as NDJSON.
+  Entries are written atomically, so concurrent extractors can share a cacheDir.
+  """
+  # Bump to invalidate every entry, e.g. if SFWR changes
+  CACHE_FORMAT_VERSION = 1
+
+  def __init__(self, cacheDir, lang2extractorFiles, inProcessLangs=None):
+    self.cacheDir = cacheDir
+    self.lang2extractorFiles = lang2extractorFiles
+    self.inProcessLangs = inProcessLangs if inProcessLangs is not None else []
+    self.nHits = 0
+    self.nMisses = 0
+    self._lang2extractorVersion = {}
+
+  def _extractorVersion(self, lang):
+    """Hash of the code that extracts this language"""
+    if lang not in self._lang2extractorVersion:
+      hashes = [str(ExtractionCache.CACHE_FORMAT_VERSION)]
+      if lang in self.inProcessLangs:
+        hashes.append(lf_utils.hashString(sys.version))
+      for f in self.lang2extractorFiles.get(lang, []):
+        try:
+          with open(f, 'rb') as inStream:
+            hashes.append(lf_utils.hashBytes(inStream.read()))
+        except OSError:
+          hashes.append('missing')
+      self._lang2extractorVersion[lang] = lf_utils.hashString('-'.join(hashes))
+    return self._lang2extractorVersion[lang]
+
+  def _entryPath(self, lang, contentHash):
+    return os.path.join(self.cacheDir, lang, self._extractorVersion(lang), contentHash[:2], contentHash + '.json')
+
+  def lookup(self, lang, contentHash, sourceFile):
+    """Returns the cached SimpleFileWithRegexes for sourceFile, or None"""
+    try:
+      with open(self._entryPath(lang, contentHash), 'r') as inStream:
+        sfwr = SimpleFileWithRegexes()
+        sfwr.initFromNDJSON(inStream.read().strip())
+    except (OSError, ValueError, KeyError):
+      self.nMisses += 1
+      return None
+    self.nHits += 1
+    # The entry may have come from a copy of this file elsewhere
+    sfwr.fileName = sourceFile['name']
+    return sfwr
+
+  def store(self, lang, contentHash, sfwr):
+    lf_utils.writeFileAtomically(self._entryPath(lang, contentHash), sfwr.toNDJSON() + '\n')
+
 #####
 # RegexUsageWithHistory
 #####
@@ -718,13 +788,13 @@ class RegexEvaluationResult:
     self.matchResult = matchResult
 
 class RegexTranslator:
-  """Translate regexes into Java/C# via ad hoc syntactic tweaks.
+  """Translate regexes into Java/C#.
 
-  Targets the most common features.
-  Converts about 95% of real Python and JavaScript regexes
+  Patterns are parsed and re-emitted (see lf_regexParser), which handles nesting.
+  Patterns the parser rejects fall back to ad hoc syntactic tweaks,
+  which convert about 95% of real Python and JavaScript regexes
   to something Java/C# compatible.
   """
-  # TODO Deal with nesting.
 
   # If altUnicodeFlag is specified, replace the u flag with it in capture
   # groups to preserve the presence/absence of flags.
@@ -732,10 +802,28 @@ class RegexTranslator:
   def translateRegex(pattern, sourceLang, destLang, altUnicodeFlag=''):
     assert(destLang == "C#")
     return RegexTranslator.translateToCSharp(pattern, sourceLang, altUnicodeFlag=altUnicodeFlag)
-  
+
+  @staticmethod
+  def canTranslateRegex(pattern, sourceLang, destLang):
+    """False if the pattern is malformed or uses a feature with no equivalent in destLang.
+
+    Use this to skip patterns whose translations would be rejected anyway.
+    cf. libLF.canTranslateRegexToCSharp
+    """
+    assert(destLang == "C#")
+    return libLF.canTranslateRegexToCSharp(pattern, sourceLang)
+
   @staticmethod
   def translateToCSharp(pattern, sourceLang, altUnicodeFlag=''):
-    libLF.log("translateToCSharp: Orig /{}/".format(pattern))
+    try:
+      return libLF.translateRegexToCSharp(pattern, sourceLang, altUnicodeFlag=altUnicodeFlag)
+    except (libLF.RegexParseError, libLF.UntranslatableRegexError) as err:
+      _log.debug("translateToCSharp: Could not translate /{}/: {}. Falling back to syntactic tweaks", pattern, err)
+    return RegexTranslator._translateToCSharpSyntactically(pattern, altUnicodeFlag=altUnicodeFlag)
+
+  @staticmethod
+  def _translateToCSharpSyntactically(pattern, altUnicodeFlag=''):
+    _log.debug("translateToCSharp: Orig /{}/", pattern)
     for transFunc in [
                       RegexTranslator.translateQEQuote,
                       RegexTranslator.translateCaptureGroups,
@@ -746,8 +834,8 @@ class RegexTranslator:
         pattern = transFunc(pattern, altUnicodeFlag=altUnicodeFlag)
       else:
         pattern = transFunc(pattern)
-      libLF.log(" -> /{}/".format(pattern))
-    libLF.log("translateToCSharp: Final /{}/".format(pattern))
+      _log.debug(" -> /{}/", pattern)
+    _log.debug("translateToCSharp: Final /{}/", pattern)
     return pattern
 
   @staticmethod
@@ -7,6 +7,7 @@ import libLF
 import json
 
 import os
+import subprocess
 import tempfile
 
 class PumpPair:
@@ -259,6 +260,9 @@ class SLRegexAnalysis:
     os.path.join(os.environ['REGEX_GENERALIZABILITY_PROJECT_ROOT'], 'measurement-instruments', 'worst-case-performance', 'vuln-regex-detector')
   
   MATCH_TIMEOUT_SEC = 5
+  # Validating an evil input may take this long beyond the match timeout
+  # (starting, and in some languages compiling, the test driver) before we give up on it.
+  VALIDATION_SLACK_SEC = 300
 
   EXP_PUMPS = 1 * 100 # This triggers all the true exp vulns I've seen
   POW_PUMPS = 500 * 1000 # This triggers most power vulns I've seen
@@ -375,9 +379,9 @@ class SLRegexAnalysis:
     # Query from tempfile
     with tempfile.NamedTemporaryFile(prefix='SLRegexAnalysis-queryDetectors-', suffix='.json', delete=True) as ntf:
       libLF.writeToFile(ntf.name, json.dumps(query))
-      rc, out = libLF.runcmd("VULN_REGEX_DETECTOR_ROOT={} '{}' '{}' 2>>/tmp/err" \
-        .format(self.vrdPath, self.queryDetectorsScript, ntf.name))
-      out = out.strip()
+      # The detectors enforce their own limits
+      res = self._runVRDScript(self.queryDetectorsScript, ntf.name, libLF.ResourceLimits())
+      rc, out = res.rc, res.stdout.strip()
     libLF.log('Got rc {} out\n{}'.format(rc, out))
 
     # TODO Not sure if this can go wrong.
@@ -478,14 +482,44 @@ class SLRegexAnalysis:
       libLF.log('query: {}'.format(json.dumps(query)))
       with tempfile.NamedTemporaryFile(prefix='SLRegexAnalysis-validateOpinion-', suffix='.json', delete=True) as ntf:
         libLF.writeToFile(ntf.name, json.dumps(query))
-        rc, out = libLF.runcmd("VULN_REGEX_DETECTOR_ROOT={} '{}' '{}' 2>>/tmp/err" \
-          .format(self.vrdPath, self.testInLanguageScript, ntf.name))
-        out = out.strip()
+        res = self._runVRDScript(self.testInLanguageScript, ntf.name,
+          libLF.ResourceLimits(wallClockSec=self.slTimeout + self.VALIDATION_SLACK_SEC))
+        rc, out = res.rc, res.stdout.strip()
       libLF.log('Got rc {} out\n{}'.format(rc, out))
-      slRegexVals.append(SLRegexValidation(self.regex.pattern, evilInput, json.loads(out)))
+
+      if res.limitExceeded is not None:
+        # Killed before it could report, far beyond the match timeout. Count it as a timeout.
+        libLF.log('Validation exceeded {} limit, recording a timeout'.format(res.limitExceeded))
+        rawValidationResult = {
+          'language': query['language'],
+          'validPattern': True,
+          'nPumps': nPumps,
+          'timeLimit': query['timeLimit'],
+          'timedOut': 1,
+        }
+      else:
+        try:
+          rawValidationResult = json.loads(out)
+        except ValueError as err:
+          # Nothing to learn from this attempt
+          libLF.log('Error, could not parse validation output (rc {}): {}'.format(rc, err))
+          continue
+      slRegexVals.append(SLRegexValidation(self.regex.pattern, evilInput, rawValidationResult))
 
     return slRegexVals
 
+  def _runVRDScript(self, script, queryFile, limits):
+    """Run a VRD script on queryFile under limits (libLF.ResourceLimits)
+
+    Returns:
+      libLF.LimitedRun, with stdout (str)
+    """
+    cmd = "VULN_REGEX_DETECTOR_ROOT={} '{}' '{}' 2>>/tmp/err".format(self.vrdPath, script, queryFile)
+    libLF.log('CMD: {}'.format(cmd))
+    res = libLF.runLimited(cmd, limits, stdout=subprocess.PIPE, shell=True)
+    libLF.log('{}: {}'.format(os.path.basename(script), res.toDict()))
+    return res
+
   def predictedPerformanceInLang(self, lang):
     """PREDICTED_PERFORMANCE in this lang
 
@@ -0,0 +1,77 @@
+"""Lingua Franca: Timing
+
+Structured timings for the stages of some work,
+so that you can aggregate where the time goes instead of grepping the logs.
+"""
+
+import contextlib
+import os
+import time
+
+#####
+# StageTimings
+#####
+
+def cpuSec():
+  """CPU seconds (user+sys) used so far by this process and the children it has reaped"""
+  t = os.times()
+  return t.user + t.system + t.children_user + t.children_system
+
+class StageTimings():
+  """Wall and CPU time of each stage of some work, in the order they ran.
+
+  Usage:
+    timings = StageTimings()
+    with timings.stage('untar'):
+      ...
+
+  A stage's CPU time is ours plus that of the children we reaped during it,
+  so stages that shell out are covered. Don't nest stages or run them in
+  several threads at once: they would count each other's CPU time.
+
+  Fields:
+    stages: [ { 'stage': str, 'wallSec': float, 'cpuSec': float, 'ok': bool } ]
+            ok is False if the stage raised
+  """
+  def __init__(self, stages=None):
+    self.stages = stages if stages is not None else []
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    """Time the body of the with statement as stage name"""
+    startWall, startCPU = time.time(), cpuSec()
+    ok = False
+    try:
+      yield
+      ok = True
+    finally:
+      self.add(name, time.time() - startWall, cpuSec() - startCPU, ok)
+
+  def add(self, name, wallSec, cpuSec, ok=True):
+    """Record a stage timed some other way"""
+    self.stages.append({ 'stage': name, 'wallSec': round(wallSec, 6), 'cpuSec': round(cpuSec, 6), 'ok': ok })
+
+  def extend(self, other, prefix=''):
+    """Append the stages of other (a StageTimings), prefixing their names"""
+    for s in other.stages:
+      self.add(prefix + s['stage'], s['wallSec'], s['cpuSec'], s['ok'])
+
+  def wallSec(self, name):
+    """Total wall time of the stages called name"""
+    return sum(s['wallSec'] for s in self.stages if s['stage'] == name)
+
+  def toDict(self):
+    return { 'stages': self.stages }
+
+  @staticmethod
+  def fromDict(obj):
+    return StageTimings(list(obj['stages']))
+
+#####
+# Summarizing
+#####
+
+def percentile(sortedValues, p):
+  """Nearest-rank p'th percentile of a non-empty sorted list"""
+  rank = max(1, -(-p * len(sortedValues) // 100)) # ceil
+  return sortedValues[rank - 1]
@@ -8,14 +8,192 @@ import os
 import hashlib
 import subprocess
 import shutil
+import tempfile
+import atexit
+import signal
+import threading
 
 #####
 # Logging
 #####
 
-def log(msg):
-  """Log this message."""
-  sys.stderr.write('{} {}/{}: {}\n'.format(time.strftime('%d/%m/%Y %H:%M:%S'), platform.node(), os.getpid(), msg))
+# Levels, as in the logging module
+LOG_DEBUG = 10
+LOG_INFO = 20
+LOG_WARNING = 30
+LOG_ERROR = 40
+_LOG_LEVEL_NAMES = { 'DEBUG': LOG_DEBUG, 'INFO': LOG_INFO, 'WARNING': LOG_WARNING, 'ERROR': LOG_ERROR }
+
+# Verbosity from the environment: a default level and/or per-logger levels,
+# e.g. LF_LOG_LEVEL=WARNING,lf_regexUsage=DEBUG
+LOG_LEVEL_ENV_VAR = 'LF_LOG_LEVEL'
+
+# We buffer log lines, writing them when this much is waiting, at WARNING and above,
+# and otherwise at least this often.
+# About PIPE_BUF, so that the workers' writes to a shared pipe rarely interleave mid-line.
+LOG_BUFFER_BYTES = 4096
+LOG_FLUSH_SEC = 0.5
+
+class Logger():
+  """Leveled logger for one module or script. Get one with getLogger(name).
+
+  The message is formatted as msg.format(*args), and only if its level is enabled.
+  In hot paths pass the arguments rather than formatting them yourself:
+    _log.debug('/{}/ -> /{}/', pattern, translated)
+  so that disabled calls cost little more than the call.
+  """
+  def __init__(self, name, level):
+    self.name = name
+    self.level = level
+
+  def isEnabledFor(self, level):
+    return self.level <= level
+
+  def log(self, level, msg, *args):
+    if self.level <= level:
+      _logWriter.write(level, msg.format(*args) if args else msg)
+
+  def debug(self, msg, *args):
+    if self.level <= LOG_DEBUG:
+      _logWriter.write(LOG_DEBUG, msg.format(*args) if args else msg)
+
+  def info(self, msg, *args):
+    if self.level <= LOG_INFO:
+      _logWriter.write(LOG_INFO, msg.format(*args) if args else msg)
+
+  def warning(self, msg, *args):
+    if self.level <= LOG_WARNING:
+      _logWriter.write(LOG_WARNING, msg.format(*args) if args else msg)
+
+  def error(self, msg, *args):
+    if self.level <= LOG_ERROR:
+      _logWriter.write(LOG_ERROR, msg.format(*args) if args else msg)
+
+class _LogWriter():
+  """Formats log lines and buffers them for stderr. Shared by the Loggers."""
+  def __init__(self):
+    self.host = platform.node()
+    self._reset()
+
+  def _reset(self):
+    """Start afresh, e.g. in a forked child: new pid, and no flusher thread or held lock"""
+    self.pid = os.getpid()
+    # Reentrant, for a signal handler that interrupts write() (cf. _flushLogOnSIGTERM)
+    self.lock = threading.RLock()
+    self.lines = []
+    self.nBytes = 0
+    self.stampSec = None
+    self.stamp = None
+    self.flusher = None
+
+  def write(self, level, msg):
+    sec = int(time.time())
+    with self.lock:
+      if sec != self.stampSec:
+        self.stampSec, self.stamp = sec, time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(sec))
+      line = '{} {}/{}: {}\n'.format(self.stamp, self.host, self.pid, msg)
+      self.lines.append(line)
+      self.nBytes += len(line)
+      if LOG_WARNING <= level or LOG_BUFFER_BYTES <= self.nBytes:
+        self._flushLocked()
+      elif self.flusher is None:
+        self.flusher = threading.Thread(target=self._flushPeriodically, name='libLF-log-flusher', daemon=True)
+        self.flusher.start()
+
+  def flush(self):
+    with self.lock:
+      self._flushLocked()
+
+  def _flushLocked(self):
+    if not self.lines:
+      return
+    buf = ''.join(self.lines)
+    self.lines = []
+    self.nBytes = 0
+    try:
+      sys.stderr.write(buf)
+      sys.stderr.flush()
+    except (OSError, ValueError, RuntimeError): # stderr closed, e.g. at exit, or reentered by a signal handler
+      pass
+
+  def _flushPeriodically(self):
+    while True:
+      time.sleep(LOG_FLUSH_SEC)
+      self.flush()
+
+_logWriter = _LogWriter()
+atexit.register(_logWriter.flush)
+if hasattr(os, 'register_at_fork'):
+  # Don't let the child inherit (and repeat) our buffered lines
+  os.register_at_fork(before=_logWriter.flush, after_in_child=_logWriter._reset)
+
+def _flushLogOnSIGTERM(signum, frame):
+  """Write the buffered lines, then die of SIGTERM as we would have.
+  runLimited sends SIGTERM on a timeout, and the last lines are the ones we want."""
+  _logWriter.flush()
+  signal.signal(signum, signal.SIG_DFL)
+  os.kill(os.getpid(), signum)
+
+# Unless the program has its own handler
+if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+  signal.signal(signal.SIGTERM, _flushLogOnSIGTERM)
+
+def _parseLogLevel(level):
+  """LOG_* from an int or a level name"""
+  if type(level) is int:
+    return level
+  return _LOG_LEVEL_NAMES[level.strip().upper()]
+
+def _loadLogLevelsFromEnv():
+  """Returns (default level, { name: level }) from LOG_LEVEL_ENV_VAR"""
+  defaultLevel, name2level = LOG_INFO, {}
+  for spec in os.environ.get(LOG_LEVEL_ENV_VAR, '').split(','):
+    if not spec.strip():
+      continue
+    try:
+      if '=' in spec:
+        name, level = spec.split('=', 1)
+        name2level[name.strip()] = _parseLogLevel(level)
+      else:
+        defaultLevel = _parseLogLevel(spec)
+    except KeyError:
+      sys.stderr.write('Error, {}: unknown level in {}. Use one of {}\n'.format(LOG_LEVEL_ENV_VAR, spec, sorted(_LOG_LEVEL_NAMES.keys())))
+  return defaultLevel, name2level
+
+_defaultLogLevel, _name2logLevel = _loadLogLevelsFromEnv()
+_name2logger = {}
+_defaultLogger = Logger(None, _defaultLogLevel)
+
+def getLogger(name):
+  """The Logger called name, e.g. the module or script name.
+  Its level is the one set for name, else the default."""
+  if name not in _name2logger:
+    _name2logger[name] = Logger(name, _name2logLevel.get(name, _defaultLogLevel))
+  return _name2logger[name]
+
+def setLogLevel(level, name=None):
+  """Set the level (LOG_* or 'DEBUG', ...) of the Logger called name,
+  or by default the default level, which applies to log() and to the Loggers with no level of their own."""
+  global _defaultLogLevel
+  level = _parseLogLevel(level)
+  if name is None:
+    _defaultLogLevel = level
+    _defaultLogger.level = level
+    for loggerName, logger in _name2logger.items():
+      if loggerName not in _name2logLevel:
+        logger.level = level
+  else:
+    _name2logLevel[name] = level
+    getLogger(name).level = level
+
+def flushLog():
+  """Write any buffered log lines now"""
+  _logWriter.flush()
+
+def log(msg, *args, level=LOG_INFO):
+  """Log this message, formatted as msg.format(*args) if args, at this level (default INFO)."""
+  if _defaultLogger.level <= level:
+    _logWriter.write(level, msg.format(*args) if args else msg)
 
 #####
 # Hashing strings
@@ -29,6 +207,24 @@ def hashString(string):
   hashObject = hashlib.md5(string.encode())
   return hashObject.hexdigest()
 
+def hashBytes(b):
+  """Obtain hex digest of these bytes, e.g. a file's contents.
+
+  Returns:
+    digest (str): hex chars"""
+  return hashlib.md5(b).hexdigest()
+
+def hashFile(fname, blockSize=1 << 20):
+  """Obtain hex digest of this file's contents, without reading it all into memory.
+
+  Returns:
+    digest (str): hex chars, as hashBytes would give"""
+  hashObject = hashlib.md5()
+  with open(fname, 'rb') as inStream:
+    for block in iter(lambda: inStream.read(blockSize), b''):
+      hashObject.update(block)
+  return hashObject.hexdigest()
+
 #####
 # Shelling out
 #####
@@ -113,6 +309,24 @@ def writeToFile(f, cont):
   with open(f, 'w') as out:
     out.write(cont)
 
+def writeFileAtomically(f, cont):
+  """Write cont to f such that readers see the old f or the whole new f, never part of it.
+
+  Creates f's directory if need be."""
+  d = os.path.dirname(f) or '.'
+  os.makedirs(d, exist_ok=True)
+  fd, tmpFile = tempfile.mkstemp(dir=d, prefix='.' + os.path.basename(f) + '-')
+  try:
+    with os.fdopen(fd, 'w') as out:
+      out.write(cont)
+    os.replace(tmpFile, f)
+  except BaseException:
+    try:
+      os.unlink(tmpFile)
+    except OSError:
+      pass
+    raise
+
 def writeToFileNDJSON(f, items):
   """"Write out items in NDJSON format. Each item must have a toNDJSON() method"""
   with open(f, 'w') as out:
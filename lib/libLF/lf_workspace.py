@@ -0,0 +1,139 @@
+"""Lingua Franca: Workspaces
+
+Prepare a project tree once (unpack, preprocess, instrument, ...),
+then give each attempt to build or test it a cheap clone to scribble on.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import contextlib
+
+import libLF.lf_utils as lf_utils
+
+#####
+# WorkspaceBase
+#####
+
+class WorkspaceBase():
+  """A pristine project tree, and cheap clones of it.
+
+  Clone methods, cheapest first:
+    reflink:  copy-on-write file clones (btrfs, xfs, ...). Clones are fully isolated.
+    hardlink: a farm of hard links to the base's files.
+              We make the base's files read-only, so that a clone that rewrites a
+              file in place gets an error instead of corrupting the base.
+              Tools that replace files (unlink, or write and rename) are unaffected.
+              Files you expect to be rewritten in place can be copied instead (copyRE).
+              root ignores file permissions, so we never choose this for root.
+    copy:     a plain copy.
+
+  If a clone cannot be made with the chosen method (e.g. the clone is on another
+  file system), we fall back to a copy.
+  """
+  CLONE_REFLINK = 'reflink'
+  CLONE_HARDLINK = 'hardlink'
+  CLONE_COPY = 'copy'
+  CLONE_METHODS = [CLONE_REFLINK, CLONE_HARDLINK, CLONE_COPY]
+
+  def __init__(self, baseDir, cloneMethod=None, copyRE=None):
+    """baseDir: the pristine tree. Don't modify it after this.
+    cloneMethod: one of CLONE_METHODS, or None for the cheapest that works here
+    copyRE: hardlink: copy (don't link) files whose paths relative to baseDir match this regex
+    """
+    self.baseDir = os.path.abspath(baseDir)
+    self.copyRE = copyRE
+    if cloneMethod is None:
+      cloneMethod = WorkspaceBase.bestCloneMethod(self.baseDir)
+    assert(cloneMethod in WorkspaceBase.CLONE_METHODS)
+    self.cloneMethod = cloneMethod
+
+    if self.cloneMethod == WorkspaceBase.CLONE_HARDLINK:
+      self._freeze()
+
+  @staticmethod
+  def bestCloneMethod(dirName):
+    """The cheapest clone method for trees in dirName"""
+    if WorkspaceBase._canReflink(dirName):
+      return WorkspaceBase.CLONE_REFLINK
+    if os.geteuid() != 0:
+      return WorkspaceBase.CLONE_HARDLINK
+    return WorkspaceBase.CLONE_COPY
+
+  @staticmethod
+  def _canReflink(dirName):
+    """Try to reflink a file in dirName"""
+    if not shutil.which('cp'):
+      return False
+    try:
+      probeDir = tempfile.mkdtemp(prefix='.reflink-probe-', dir=dirName)
+    except OSError:
+      return False
+    try:
+      src = os.path.join(probeDir, 'src')
+      lf_utils.writeToFile(src, 'probe')
+      res = subprocess.run(['cp', '--reflink=always', src, os.path.join(probeDir, 'dst')],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+      return res.returncode == 0
+    finally:
+      shutil.rmtree(probeDir, ignore_errors=True)
+
+  def _freeze(self):
+    """Make the base's files read-only"""
+    for dirPath, _, fileNames in os.walk(self.baseDir):
+      for f in fileNames:
+        path = os.path.join(dirPath, f)
+        if not os.path.islink(path) and not self._shouldCopy(path):
+          mode = os.stat(path).st_mode
+          os.chmod(path, mode & ~0o222)
+
+  def _shouldCopy(self, path):
+    return self.copyRE is not None and re.search(self.copyRE, os.path.relpath(path, self.baseDir))
+
+  def _linkOrCopy(self, src, dst):
+    if self._shouldCopy(src):
+      shutil.copy2(src, dst)
+    else:
+      os.link(src, dst)
+
+  def clone(self, cloneDir):
+    """Make a clone of the base at cloneDir, which must not exist yet.
+
+    Returns the clone method used.
+    """
+    try:
+      if self.cloneMethod == WorkspaceBase.CLONE_REFLINK:
+        res = subprocess.run(['cp', '-a', '--reflink=always', self.baseDir, cloneDir],
+          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if res.returncode != 0:
+          raise OSError('Error, cp --reflink failed: {}'.format(res.stderr.decode('utf-8', errors='replace')))
+        return self.cloneMethod
+      elif self.cloneMethod == WorkspaceBase.CLONE_HARDLINK:
+        shutil.copytree(self.baseDir, cloneDir, symlinks=True, copy_function=self._linkOrCopy)
+        return self.cloneMethod
+    except OSError as err:
+      lf_utils.log('WorkspaceBase: Could not {} {} to {}, copying instead: {}'.format(self.cloneMethod, self.baseDir, cloneDir, err))
+      shutil.rmtree(cloneDir, ignore_errors=True)
+
+    shutil.copytree(self.baseDir, cloneDir, symlinks=True)
+    return WorkspaceBase.CLONE_COPY
+
+  @contextlib.contextmanager
+  def workspace(self, prefix='workspace-'):
+    """A clone of the base in a new tmp dir, removed afterwards. Yields the clone's path.
+
+    The clone has the same basename as the base. We try to put it next to the base,
+    since reflinks and hard links only work within a file system.
+    """
+    try:
+      tmpDir = tempfile.mkdtemp(prefix=prefix, dir=os.path.dirname(self.baseDir))
+    except OSError:
+      tmpDir = tempfile.mkdtemp(prefix=prefix)
+    try:
+      cloneDir = os.path.join(tmpDir, os.path.basename(self.baseDir))
+      self.clone(cloneDir)
+      yield cloneDir
+    finally:
+      shutil.rmtree(tmpDir, ignore_errors=True)
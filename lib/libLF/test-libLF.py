@@ -10,8 +10,14 @@ import json
 import re
 
 import time
+import tempfile
+import subprocess
+import signal
+import contextlib
+import io
 
 import unittest
+import unittest.mock
 
 #####
 # Util
@@ -21,6 +27,58 @@ class UtilTest(unittest.TestCase):
   def test_log(self):
     libLF.log('Testing log')
 
+  def _captureLog(self, func):
+    libLF.flushLog()
+    with contextlib.redirect_stderr(io.StringIO()) as err:
+      func()
+      libLF.flushLog()
+    return err.getvalue()
+
+  def test_logLevels(self):
+    logger = libLF.getLogger('test-libLF')
+    try:
+      libLF.setLogLevel('INFO')
+      out = self._captureLog(lambda: (logger.debug('hidden {}', 1), logger.info('shown {}', 2), libLF.log('also {}', 3)))
+      self.assertNotIn('hidden', out)
+      self.assertIn(': shown 2\n', out)
+      self.assertIn(': also 3\n', out)
+      self.assertIn('/{}: '.format(os.getpid()), out)
+
+      # Per-logger verbosity
+      libLF.setLogLevel(libLF.LOG_DEBUG, 'test-libLF')
+      out = self._captureLog(lambda: (logger.debug('shown {}', 1), libLF.log('hidden', level=libLF.LOG_DEBUG)))
+      self.assertIn('shown 1', out)
+      self.assertNotIn('hidden', out)
+    finally:
+      libLF.setLogLevel('INFO', 'test-libLF')
+
+  def test_logIsLazy(self):
+    class Expensive():
+      def __format__(self, spec):
+        raise AssertionError('Formatted a disabled message')
+    logger = libLF.getLogger('test-libLF-lazy')
+    libLF.setLogLevel('INFO', 'test-libLF-lazy')
+    out = self._captureLog(lambda: logger.debug('{}', Expensive()))
+    self.assertEqual(out, '')
+    # Braces in a message without args are left alone
+    out = self._captureLog(lambda: logger.info('/a{2}/'))
+    self.assertIn('/a{2}/', out)
+
+  def test_logFlushedOnSIGTERM(self):
+    # As when runLimited times out a script. No periodic flush to save us.
+    code = '; '.join([
+      "import os, sys, time",
+      "sys.path.append('{}/lib'.format(os.environ['REGEX_GENERALIZABILITY_PROJECT_ROOT']))",
+      "import libLF",
+      "libLF.lf_utils.LOG_FLUSH_SEC = 1000",
+      "libLF.log('last words')",
+      "time.sleep(60)",
+    ])
+    res = libLF.runLimited([sys.executable, '-c', code], libLF.ResourceLimits(wallClockSec=2), stderr=subprocess.PIPE)
+    self.assertEqual(res.limitExceeded, libLF.ResourceLimits.LIMIT_WALL_CLOCK)
+    self.assertEqual(res.rc, -signal.SIGTERM)
+    self.assertIn('last words', res.stderr)
+
   def test_hashString(self):
     str1 = 'abc'
     str2 = 'def'
@@ -28,6 +86,26 @@ class UtilTest(unittest.TestCase):
     self.assertEqual(libLF.hashString(str2), libLF.hashString(str2))
     self.assertNotEqual(libLF.hashString(str1), libLF.hashString(str2))
 
+  def test_hashBytes(self):
+    self.assertEqual(libLF.hashBytes(b'abc'), libLF.hashString('abc'))
+    self.assertNotEqual(libLF.hashBytes(b'abc'), libLF.hashBytes(b'def'))
+
+  def test_hashFile(self):
+    with tempfile.NamedTemporaryFile() as f:
+      f.write(b'abc' * 1000)
+      f.flush()
+      self.assertEqual(libLF.hashFile(f.name, blockSize=7), libLF.hashBytes(b'abc' * 1000))
+
+  def test_writeFileAtomically(self):
+    with tempfile.TemporaryDirectory() as tmpDir:
+      f = os.path.join(tmpDir, 'sub', 'file.json')
+      libLF.writeFileAtomically(f, 'one')
+      libLF.writeFileAtomically(f, 'two')
+      with open(f, 'r') as inStream:
+        self.assertEqual(inStream.read(), 'two')
+      # No leftover tmp files
+      self.assertEqual(os.listdir(os.path.dirname(f)), ['file.json'])
+
   def test_runcmd(self):
     testFile = os.path.join(os.sep, 'tmp', 'testFile-{}'.format(os.getpid()))
 
@@ -202,6 +280,51 @@ class RegexUsageTest(unittest.TestCase):
 
     self.assertEqual(obj, pythonReObj)
 
+class ExtractionCacheTest(unittest.TestCase):
+  def _makeCache(self, tmpDir, extractor):
+    return libLF.ExtractionCache(os.path.join(tmpDir, 'cache'), { 'python': [extractor], 'javascript': [extractor] }, inProcessLangs=['python'])
+
+  def test_hitAndMiss(self):
+    with tempfile.TemporaryDirectory() as tmpDir:
+      extractor = os.path.join(tmpDir, 'extractor.py')
+      libLF.writeToFile(extractor, 'v1')
+      cache = self._makeCache(tmpDir, extractor)
+      contentHash = libLF.hashBytes(b'x = re.compile("a+")\n')
+
+      self.assertIsNone(cache.lookup('python', contentHash, { 'name': 'a.py' }))
+      sfwr = libLF.SimpleFileWithRegexes().initFromRaw('a.py', 'python', True, [{ 'pattern': 'a+', 'flags': '' }])
+      cache.store('python', contentHash, sfwr)
+
+      # A copy of the file elsewhere hits, under its own name
+      hit = cache.lookup('python', contentHash, { 'name': 'lib/b.py' })
+      self.assertEqual(hit.fileName, 'lib/b.py')
+      self.assertEqual(hit.regexes, sfwr.regexes)
+      # Keyed by language too
+      self.assertIsNone(cache.lookup('javascript', contentHash, { 'name': 'a.py' }))
+      self.assertEqual((cache.nHits, cache.nMisses), (1, 2))
+
+  def test_invalidation(self):
+    with tempfile.TemporaryDirectory() as tmpDir:
+      extractor = os.path.join(tmpDir, 'extractor.py')
+      libLF.writeToFile(extractor, 'v1')
+      contentHash = libLF.hashBytes(b'var x = /a+/;\n')
+      sfwr = libLF.SimpleFileWithRegexes().initFromRaw('a', 'python', True, [])
+      cache = self._makeCache(tmpDir, extractor)
+      cache.store('python', contentHash, sfwr)
+      cache.store('javascript', contentHash, sfwr)
+
+      # A different interpreter: only the in-process language misses
+      with unittest.mock.patch.object(sys, 'version', 'other'):
+        cache = self._makeCache(tmpDir, extractor)
+        self.assertIsNone(cache.lookup('python', contentHash, { 'name': 'a' }))
+        self.assertIsNotNone(cache.lookup('javascript', contentHash, { 'name': 'a' }))
+
+      # A changed extractor: everything misses
+      libLF.writeToFile(extractor, 'v2')
+      cache = self._makeCache(tmpDir, extractor)
+      self.assertIsNone(cache.lookup('python', contentHash, { 'name': 'a' }))
+      self.assertIsNone(cache.lookup('javascript', contentHash, { 'name': 'a' }))
+
 #####
 # regex
 #####
@@ -290,6 +413,10 @@ class RegexTest(unittest.TestCase):
       #libLF.log('isRegexPattern: test {}'.format(test))
       self.assertEqual(libLF.isRegexPattern(test['string']), test['result'])
 
+    # Batch variant agrees
+    self.assertEqual(libLF.classifyRegexPatterns([test['string'] for test in tests]),
+                     [test['result'] for test in tests])
+
   def test_scorePatternWritingDifficulty(self):
     patterns = [
     r'a',
@@ -303,16 +430,149 @@ class RegexTest(unittest.TestCase):
       self.assertEqual(libLF.scorePatternWritingDifficulty(p), len(p))
 
   def test_scorePatternReadingDifficulty(self):
+    # Increasingly hard to read
     patterns = [
     r'a',
     r'aa',
     r'a+b',
     r'(a+)+$',
-    r'a{500}'
+    r'((a+)+|b)*$',
     ]
+    scores = [libLF.scorePatternReadingDifficulty(p) for p in patterns]
+    self.assertEqual(scores, sorted(set(scores)))
 
-    for p in patterns:
-      self.assertEqual(libLF.scorePatternReadingDifficulty(p), len(p))
+    # Bounds are cheap to read
+    self.assertLess(libLF.scorePatternReadingDifficulty(r'a{500}'), libLF.scorePatternReadingDifficulty(r'aaaaaa'))
+
+    # Unparseable patterns fall back to their length
+    self.assertEqual(libLF.scorePatternReadingDifficulty(r'(a'), len(r'(a'))
+
+  def test_scorePatternsReadingDifficulty(self):
+    patterns = [ r'a', r'a+b', r'(a+)+$', r'a' ]
+    self.assertEqual(libLF.scorePatternsReadingDifficulty(patterns),
+                     [libLF.scorePatternReadingDifficulty(p) for p in patterns])
+
+#####
+# RegexParser
+#####
+
+class RegexParserTest(unittest.TestCase):
+  def test_parseRegex(self):
+    ast = libLF.parseRegex(r'(a)(?P<x>b|c)+', 'python')
+    self.assertEqual(ast.nCaptureGroups, 2)
+    self.assertEqual(ast.groupNames, { 2: 'x' })
+    nodeTypes = [type(node).__name__ for node in ast.walk()]
+    self.assertIn('Quantifier', nodeTypes)
+    self.assertIn('Alternation', nodeTypes)
+
+  def test_parseRegex_invalid(self):
+    tests = [
+      { 'pattern': r'(a', 'lang': 'python' },
+      { 'pattern': r'a**', 'lang': 'python' },
+      { 'pattern': r'[b-a]', 'lang': 'javascript' },
+      { 'pattern': r'a{2,1}', 'lang': 'perl' },
+      { 'pattern': r'\N{U+ZZ}', 'lang': 'perl' },
+      { 'pattern': r'\N{U+}', 'lang': '' },
+    ]
+    for test in tests:
+      with self.assertRaises(libLF.RegexParseError):
+        libLF.parseRegex(test['pattern'], test['lang'])
+
+  def test_translateRegexToCSharp(self):
+    tests = [
+      # Unchanged
+      { 'pattern': r'^\d+\.\d*$', 'lang': 'javascript', 'csharp': r'^\d+\.\d*$' },
+      # Named groups and references
+      { 'pattern': r'(?P<x>a)(?P=x)', 'lang': 'python', 'csharp': r'(?<x>a)\k<x>' },
+      # Literal curlies, including nested ones
+      { 'pattern': r'{{ (\w+) }}', 'lang': 'javascript', 'csharp': r'\{\{ (\w+) \}\}' },
+      { 'pattern': r'a{,3}', 'lang': 'python', 'csharp': r'a{0,3}' },
+      # Quoting
+      { 'pattern': r'\Qa.b\E+', 'lang': 'perl', 'csharp': r'a\.b+' },
+      # Possessive quantifiers
+      { 'pattern': r'a++b', 'lang': 'java', 'csharp': r'(?>a+)b' },
+      # Character classes
+      { 'pattern': r'[a-z&&[^aeiou]]', 'lang': 'java', 'csharp': r'[a-z-[aeiou]]' },
+      { 'pattern': r'[[:digit:]_]', 'lang': 'perl', 'csharp': r'[0-9_]' },
+      { 'pattern': r'[^]', 'lang': 'javascript', 'csharp': r'[\s\S]' },
+      # Escapes
+      { 'pattern': r'\x{263A}', 'lang': 'perl', 'csharp': r'\u263A' },
+      { 'pattern': r'\x{1F600}', 'lang': 'perl', 'csharp': r'\uD83D\uDE00' },
+      { 'pattern': r'a\Z', 'lang': 'python', 'csharp': r'a\z' },
+      { 'pattern': r'\a\e\o{101}\N{U+41}', 'lang': 'perl', 'csharp': r'\a\e\u0041\u0041' },
+      # ... but in JS these are identity escapes
+      { 'pattern': r'^\a\e[\a]$', 'lang': 'javascript', 'csharp': r'^ae[a]$' },
+      { 'pattern': r'^\o{3}$', 'lang': 'javascript', 'csharp': r'^o{3}$' },
+      { 'pattern': r'\N{U+41}', 'lang': 'typescript', 'csharp': r'N\{U+41\}' },
+      # .NET numbers named groups last
+      { 'pattern': r'(?<x>a)(b)\2', 'lang': 'javascript', 'csharp': r'(?<x>a)(b)\k<1>' },
+    ]
+    for test in tests:
+      self.assertEqual(libLF.translateRegexToCSharp(test['pattern'], test['lang']), test['csharp'])
+
+  def test_translateRegexToCSharp_flags(self):
+    self.assertEqual(libLF.translateRegexToCSharp(r'(?u)\w', 'python', altUnicodeFlag='i'), r'(?i)\w')
+    self.assertEqual(libLF.translateRegexToCSharp(r'(?iu:\w)', 'python', altUnicodeFlag='i'), r'(?i:\w)')
+    self.assertEqual(libLF.translateRegexToCSharp(r'(?u)\w', 'python'), r'\w')
+
+  def test_translateRegexToCSharp_untranslatable(self):
+    tests = [
+      { 'pattern': r'\((?:[^()]|(?R))*\)', 'lang': 'perl' },
+      { 'pattern': r'a\Kb', 'lang': 'perl' },
+      { 'pattern': r'\p{Greek}', 'lang': 'javascript' },
+      { 'pattern': r'[\x{1F600}]', 'lang': 'perl' },
+    ]
+    for test in tests:
+      with self.assertRaises(libLF.UntranslatableRegexError):
+        libLF.translateRegexToCSharp(test['pattern'], test['lang'])
+      self.assertFalse(libLF.RegexTranslator.canTranslateRegex(test['pattern'], test['lang'], 'C#'))
+
+  def test_RegexTranslator_fallback(self):
+    # Not a valid Python regex, so fall back to syntactic tweaks
+    self.assertEqual(libLF.RegexTranslator.translateRegex(r'(?P<x>a', 'python', 'C#'), r'(?<x>a')
+
+  def test_genericDialectEscapes(self):
+    # \h is horizontal whitespace, not 'h'
+    hspace = libLF.translateRegexToCSharp(r'\h', '')
+    self.assertEqual(libLF.translateRegexToCSharp(r'(\w+\h*)(=)', ''), r'(\w+' + hspace + r'*)(=)')
+    self.assertTrue(re.fullmatch(hspace, ' '))
+    self.assertFalse(re.fullmatch(hspace, 'h'))
+    # Other letter escapes are ambiguous, so we reject them
+    with self.assertRaises(libLF.RegexParseError):
+      libLF.parseRegex(r'a\yb', '')
+    self.assertEqual(libLF.RegexTranslator.translateRegex(r'a\yb', '', 'C#'), r'a\yb')
+
+  def test_canTranslateRegex(self):
+    # One policy: malformed patterns are not translatable
+    for pattern, expected in [ (r'^a+$', True), (r'(a', False), (r'a\yb', False), (r'a\Kb', False) ]:
+      self.assertEqual(libLF.canTranslateRegexToCSharp(pattern, ''), expected, pattern)
+      self.assertEqual(libLF.RegexTranslator.canTranslateRegex(pattern, '', 'C#'), expected, pattern)
+
+#####
+# RegexFeatures
+#####
+
+class RegexFeaturesTest(unittest.TestCase):
+  def test_countRegexFeatures(self):
+    fv = libLF.countRegexFeatures(r'^(a+|b*?)[^c-e]\d{2,}(?P<x>.)(?P=x)\1$', 'python')
+    self.assertEqual(set(fv.keys()), set(libLF.REGEX_FEATURES))
+    expected = { 'STR': 1, 'CG': 1, 'ADD': 1, 'OR': 1, 'KLE': 1, 'LZY': 1, 'NCCC': 1, 'RNG': 1,
+      'DEC': 1, 'LWB': 1, 'PNG': 1, 'ANY': 1, 'BKRN': 1, 'BKR': 1, 'END': 1 }
+    for feature in libLF.REGEX_FEATURES:
+      self.assertEqual(fv[feature], expected.get(feature, 0), feature)
+
+  def test_countRegexFeatures_lookarounds(self):
+    fv = libLF.countRegexFeatures(r'(?i)(?=a)(?!b)(?<=c)(?<!d)\bx\B', 'javascript')
+    for feature in ['OPT', 'LKA', 'NLKA', 'LKB', 'NLKB', 'WNW', 'NWNW']:
+      self.assertEqual(fv[feature], 1, feature)
+
+  def test_countRegexFeatures_horizontalWhitespace(self):
+    # Unknown language: \h is a class, not a literal 'h'
+    fv = libLF.countRegexFeatures(r'(\w+\h*)(=)(\h*"[^"]+")', '')
+    self.assertEqual(fv['WSP'], 2)
+    self.assertEqual(fv['CG'], 3)
+    fv = libLF.countRegexFeatures(r'\H', 'perl')
+    self.assertEqual(fv['NWSP'], 1)
 
 #####
 # LFFlag
@@ -399,6 +659,39 @@ class LFFlagTest(unittest.TestCase):
       libLF.LFFlags.DollarIsTrueEnd
     )
 
+  def test_singletons(self):
+    self.assertIs(libLF.LFFlags.langFlagToLFFlag('perl', 'm'), libLF.LFFlags.langFlagToLFFlag('javascript', 'm'))
+    self.assertIs(libLF.LFFlags.DotAll(), libLF.LFFlags.DotAll())
+
+  def test_langFlagsToBitmasks(self):
+    F = libLF.LFFlags
+    masks = F.langFlagsToBitmasks([
+      ('javascript', 'gim'),
+      ('python', ['re.DOTALL', 're.UNICODE']),
+      ('python', 're.I|re.M'),
+      ('python', '10'), # re.I | re.M
+      ('Python', ['IGNORECASE']),
+      ('python', 'FLAGLESS'),
+      ('javascript', 'DYNAMIC-FLAGS'),
+      ('php', 'iQ'), # Q is not a flag
+    ])
+    self.assertEqual(masks, [
+      F.GlobalSearch.bit | F.CaseInsensitive.bit | F.MultiLineAnchors.bit,
+      F.DotAll.bit | F.CharsetUnicode.bit,
+      F.CaseInsensitive.bit | F.MultiLineAnchors.bit,
+      F.CaseInsensitive.bit | F.MultiLineAnchors.bit,
+      F.CaseInsensitive.bit,
+      0,
+      0,
+      F.CaseInsensitive.bit,
+    ])
+    self.assertEqual(F.bitmaskToLFFlags(masks[1]), [F.DotAll(), F.CharsetUnicode()])
+
+    counts = F.countFlagsInBitmasks(masks)
+    self.assertEqual(counts['CaseInsensitive'], 5)
+    self.assertEqual(counts['DotAll'], 1)
+    self.assertEqual(counts['Ungreedy'], 0)
+
 #####
 # GitHubProject
 #####
@@ -441,6 +734,76 @@ class GitHubProjectTest(unittest.TestCase):
     ghp.initFromRaw(self.owner, self.name, self.registry, self.modules, self.nStars, self.tarballPath)
     self.assertEqual(len(ghp.modules), len(self.modules))
 
+class SourceFileDiscoveryTest(unittest.TestCase):
+  def _makeTree(self, root, files):
+    for path, contents in files.items():
+      path = os.path.join(root, path)
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path, 'w') as outStream:
+        outStream.write(contents)
+
+  def test_getAllSourceFiles(self):
+    with tempfile.TemporaryDirectory() as root:
+      self._makeTree(root, {
+        'index.js': 'var x = /a/;\n\n// comment\nvar y = 1;\n',
+        'lib/util.ts': 'let z = 1;\n',
+        'bin/cli': '#!/usr/bin/env node\nconsole.log(1);\n',
+        'bin/setup': '#!/usr/bin/env python3\n',
+        'README.md': '# Hello\n',
+        'lib/esm.mjs': 'export default 1;\n', # Not in libLF.registryToExtensionLists
+        'node_modules/dep/index.js': 'module.exports = 1;\n',
+      })
+      lang2sourceFiles = libLF.getAllSourceFiles(root, 'npm')
+      self.assertEqual(sorted(os.path.relpath(f['name'], root) for f in lang2sourceFiles['javascript']),
+        ['bin/cli', 'index.js', 'node_modules/dep/index.js'])
+      self.assertEqual([os.path.relpath(f['name'], root) for f in lang2sourceFiles['typescript']], ['lib/util.ts'])
+
+      # Pruned during the walk
+      lang2sourceFiles = libLF.getUnvendoredSourceFiles(root, 'npm')
+      self.assertEqual(sorted(os.path.relpath(f['name'], root) for f in lang2sourceFiles['javascript']),
+        ['bin/cli', 'index.js'])
+
+      # Lazy LOC
+      indexJS = [f for f in lang2sourceFiles['javascript'] if f['name'].endswith('index.js')][0]
+      self.assertNotIn('LOC', indexJS)
+      self.assertEqual(indexJS['LOC'], 2)
+
+  def test_vendorRules(self):
+    with tempfile.TemporaryDirectory() as root:
+      self._makeTree(root, {
+        'index.js': '',
+        'dist/index.min.js': '',
+        'Vendor/a.js': '',
+        'Node_Modules/dep/index.js': '',
+        'node_modules/dep/index.js': '',
+        'node_modules/dep/node_modules/dep2/index.js': '',
+        'generated/b.js': '',
+      })
+      # Defaults: a pruned dir is counted once, not per file within it
+      counters = libLF.VendorCounters()
+      lang2sourceFiles = libLF.getUnvendoredSourceFiles(root, 'npm', vendorCounters=counters)
+      self.assertEqual(sorted(os.path.relpath(f['name'], root) for f in lang2sourceFiles['javascript']),
+        ['generated/b.js', 'index.js'])
+      self.assertEqual(counters.nPrunedDirs, 3)
+      self.assertEqual(counters.nSkippedFiles, 1)
+
+      # Custom rules, from a file
+      rulesFile = os.path.join(root, 'rules.txt')
+      with open(rulesFile, 'w') as outStream:
+        outStream.write('# Generated code\n(^|/)generated/\n\n(?i)^vendor/\n')
+      rules = libLF.VendorRules.fromFile(rulesFile)
+      self.assertEqual(rules.patterns, ['(^|/)generated/', '(?i)^vendor/'])
+      counters = libLF.VendorCounters()
+      lang2sourceFiles = libLF.getUnvendoredSourceFiles(root, 'npm', vendorRules=rules, vendorCounters=counters)
+      self.assertEqual(sorted(os.path.relpath(f['name'], root) for f in lang2sourceFiles['javascript']),
+        ['Node_Modules/dep/index.js', 'dist/index.min.js', 'index.js', 'node_modules/dep/index.js', 'node_modules/dep/node_modules/dep2/index.js'])
+      self.assertEqual(counters.ruleToNHits, { '(^|/)generated/': 1, '(?i)^vendor/': 1 })
+
+      self.assertTrue(libLF.looksVendored('proj/node_modules/x.js'))
+      self.assertTrue(libLF.looksVendored('proj/Node_Modules/x.js'))
+      self.assertTrue(libLF.looksVendored('proj/THIRD_PARTY/x.js'))
+      self.assertFalse(libLF.looksVendored('proj/lib/node_modules.js'))
+
 #####
 # Parallel
 #####
@@ -542,6 +905,179 @@ class ParallelTest(unittest.TestCase):
     minSecElapsed = int(len(self.tasks)/nPerSec) - 1
     self.assertGreaterEqual(elapsedSec, minSecElapsed)
 
+class CPUBudgetTest(unittest.TestCase):
+  def test_slots(self):
+    with tempfile.TemporaryDirectory() as budgetDir:
+      budget = libLF.parallel.CPUBudget.create(budgetDir, 2)
+      # Another process sees the same slots
+      self.assertEqual(libLF.parallel.CPUBudget(budgetDir).nSlots(), 2)
+
+      slot1 = budget.tryAcquireSlot()
+      slot2 = budget.tryAcquireSlot()
+      self.assertIsNotNone(slot1)
+      self.assertIsNotNone(slot2)
+      self.assertIsNone(budget.tryAcquireSlot())
+
+      budget.releaseSlot(slot1)
+      slot3 = budget.tryAcquireSlot()
+      self.assertIsNotNone(slot3)
+      budget.releaseSlot(slot2)
+      budget.releaseSlot(slot3)
+
+  def test_imapUnorderedBudget(self):
+    tasks = [Task(i) for i in range(1, 30)]
+    with tempfile.TemporaryDirectory() as budgetDir:
+      budget = libLF.parallel.CPUBudget.create(budgetDir, 2)
+
+      # With a budget, and when the whole budget is taken by someone else
+      res = libLF.parallel.imap_unordered_budget_genr(tasks, 4, budget)
+      self.assertEqual(sorted(res), [i for i in range(1, 30)])
+
+      held = [budget.acquireSlot(), budget.acquireSlot()]
+      res = libLF.parallel.imap_unordered_budget_genr(tasks, 4, budget, nHeldSlots=1)
+      self.assertEqual(sorted(res), [i for i in range(1, 30)])
+      for slot in held:
+        budget.releaseSlot(slot)
+
+    # No budget
+    res = libLF.parallel.imap_unordered_budget_genr(tasks, 4, None)
+    self.assertEqual(sorted(res), [i for i in range(1, 30)])
+
+#####
+# Workspace
+#####
+
+class WorkspaceTest(unittest.TestCase):
+  def _makeTree(self, root):
+    os.makedirs(os.path.join(root, 'proj', 'sub'))
+    libLF.writeToFile(os.path.join(root, 'proj', 'a.txt'), 'a')
+    libLF.writeToFile(os.path.join(root, 'proj', 'sub', 'b.txt'), 'b')
+    os.symlink('a.txt', os.path.join(root, 'proj', 'link'))
+    return os.path.join(root, 'proj')
+
+  def test_bestCloneMethod(self):
+    with tempfile.TemporaryDirectory() as root:
+      self.assertIn(libLF.WorkspaceBase.bestCloneMethod(root), libLF.WorkspaceBase.CLONE_METHODS)
+
+  def test_clone(self):
+    for cloneMethod in libLF.WorkspaceBase.CLONE_METHODS:
+      with tempfile.TemporaryDirectory() as root:
+        base = libLF.WorkspaceBase(self._makeTree(root), cloneMethod)
+
+        with base.workspace() as ws:
+          self.assertEqual(os.path.basename(ws), 'proj')
+          with open(os.path.join(ws, 'sub', 'b.txt'), 'r') as inStream:
+            self.assertEqual(inStream.read(), 'b')
+          self.assertEqual(os.readlink(os.path.join(ws, 'link')), 'a.txt')
+
+          # Scribble on the clone the way build tools do
+          os.unlink(os.path.join(ws, 'a.txt'))
+          libLF.writeToFile(os.path.join(ws, 'a.txt'), 'changed')
+          libLF.writeFileAtomically(os.path.join(ws, 'sub', 'b.txt'), 'changed')
+          libLF.writeToFile(os.path.join(ws, 'new.txt'), 'new')
+        self.assertFalse(os.path.exists(ws))
+
+        # The base is pristine
+        for f, cont in [('a.txt', 'a'), (os.path.join('sub', 'b.txt'), 'b')]:
+          with open(os.path.join(root, 'proj', f), 'r') as inStream:
+            self.assertEqual(inStream.read(), cont)
+        self.assertFalse(os.path.exists(os.path.join(root, 'proj', 'new.txt')))
+
+  def test_hardlinkFreezesBase(self):
+    with tempfile.TemporaryDirectory() as root:
+      base = libLF.WorkspaceBase(self._makeTree(root), libLF.WorkspaceBase.CLONE_HARDLINK, copyRE=r'^sub/')
+      self.assertFalse(os.stat(os.path.join(root, 'proj', 'a.txt')).st_mode & 0o222)
+      self.assertTrue(os.stat(os.path.join(root, 'proj', 'sub', 'b.txt')).st_mode & 0o200)
+      with base.workspace() as ws:
+        self.assertEqual(os.stat(os.path.join(ws, 'a.txt')).st_ino, os.stat(os.path.join(root, 'proj', 'a.txt')).st_ino)
+
+        # copyRE'd files may be rewritten in place
+        libLF.writeToFile(os.path.join(ws, 'sub', 'b.txt'), 'changed')
+      with open(os.path.join(root, 'proj', 'sub', 'b.txt'), 'r') as inStream:
+        self.assertEqual(inStream.read(), 'b')
+
+#####
+# Limits
+#####
+
+class LimitsTest(unittest.TestCase):
+  def test_runLimited(self):
+    res = libLF.runLimited(['sh', '-c', 'echo out; echo err >&2; exit 3'], libLF.ResourceLimits(wallClockSec=30),
+      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    self.assertEqual(res.rc, 3)
+    self.assertEqual(res.stdout, 'out\n')
+    self.assertEqual(res.stderr, 'err\n')
+    self.assertIsNone(res.limitExceeded)
+    self.assertLess(res.usage.wallClockSec, 30)
+    self.assertEqual(set(res.toDict().keys()), set(['rc', 'limitExceeded', 'usage']))
+
+  def test_wallClockKillsTree(self):
+    with tempfile.TemporaryDirectory() as root:
+      # The grandchild would outlive a plain subprocess.run(..., timeout)
+      marker = os.path.join(root, 'marker')
+      cmd = ['sh', '-c', '(sleep 3; touch {}) & sleep 30'.format(marker)]
+      res = libLF.runLimited(cmd, libLF.ResourceLimits(wallClockSec=1))
+      self.assertEqual(res.limitExceeded, libLF.ResourceLimits.LIMIT_WALL_CLOCK)
+      self.assertLess(res.usage.wallClockSec, 10)
+      self.assertGreaterEqual(res.usage.maxProcs, 2)
+      time.sleep(3)
+      self.assertFalse(os.path.exists(marker))
+
+  def test_memory(self):
+    cmd = [sys.executable, '-c', 'import time; x = bytearray(200 * 1024 * 1024); time.sleep(30)']
+    res = libLF.runLimited(cmd, libLF.ResourceLimits(wallClockSec=20, memoryBytes=50 * 1024 * 1024))
+    self.assertEqual(res.limitExceeded, libLF.ResourceLimits.LIMIT_MEMORY)
+    self.assertGreater(res.usage.maxRSSBytes, 50 * 1024 * 1024)
+
+  def test_cpu(self):
+    res = libLF.runLimited([sys.executable, '-c', 'while True: pass'], libLF.ResourceLimits(wallClockSec=20, cpuSec=1))
+    self.assertEqual(res.limitExceeded, libLF.ResourceLimits.LIMIT_CPU)
+    self.assertGreater(res.usage.cpuSec, 1)
+
+  def test_procs(self):
+    res = libLF.runLimited(['sh', '-c', 'for i in 1 2 3 4 5 6; do sleep 30 & done; wait'], libLF.ResourceLimits(wallClockSec=20, maxProcs=3))
+    self.assertEqual(res.limitExceeded, libLF.ResourceLimits.LIMIT_PROCS)
+
+#####
+# Timing
+#####
+
+class StageTimingsTest(unittest.TestCase):
+  def test_stage(self):
+    timings = libLF.StageTimings()
+    with timings.stage('sleep'):
+      time.sleep(0.1)
+    with timings.stage('child'):
+      subprocess.run([sys.executable, '-c', 'sum(range(3000000))'])
+    try:
+      with timings.stage('fail'):
+        raise ValueError()
+    except ValueError:
+      pass
+
+    self.assertEqual([s['stage'] for s in timings.stages], ['sleep', 'child', 'fail'])
+    self.assertGreaterEqual(timings.wallSec('sleep'), 0.1)
+    self.assertLess(timings.stages[0]['cpuSec'], 0.1)
+    # Reaped children count
+    self.assertGreater(timings.stages[1]['cpuSec'], 0)
+    self.assertEqual([s['ok'] for s in timings.stages], [True, True, False])
+
+  def test_extendAndDict(self):
+    inner = libLF.StageTimings()
+    inner.add('untar', 1.5, 0.5)
+    outer = libLF.StageTimings()
+    outer.add('DYNAMIC', 2, 1)
+    outer.extend(libLF.StageTimings.fromDict(json.loads(json.dumps(inner.toDict()))), prefix='DYNAMIC/')
+    self.assertEqual([s['stage'] for s in outer.stages], ['DYNAMIC', 'DYNAMIC/untar'])
+    self.assertEqual(outer.wallSec('DYNAMIC/untar'), 1.5)
+
+  def test_percentile(self):
+    values = list(range(1, 101))
+    self.assertEqual(libLF.percentile(values, 50), 50)
+    self.assertEqual(libLF.percentile(values, 99), 99)
+    self.assertEqual(libLF.percentile(values, 100), 100)
+    self.assertEqual(libLF.percentile([7], 95), 7)
+
 ###########################################################
 
 if __name__ == '__main__':
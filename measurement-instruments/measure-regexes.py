@@ -15,7 +15,12 @@ import json
 import tempfile
 import argparse
 import traceback
-import subprocess
+import collections
+import contextlib
+import cProfile
+import glob
+import io
+import pstats
 from multiprocessing import Process, Queue
 
 # NFA measures
@@ -26,6 +31,8 @@ import time
 ### Globals
 
 # Logging / debugging
+# Per-regex messages are at DEBUG. See them with LF_LOG_LEVEL=measure-regexes=DEBUG
+_log = libLF.getLogger('measure-regexes')
 DELETE_TMP_FILES = False
 PRINT_SIMPLE_PATHS = False
 VISUALIZE_NFAS = False
@@ -45,13 +52,26 @@ AutomataCLI = os.path.join(os.environ['REGEX_GENERALIZABILITY_PROJECT_ROOT'], 'b
 if WINDOWS_OS:
     # Workaround for broken symlink
     AutomataCLI = os.path.join(os.environ['REGEX_GENERALIZABILITY_PROJECT_ROOT'], 'measurement-instruments', 'automata', 'AutomataCLI.exe')
-else:
-    libLF.checkShellDependencies([WINE_PATH], mustBeExecutable=True)
 
-libLF.checkShellDependencies([AutomataCLI], mustBeExecutable=False)
+def checkAutomataCLIDependencies():
+  """Only the automaton analysis needs AutomataCLI (and wine)"""
+  if not WINDOWS_OS:
+    libLF.checkShellDependencies([WINE_PATH], mustBeExecutable=True)
+  libLF.checkShellDependencies([AutomataCLI], mustBeExecutable=False)
+
+# Profiling (--profile). Each worker appends to its own files in the profile dir.
+PROFILE_STAGES_FILE = 'stages-{}.json' # pid
+PROFILE_REGEXES_FILE = 'regexes-{}.json' # pid
+PROFILE_CPROFILE_FILE = 'cprofile-{}.prof' # pid
+PROFILE_CPROFILE_MERGED_FILE = 'cprofile-merged.prof'
+PROFILE_REPORT_FILE = 'report.txt'
+PROFILE_PERCENTILES = [50, 95, 99]
+PROFILE_N_SLOWEST_REGEXES = 5
+PROFILE_N_CPROFILE_FUNCS = 40
 
 # Control analysis
 class AnalysisStages:
+  ANALYZE_FEATURES = 'features'
   ANALYZE_AUTOMATON = 'automaton'
   ANALYZE_SIMPLE_PATHS = 'simple paths'
   ANALYZE_WORST_CASE = 'worst case'
@@ -153,6 +173,64 @@ class RegexMetrics:
     }
     return obj
 
+##########
+# Profiling
+
+# This worker's cProfile.Profile, accumulated over the batches it runs
+_workerCProfiler = None
+
+class BatchProfile:
+  """Where the time goes in a MyTask, for --profile
+
+  Members:
+      enabled: bool
+        If False, times nothing. Cheap enough to leave in the hot paths.
+      stages: libLF.StageTimings
+        Each stage of the batch
+      regexTimings: [ { 'stage': str, 'pattern': str, 'wallSec': float } ]
+        Each regex in the stages whose cost is per-regex
+  """
+  def __init__(self, enabled=False):
+    self.enabled = enabled
+    self.stages = libLF.StageTimings()
+    self.regexTimings = []
+    self.startWall, self.startCPU = time.time(), libLF.cpuSec()
+
+  def stage(self, name):
+    """Time the body of the with statement as stage name"""
+    if not self.enabled:
+      return contextlib.nullcontext()
+    return self.stages.stage(name)
+
+  def regex(self, stage, pattern):
+    """Time the body of the with statement as pattern's share of stage"""
+    if not self.enabled:
+      return contextlib.nullcontext()
+    return self._timeRegex(stage, pattern)
+
+  @contextlib.contextmanager
+  def _timeRegex(self, stage, pattern):
+    start = time.time()
+    try:
+      yield
+    finally:
+      self.regexTimings.append({ 'stage': stage, 'pattern': pattern, 'wallSec': round(time.time() - start, 6) })
+
+  def dump(self, profileDir, nRegexes):
+    """Append this batch's timings to this worker's files in profileDir"""
+    batch = {
+      'pid': os.getpid(),
+      'nRegexes': nRegexes,
+      'wallSec': round(time.time() - self.startWall, 6),
+      'cpuSec': round(libLF.cpuSec() - self.startCPU, 6),
+      'stages': self.stages.stages,
+    }
+    with open(os.path.join(profileDir, PROFILE_STAGES_FILE.format(os.getpid())), 'a') as outStream:
+      outStream.write(json.dumps(batch) + '\n')
+    with open(os.path.join(profileDir, PROFILE_REGEXES_FILE.format(os.getpid())), 'a') as outStream:
+      for rt in self.regexTimings:
+        outStream.write(json.dumps(rt) + '\n')
+
 ##########
 # Parallelization
 
@@ -163,34 +241,64 @@ class MyTask(libLF.parallel.ParallelTask):
   the automata analysis depends on a C# CLI that performs a lot better
   if we give it a batch of regexes (fork+exec+wine = $).
   """
-  def __init__(self, regexList, analyses):
+  def __init__(self, regexList, analyses, profileDir=None, useCProfile=False):
     self.regexList = regexList
     self.analyses = analyses
+    self.profileDir = profileDir
+    self.useCProfile = useCProfile
+    self.profile = BatchProfile()
   
   # Returns RegexMetrics[]
   def run(self):
+    if self.profileDir is None:
+      return self._measure()
+
+    global _workerCProfiler
+    self.profile = BatchProfile(enabled=True)
+    if self.useCProfile:
+      if _workerCProfiler is None:
+        _workerCProfiler = cProfile.Profile()
+      _workerCProfiler.enable()
+    try:
+      return self._measure()
+    finally:
+      if self.useCProfile:
+        _workerCProfiler.disable()
+        _workerCProfiler.dump_stats(os.path.join(self.profileDir, PROFILE_CPROFILE_FILE.format(os.getpid())))
+      self.profile.dump(self.profileDir, len(self.regexList))
+
+  def _measure(self):
     try:
       # Obtain C# patterns
-      libLF.log("Generating C# patterns")
+      _log.debug("Generating C# patterns")
       # Replace u flag with i for compatibility with C# and to preserve the
       # presence or absence of flags.
-      csharpPatterns = [
-        libLF.RegexTranslator.translateRegex(regex.pattern, "", "C#", altUnicodeFlag='i')
-        for regex in self.regexList
-      ]
+      csharpPatterns = []
+      with self.profile.stage('translate'):
+        for regex in self.regexList:
+          with self.profile.regex('translate', regex.pattern):
+            csharpPatterns.append(libLF.RegexTranslator.translateRegex(regex.pattern, "", "C#", altUnicodeFlag='i'))
 
       for r, c in zip(self.regexList, csharpPatterns):
-        libLF.log("MyTask: /{}/ -> /{}/".format(r.pattern, c))
+        _log.debug("MyTask: /{}/ -> /{}/", r.pattern, c)
 
       # Run the analyses
+      if AnalysisStages.ANALYZE_FEATURES in self.analyses:
+        _log.debug("ANALYZE_FEATURES")
+        with self.profile.stage('features'):
+          nativeFeatureVectors = self.countFeatures()
+      else:
+        nativeFeatureVectors = [ None for i in range(len(self.regexList)) ]
+
       if AnalysisStages.ANALYZE_AUTOMATON in self.analyses:
-        libLF.log("ANALYZE_AUTOMATON")
-        automataMeasures = self.runAutomataCLI(csharpPatterns)
+        _log.debug("ANALYZE_AUTOMATON")
+        automataMeasures = self.runAutomataCLIOnTranslatable(csharpPatterns)
         if len(automataMeasures) and AnalysisStages.ANALYZE_SIMPLE_PATHS in self.analyses:
-          libLF.log("ANALYZE_SIMPLE_PATHS")
-          nSimplePathsList, averageOutDegreeDensityList = self.computeGraphMetrics(automataMeasures)
+          _log.debug("ANALYZE_SIMPLE_PATHS")
+          with self.profile.stage('graphMetrics'):
+            nSimplePathsList, averageOutDegreeDensityList = self.computeGraphMetrics(automataMeasures)
         else:
-          libLF.log("{} automataMeasures, analyses {} -- skipping computeGraphMetrics".format(len(automataMeasures), self.analyses))
+          _log.debug("{} automataMeasures, analyses {} -- skipping computeGraphMetrics", len(automataMeasures), self.analyses)
           nSimplePathsList = [ -1 for i in range(len(self.regexList)) ]
           averageOutDegreeDensityList = [ -1 for i in range(len(self.regexList)) ]
       else:
@@ -199,27 +307,28 @@ class MyTask(libLF.parallel.ParallelTask):
         averageOutDegreeDensityList = [ -1 for i in range(len(self.regexList)) ]
 
       if AnalysisStages.ANALYZE_WORST_CASE in self.analyses:
-        libLF.log("ANALYZE_WORST_CASE")
+        _log.debug("ANALYZE_WORST_CASE")
         # Perform worst-case analysis on the C#-translated regexes
         regexes_csharp = [
           libLF.Regex().initFromRaw(csharpPattern, {}, {})
           for csharpPattern in csharpPatterns 
         ]
-        worstCaseSpencerList = self.predictWorstCaseSpencerPerformance(regexes_csharp)
+        with self.profile.stage('worstCase'):
+          worstCaseSpencerList = self.predictWorstCaseSpencerPerformance(regexes_csharp)
       else:
         worstCaseSpencerList = [ libLF.SLRegexDetectorOpinion.PRED_COMPLEXITY_UNKNOWN for i in range(len(self.regexList)) ]
       
-      libLF.log("Asserting lengths")
+      _log.debug("Asserting lengths")
       assert(len(self.regexList) == len(csharpPatterns))
       assert(len(self.regexList) == len(automataMeasures))
       assert(len(self.regexList) == len(nSimplePathsList))
       assert(len(self.regexList) == len(worstCaseSpencerList))
 
       # Prep and return RegexMetrics[]
-      libLF.log("Prepping regexMetricsList")
+      _log.debug("Prepping regexMetricsList")
       regexMetricsList = []
-      for regex, csharpPattern, autMeasure, nSimplePaths, averageOutDegreeDensity, worstCaseSpencer in zip(
-        self.regexList, csharpPatterns, automataMeasures, nSimplePathsList, averageOutDegreeDensityList, worstCaseSpencerList):
+      for regex, csharpPattern, nativeFeatureVector, autMeasure, nSimplePaths, averageOutDegreeDensity, worstCaseSpencer in zip(
+        self.regexList, csharpPatterns, nativeFeatureVectors, automataMeasures, nSimplePathsList, averageOutDegreeDensityList, worstCaseSpencerList):
         # Prep members for a RegexMetrics
         csharpRegexLen = len(csharpPattern)
         if AnalysisStages.ANALYZE_AUTOMATON in self.analyses:
@@ -233,10 +342,18 @@ class MyTask(libLF.parallel.ParallelTask):
 
           if AnalysisStages.ANALYZE_SIMPLE_PATHS not in self.analyses:
             nSimplePaths = -1
+        elif AnalysisStages.ANALYZE_FEATURES in self.analyses:
+          validInCSharp = libLF.canTranslateRegexToCSharp(regex.pattern, "")
+          featureVector = {}
+          automatonMetrics = {}
         else:
           validInCSharp = False
           featureVector = {}
           automatonMetrics = {}
+
+        # Prefer the in-process feature counts when we have them
+        if nativeFeatureVector is not None:
+          featureVector = nativeFeatureVector
         
         # Misc metrics
         nDistinctFeaturesUsed = 0
@@ -259,17 +376,34 @@ class MyTask(libLF.parallel.ParallelTask):
           worstCaseSpencer, averageOutDegreeDensity, usesSuperLinearFeatures
         )
         regexMetricsList.append(regexMetrics)
-      libLF.log("Returning regexMetricsList")
+      _log.debug("Returning regexMetricsList")
       return regexMetricsList
     except BaseException as e:
-      libLF.log("Uh oh, hit an exception")
-      libLF.log(e)
+      _log.error("Uh oh, hit an exception")
+      _log.error(e)
       traceback.print_exc()
       return self.regexList
 
   ##########
   # Analysis
 
+  def countFeatures(self):
+    """Count the regex features in-process
+
+    Returns:
+      featureVector[]: { 'FEATURE': COUNT, ... } for each regex in self.regexList,
+        or None if the regex could not be parsed
+    """
+    featureVectors = []
+    for regex in self.regexList:
+      with self.profile.regex('features', regex.pattern):
+        try:
+          featureVectors.append(libLF.countRegexFeatures(regex.pattern, ""))
+        except libLF.RegexParseError as err:
+          _log.debug("countFeatures: {}", err)
+          featureVectors.append(None)
+    return featureVectors
+
   def _automataCLI_prepQueryFile(self, queryFile, csharpPatterns):
     queries = [ { 'pattern': pattern }
                 for pattern in csharpPatterns
@@ -285,11 +419,12 @@ class MyTask(libLF.parallel.ParallelTask):
       else:
         cmd = [WINE_PATH, AutomataCLI, queryFile.name]
       libLF.log("CMD: {} > {} 2>{}".format(' '.join(cmd), outFile.name, errFile.name))
-      completedProcess = subprocess.run(cmd, stdout=outFile, stderr=errFile, timeout=AUTOMATACLI_TIMEOUT_SEC)
-      rc = completedProcess.returncode
-    except subprocess.TimeoutExpired:
-      libLF.log("automataCLI timed out")
-      rc = 1
+      res = libLF.runLimited(cmd, libLF.ResourceLimits(wallClockSec=AUTOMATACLI_TIMEOUT_SEC), stdout=outFile, stderr=errFile)
+      libLF.log("automataCLI: {}".format(res.toDict()))
+      rc = res.rc
+      if res.limitExceeded is not None:
+        libLF.log("automataCLI timed out")
+        rc = 1
     except Exception as e:
       libLF.log("automataCLI: non-timeout exception")
       libLF.log(e)
@@ -302,7 +437,7 @@ class MyTask(libLF.parallel.ParallelTask):
     for i, line in enumerate(resultFile):
       # Extract the metrics from the AutomataCLI measurements
       line = line.strip()
-      libLF.log("Results for regex {} ( /{}/ ): {}".format(i, csharpPatterns[i], line))
+      _log.debug("Results for regex {} ( /{}/ ): {}", i, csharpPatterns[i], line)
       try:
         automataCLI_res = json.loads(line)
       except:
@@ -334,6 +469,39 @@ class MyTask(libLF.parallel.ParallelTask):
 
     return automataMetricsList
   
+  def runAutomataCLIOnTranslatable(self, csharpPatterns):
+    """Run AutomataCLI.exe on the regexes that have a C# equivalent
+
+    Regexes that are malformed or use features C# lacks (recursion, \\K, ...) would only be rejected
+    by AutomataCLI, so don't spend a wine process on them.
+    They are not validInCSharp, as in the ANALYZE_FEATURES-only mode.
+
+    Returns:
+      automateMeasures[]: as for runAutomataCLI, in the order of self.regexList
+    """
+    with self.profile.stage('automataCLI-canTranslate'):
+      translatable = [
+        libLF.canTranslateRegexToCSharp(regex.pattern, "")
+        for regex in self.regexList
+      ]
+    libLF.log("{}/{} regexes are translatable to C#".format(sum(translatable), len(translatable)))
+
+    patternsToMeasure = [ p for p, t in zip(csharpPatterns, translatable) if t ]
+    if patternsToMeasure:
+      measured = iter(self.runAutomataCLI(patternsToMeasure))
+    else:
+      measured = iter([])
+
+    automataMeasures = []
+    for csharpPattern, t in zip(csharpPatterns, translatable):
+      if t:
+        automataMeasures.append(next(measured))
+      else:
+        automataMeasures.append( { 'len': len(csharpPattern),
+                                   'validCSharpRegex': False }
+                               )
+    return automataMeasures
+
   def runAutomataCLI(self, csharpPatterns):
     """Run AutomataCLI.exe for these csharpPatterns
 
@@ -365,7 +533,8 @@ class MyTask(libLF.parallel.ParallelTask):
       libLF.log("queryFile {} outFile {} errFile {}".format(queryFile.name, outFile.name, errFile.name))
       self._automataCLI_prepQueryFile(queryFile, csharpPatterns)
       queryFile.close() # Free file for Windows
-      rc = self._automataCLI_runQuery(queryFile, outFile, errFile)
+      with self.profile.stage('automataCLI-run'):
+        rc = self._automataCLI_runQuery(queryFile, outFile, errFile)
 
       if rc != 0:
         libLF.log("automataCLI returned {} -- check queryFile {} errFile {}".format(rc, queryFile.name, errFile.name))
@@ -382,16 +551,18 @@ class MyTask(libLF.parallel.ParallelTask):
       #   Some encoding errors, not sure what's happening here.
       #   Just replace them with "?" hehe.
       # NB: Pydoc says re-opening works on UNIX, though not on Windows.
-      with open(outFile.name, 'r', encoding='utf-8', errors='replace') as automataCLIOutFile:
+      with open(outFile.name, 'r', encoding='utf-8', errors='replace') as automataCLIOutFile, \
+          self.profile.stage('automataCLI-parse'):
         automataMeasuresList = self._automataCLI_processResultStream(csharpPatterns, automataCLIOutFile)
       return automataMeasuresList
 
   def getNSimplePaths(self, sources, targets, graph):
     """Returns the simple path lengths for this graph"""
     nSimplePaths = 0
-    libLF.log("Computing simple paths for automaton with {} sources, {} targets, {} nodes, {} edges" \
-      .format(len(sources), len(targets),
-        networkx.number_of_nodes(graph), networkx.number_of_edges(graph)))
+    if _log.isEnabledFor(libLF.LOG_DEBUG):
+      _log.debug("Computing simple paths for automaton with {} sources, {} targets, {} nodes, {} edges",
+        len(sources), len(targets),
+        networkx.number_of_nodes(graph), networkx.number_of_edges(graph))
 
     # Find up to SIMPLE_PATH_COUNT_LIMIT simple paths and their lengths.
     # In extreme situations, we are content simply to know there are many paths.
@@ -401,7 +572,7 @@ class MyTask(libLF.parallel.ParallelTask):
     for source in sources:
       # Are we done early?
       if bailout:
-        libLF.log("bailing out")
+        _log.debug("bailing out")
         break
 
       # Look for S -> T paths
@@ -413,12 +584,12 @@ class MyTask(libLF.parallel.ParallelTask):
         for path in networkx.shortest_simple_paths(graph, source, target):
           count += 1
           if LIMIT_SIMPLE_PATHS and SIMPLE_PATH_COUNT_LIMIT < count:
-            libLF.log('simple path limit reached')
+            _log.debug('simple path limit reached')
             bailout = True
             break
 
           if LIMIT_SIMPLE_PATHS and time.time() > timeout:
-            libLF.log('simple path timeout reached')
+            _log.debug('simple path timeout reached')
             bailout = True
             break
 
@@ -510,53 +681,55 @@ class MyTask(libLF.parallel.ParallelTask):
     """
     nSimplePathsList = []
     avgOutDegreeDensityList = []
-    for i, autMeas in enumerate(automataMeasures):
-      libLF.log("Simple paths for autom {}/{}".format(i+1, len(automataMeasures)))
+    for i, (regex, autMeas) in enumerate(zip(self.regexList, automataMeasures)):
+      _log.debug("Simple paths for autom {}/{}", i+1, len(automataMeasures))
       nSimplePaths = -1
       avgOutDegreeDensity = -1
       if 'efreeNFAGraph' in autMeas and autMeas['efreeNFAGraph'] is not None and autMeas['efreeNFAGraph'] != "TIMEOUT":
-        try:
-          # Build graph
-          sources, targets, graph = self.graphStrToDiGraph(autMeas['efreeNFAGraph'])
-
-          # Compute simple paths
+        with self.profile.regex('graphMetrics', regex.pattern):
           try:
-            nSimplePaths = self.getNSimplePaths(sources, targets, graph)
-            if nSimplePaths:
-              libLF.log("{} simple paths".format(nSimplePaths))
-          except:
-            nSimplePaths = -1
-          
-          # Compute average outdegree density
-          avgOutDegreeDensity = self.getAvgOutDegreeDensity(graph)
-          libLF.log("avg outdegree density {}".format(avgOutDegreeDensity))
-        except BaseException as e:
-          libLF.log("Exception obtaining graph metrics: {}".format(e))
-          traceback.print_exc()
+            # Build graph
+            sources, targets, graph = self.graphStrToDiGraph(autMeas['efreeNFAGraph'])
+
+            # Compute simple paths
+            try:
+              nSimplePaths = self.getNSimplePaths(sources, targets, graph)
+              if nSimplePaths:
+                _log.debug("{} simple paths", nSimplePaths)
+            except:
+              nSimplePaths = -1
+            
+            # Compute average outdegree density
+            avgOutDegreeDensity = self.getAvgOutDegreeDensity(graph)
+            _log.debug("avg outdegree density {}", avgOutDegreeDensity)
+          except BaseException as e:
+            _log.error("Exception obtaining graph metrics: {}", e)
+            traceback.print_exc()
       # Keep whatever we computed
       nSimplePathsList.append(nSimplePaths)
       avgOutDegreeDensityList.append(avgOutDegreeDensity)
 
-    libLF.log("Done computing graph metricspaths")
+    _log.debug("Done computing graph metricspaths")
     return nSimplePathsList, avgOutDegreeDensityList
 
   def predictWorstCaseSpencerPerformance(self, regexList):
     """Return predicted worst case performances for these regexes
 
     Args:
-      regexList: libLF.Regex[]
+      regexList: libLF.Regex[], corresponding to self.regexList
     Returns:
       libLF.SLRegexDetectorOpinion.PREDICTED_COMPLEXITY_X[]
     """
     predictedPerformanceList = []
-    for regex in regexList:
-      slra = libLF.SLRegexAnalysis(regex)
-      slra.queryDetectors(detectors=["weideman-RegexStaticAnalysis"], patternVariants=["leftanchor"])
-      predictedPerformance = slra.getWorstCasePredictedSpencerPerformanceFromStaticOnly()
+    for origRegex, regex in zip(self.regexList, regexList):
+      with self.profile.regex('worstCase', origRegex.pattern):
+        slra = libLF.SLRegexAnalysis(regex)
+        slra.queryDetectors(detectors=["weideman-RegexStaticAnalysis"], patternVariants=["leftanchor"])
+        predictedPerformance = slra.getWorstCasePredictedSpencerPerformanceFromStaticOnly()
       predictedPerformanceList.append(predictedPerformance)
     return predictedPerformanceList
 
-def getTasks(regexFile, setStaticToAll, langs, parallelism, analyses):
+def getTasks(regexFile, setStaticToAll, langs, parallelism, analyses, profileDir=None, useCProfile=False):
   regexes = loadRegexFile(regexFile, setStaticToAll)
 
   if langs:
@@ -578,10 +751,106 @@ def getTasks(regexFile, setStaticToAll, langs, parallelism, analyses):
     regexes[i:i+AUTOMATACLI_BATCH_SIZE]
     for i in range(0, len(regexes), AUTOMATACLI_BATCH_SIZE)
   ]
-  tasks = [MyTask(rl, analyses) for rl in regexLists]
+  tasks = [MyTask(rl, analyses, profileDir, useCProfile) for rl in regexLists]
   libLF.log('Prepared {} tasks for {} regexes'.format(len(tasks), len(regexes)))
   return tasks
 
+################
+# Profile report
+
+def prepProfileDir(profileDir):
+  """Create profileDir, clearing the files of any earlier run"""
+  os.makedirs(profileDir, exist_ok=True)
+  for pattern in [PROFILE_STAGES_FILE, PROFILE_REGEXES_FILE, PROFILE_CPROFILE_FILE]:
+    for f in glob.glob(os.path.join(profileDir, pattern.format('*'))):
+      os.remove(f)
+
+def _loadNDJSON(files):
+  objs = []
+  for f in files:
+    with open(f, 'r') as inStream:
+      for line in inStream:
+        line = line.strip()
+        if len(line):
+          objs.append(json.loads(line))
+  return objs
+
+def _formatTable(rows):
+  widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+  return [ '  '.join(cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths)))
+           for row in rows ]
+
+def reportProfile(profileDir):
+  """Merge the workers' profiles in profileDir into one report
+
+  Returns the lines of the report, which we also save in profileDir
+  """
+  lines = []
+  pCols = ['p{}'.format(p) for p in PROFILE_PERCENTILES]
+
+  # Per-batch stages
+  batches = _loadNDJSON(glob.glob(os.path.join(profileDir, PROFILE_STAGES_FILE.format('*'))))
+  totalWallSec = sum(b['wallSec'] for b in batches)
+  totalCPUSec = sum(b['cpuSec'] for b in batches)
+  lines.append('{} batches, {} regexes: {:.1f}s wall, {:.1f}s CPU in the workers'.format(
+    len(batches), sum(b['nRegexes'] for b in batches), totalWallSec, totalCPUSec))
+  stage2times = collections.OrderedDict()
+  for b in batches:
+    for st in b['stages']:
+      times = stage2times.setdefault(st['stage'], { 'wallSec': [], 'cpuSec': [], 'nFailed': 0 })
+      times['wallSec'].append(st['wallSec'])
+      times['cpuSec'].append(st['cpuSec'])
+      if not st['ok']:
+        times['nFailed'] += 1
+  rows = [['stage', 'batches', 'failed', 'totalWall', '%wall', 'totalCPU'] + ['wall-' + c for c in pCols]]
+  for stage, times in sorted(stage2times.items(), key=lambda kv: sum(kv[1]['wallSec']), reverse=True):
+    sortedWall = sorted(times['wallSec'])
+    rows.append([stage, str(len(sortedWall)), str(times['nFailed']),
+                 '{:.3f}'.format(sum(sortedWall)), '{:.1f}'.format(100 * sum(sortedWall) / totalWallSec if totalWallSec else 0),
+                 '{:.3f}'.format(sum(times['cpuSec']))] +
+                ['{:.3f}'.format(libLF.percentile(sortedWall, p)) for p in PROFILE_PERCENTILES])
+  lines.append('')
+  lines.append('Per-batch stages (seconds):')
+  lines += _formatTable(rows)
+
+  # Per-regex stages
+  stage2regexTimings = collections.OrderedDict()
+  for rt in _loadNDJSON(glob.glob(os.path.join(profileDir, PROFILE_REGEXES_FILE.format('*')))):
+    stage2regexTimings.setdefault(rt['stage'], []).append(rt)
+  if stage2regexTimings:
+    rows = [['stage', 'regexes', 'totalWall'] + ['wall-' + c for c in pCols] + ['max']]
+    slowest = []
+    for stage, regexTimings in stage2regexTimings.items():
+      regexTimings.sort(key=lambda rt: rt['wallSec'])
+      sortedWall = [rt['wallSec'] for rt in regexTimings]
+      rows.append([stage, str(len(sortedWall)), '{:.3f}'.format(sum(sortedWall))] +
+                  ['{:.4f}'.format(libLF.percentile(sortedWall, p)) for p in PROFILE_PERCENTILES] +
+                  ['{:.4f}'.format(sortedWall[-1])])
+      slowest.append('  {}:'.format(stage))
+      for rt in reversed(regexTimings[-PROFILE_N_SLOWEST_REGEXES:]):
+        slowest.append('    {:.4f}s /{}/'.format(rt['wallSec'], rt['pattern']))
+    lines.append('')
+    lines.append('Per-regex stages (seconds):')
+    lines += _formatTable(rows)
+    lines.append('')
+    lines.append('Slowest regexes:')
+    lines += slowest
+
+  # cProfile
+  cProfileFiles = glob.glob(os.path.join(profileDir, PROFILE_CPROFILE_FILE.format('*')))
+  if cProfileFiles:
+    statsStream = io.StringIO()
+    stats = pstats.Stats(*cProfileFiles, stream=statsStream)
+    stats.dump_stats(os.path.join(profileDir, PROFILE_CPROFILE_MERGED_FILE))
+    stats.sort_stats('cumulative').print_stats(PROFILE_N_CPROFILE_FUNCS)
+    lines.append('')
+    lines.append('cProfile, merged over {} workers (also in {}):'.format(len(cProfileFiles), PROFILE_CPROFILE_MERGED_FILE))
+    lines += statsStream.getvalue().rstrip().split('\n')
+
+  with open(os.path.join(profileDir, PROFILE_REPORT_FILE), 'w') as outStream:
+    outStream.write('\n'.join(lines) + '\n')
+  return lines
+
 ################
 # I/O
 
@@ -647,14 +916,19 @@ def regexUsedInLangs(regex, langs):
 #libLF.log("Done")
 #sys.exit(1)
 
-def main(regexFile, setStaticToAll, analyses, langs, outFile, parallelism):
-  libLF.log('regexFile {} setStaticToAll {} analyses {} langs {} outFile {} parallelism {}' \
-    .format(regexFile, setStaticToAll, analyses, langs, outFile, parallelism))
+def main(regexFile, setStaticToAll, analyses, langs, outFile, parallelism, profileDir, useCProfile):
+  libLF.log('regexFile {} setStaticToAll {} analyses {} langs {} outFile {} parallelism {} profileDir {} useCProfile {}' \
+    .format(regexFile, setStaticToAll, analyses, langs, outFile, parallelism, profileDir, useCProfile))
+
+  if AnalysisStages.ANALYZE_AUTOMATON in analyses:
+    checkAutomataCLIDependencies()
+  if profileDir is not None:
+    prepProfileDir(profileDir)
 
   #### Load data
   libLF.log('\n\n-----------------------')
   libLF.log('Loading regexes from {}'.format(regexFile))
-  tasks = getTasks(regexFile, setStaticToAll, langs, parallelism, analyses)
+  tasks = getTasks(regexFile, setStaticToAll, langs, parallelism, analyses, profileDir, useCProfile)
   nRegexes = 0
   for t in tasks:
     nRegexes += len(t.regexList)
@@ -689,6 +963,12 @@ def main(regexFile, setStaticToAll, analyses, langs, outFile, parallelism):
       '%.2f' % (100 * nSuccesses / nRegexes)
       ))
 
+  if profileDir is not None:
+    libLF.log('\n\n-----------------------')
+    libLF.log('Profile (also in {}):'.format(os.path.join(profileDir, PROFILE_REPORT_FILE)))
+    for line in reportProfile(profileDir):
+      libLF.log(line)
+
   #### Filter
 #  if langs:
 #    regexes = [r for r in regexes if regexUsedInLangs(r, langs)]
@@ -724,6 +1004,8 @@ if __name__ == "__main__":
     dest='regexFile')
   parser.add_argument('--set-static-to-all', help='Set static languages to all languages. Useful if using the LF dataset, all of whose regexes are static. Otherwise you should not need this', required=False, action='store_true', default=False,
     dest='setStaticToAll')
+  parser.add_argument('--analyze-features', help='Count the regex features in-process. Does not require AutomataCLI, and takes precedence over the features reported by --analyze-automaton', required=False, action='store_true', default=False,
+    dest='analyzeFeatures')
   parser.add_argument('--analyze-automaton', help='Analyze the regex features and automaton', required=False, action='store_true', default=False,
     dest='analyzeAutomaton')
   parser.add_argument('--analyze-simple-paths', help='Analyze the simple paths of the automaton. Requires --analyze-automaton. Stops counting after {} paths or {} seconds'.format(SIMPLE_PATH_COUNT_LIMIT, SIMPLE_PATH_TIME_LIMIT), required=False, action='store_true', default=False,
@@ -736,9 +1018,19 @@ if __name__ == "__main__":
     dest='outFile')
   parser.add_argument('--parallelism', type=int, help='Maximum cores to use', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
     dest='parallelism')
+  parser.add_argument('--profile', type=str, help='Out: Record where the time goes -- wall and CPU time of each stage of each batch, and of each regex in the per-regex stages -- in this dir, and report it at the end', required=False, default=None,
+    dest='profileDir')
+  parser.add_argument('--cprofile', help='Also run each worker under cProfile, merging their profiles into the report. Requires --profile. Slows down the Python stages', required=False, action='store_true', default=False,
+    dest='useCProfile')
   args = parser.parse_args()
 
+  if args.useCProfile and args.profileDir is None:
+    libLF.log("Error, --cprofile requires --profile")
+    sys.exit(1)
+
   analyses = []
+  if args.analyzeFeatures:
+    analyses.append(AnalysisStages.ANALYZE_FEATURES)
   if args.analyzeAutomaton:
     analyses.append(AnalysisStages.ANALYZE_AUTOMATON)
   if args.analyzeSimplePaths:
@@ -751,4 +1043,4 @@ if __name__ == "__main__":
     sys.exit(1)
 
   # Here we go!
-  main(args.regexFile, args.setStaticToAll, analyses, args.langs, args.outFile, args.parallelism)
+  main(args.regexFile, args.setStaticToAll, analyses, args.langs, args.outFile, args.parallelism, args.profileDir, args.useCProfile)